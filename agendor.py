@@ -0,0 +1,137 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+from processing import ColumnBuilder
+
+API_KEY = os.environ.get('AGENDOR_API_KEY', '881078-ec5446d8-7fbd-4fac-806d-8a4d81eece36')
+URL = os.environ.get('AGENDOR_URL', "https://api.agendor.com.br/v3/deals")
+
+# Parâmetros do crawler (podem ser ajustados por variável de ambiente)
+FETCH_WORKERS = int(os.environ.get('AGENDOR_WORKERS', 4))
+PAGE_SIZE = int(os.environ.get('AGENDOR_PAGE_SIZE', 100))
+MAX_RETRIES = int(os.environ.get('AGENDOR_MAX_RETRIES', 5))
+BACKOFF_FACTOR = float(os.environ.get('AGENDOR_BACKOFF', 0.5))
+REQUEST_TIMEOUT = float(os.environ.get('AGENDOR_TIMEOUT', 30))
+
+# Filtro da API para buscar apenas deals alterados após uma data (sincronização incremental)
+UPDATED_SINCE_PARAM = os.environ.get('AGENDOR_UPDATED_SINCE_PARAM', 'updatedDateGt')
+
+PAGE_SECONDS = metrics.histogram('agendor_page_seconds', 'Duração de cada página da API do Agendor (com retries).')
+PAGES = metrics.counter('agendor_pages_total', 'Páginas buscadas na API do Agendor.', ['result'])
+DEALS = metrics.counter('agendor_deals_total', 'Deals recebidos da API do Agendor.')
+CRAWL_SECONDS = metrics.histogram('agendor_crawl_seconds', 'Duração de cada busca completa na API do Agendor.')
+
+headers = {
+    "Authorization": f"Token {API_KEY}",
+    "Content-Type": "application/json"
+}
+
+
+def make_session(workers=FETCH_WORKERS):
+    """Cria uma sessão com pool de conexões e retry com backoff (inclui 429/Retry-After)."""
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({'GET'}),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1), max_retries=retry)
+
+    session = requests.Session()
+    session.headers.update(headers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _get_page(session, url, query):
+    # Uma requisição de página, medida (duração, resultado e deals recebidos)
+    started = time.perf_counter()
+    try:
+        response = session.get(url, params=query, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        payload = response.json()
+    except Exception:
+        PAGES.inc(result='error')
+        raise
+    finally:
+        PAGE_SECONDS.observe(time.perf_counter() - started)
+    PAGES.inc(result='ok')
+    DEALS.inc(len(payload.get('data', [])))
+    return payload
+
+
+def fetch_page(session, page, per_page=PAGE_SIZE, url=URL, params=None):
+    """Busca uma única página e retorna (deals, link da próxima página)."""
+    payload = _get_page(session, url, dict(params or {}, page=page, per_page=per_page))
+    return payload.get('data', []), payload.get('links', {}).get('next')
+
+
+def _iter_sequential(session, per_page, url, params):
+    # Segue os links 'next' um a um, como a versão original
+    next_url = url
+    query = dict(params or {}, per_page=per_page)
+
+    while next_url:
+        payload = _get_page(session, next_url, query)
+        yield payload.get('data', [])
+        next_url = payload.get('links', {}).get('next', False)
+
+
+def _iter_concurrent(session, workers, per_page, url, params):
+    # Mantém até `workers` páginas em voo e entrega os resultados na ordem das páginas,
+    # parando na primeira página sem link 'next' (as páginas excedentes são descartadas)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        next_page = 1
+
+        def submit():
+            nonlocal next_page
+            in_flight[next_page] = pool.submit(fetch_page, session, next_page, per_page, url, params)
+            next_page += 1
+
+        for _ in range(workers):
+            submit()
+
+        current = 1
+        try:
+            while True:
+                data, next_link = in_flight.pop(current).result()
+                yield data
+                if not next_link or not data:
+                    break
+                submit()
+                current += 1
+        finally:
+            for future in in_flight.values():
+                future.cancel()
+
+
+def iter_pages(workers=FETCH_WORKERS, per_page=PAGE_SIZE, url=URL, params=None):
+    """Gera as páginas de deals (listas de dicts) na ordem da API, uma por vez.
+
+    Quem consome pode converter e descartar cada página antes da próxima chegar; só
+    as páginas em voo (até `workers`) ficam em memória ao mesmo tempo.
+    """
+    with make_session(workers) as session, CRAWL_SECONDS.time():
+        if workers <= 1:
+            yield from _iter_sequential(session, per_page, url, params)
+        else:
+            yield from _iter_concurrent(session, workers, per_page, url, params)
+
+
+# Função para realizar o scraping
+def fetch_data(workers=FETCH_WORKERS, per_page=PAGE_SIZE, url=URL, params=None):
+    return [deal for page in iter_pages(workers, per_page, url, params) for deal in page]
+
+
+def fetch_columns(workers=FETCH_WORKERS, per_page=PAGE_SIZE, url=URL, params=None):
+    """Como `fetch_data`, mas já nas colunas tipadas: cada página é achatada e descartada ao chegar."""
+    return ColumnBuilder().extend(iter_pages(workers, per_page, url, params)).build()
@@ -1,387 +1,583 @@
 import dash
-from dash import Dash, html, dcc, Input, Output, State, dash_table
+from dash import ClientsideFunction, Dash, html, dcc, Input, Output, State, dash_table
+from flask import Response, jsonify, request, stream_with_context
 import pandas as pd
-import requests
+import hmac
+import json
 import os
+import tempfile
 from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
 
-API_KEY = '881078-ec5446d8-7fbd-4fac-806d-8a4d81eece36'
-URL = "https://api.agendor.com.br/v3/deals"
-
-headers = {
-    "Authorization": f"Token {API_KEY}",
-    "Content-Type": "application/json"
-}
-
-# Função para realizar o scraping
-def fetch_data():
-    next_url = URL
-    params = {"per_page": 100}
-    all_json_deals_data = []
-
-    while next_url:
-        response = requests.get(next_url, headers=headers, params=params)
-        json_deal_data = response.json().get('data', [])
-        all_json_deals_data.extend(json_deal_data)
-        links = response.json().get('links', {})
-        next_url = links.get('next', False)
-
-    return all_json_deals_data
-
-# Função para processar os dados
-def process_data(deals, filter_by_status='Em andamento'):
-    deal_by_stage = {
-        'stage_detail': [], 'stage_name': [], 'stage_number': [], 'stage_status': [],
-        'person': [], 'title': [], 'date_created': [], 'date_lost': [], 'date_won': [],
-        'organization': [], 'description': [], 'loss_reason': []
-    }
-
-    for deal in deals:
-        deal_by_stage['stage_detail'].append(deal['dealStage']['name'])
-        deal_by_stage['stage_number'].append(int(deal['dealStage']['sequence']))
-        deal_by_stage['stage_name'].append(deal['dealStage']['funnel']['name'])
-        deal_by_stage['stage_status'].append(deal['dealStatus']['name'])
-        if deal['lossReason']:
-            deal_by_stage['loss_reason'].append(deal['lossReason']['name'])
-        else:
-            deal_by_stage['loss_reason'].append(None)
-        
-        if deal['person']:
-            deal_by_stage['person'].append(deal.get('person', {}).get('id'))
-        else:
-            deal_by_stage['person'].append(None)
-        if deal['organization']:
-            deal_by_stage['organization'].append(deal.get('organization', {}).get('id'))
-        else: 
-            deal_by_stage['organization'].append(None)
-        deal_by_stage['date_created'].append(deal['createdAt'])
-        deal_by_stage['date_won'].append(deal['wonAt'])
-        deal_by_stage['date_lost'].append(deal['lostAt'])
-        deal_by_stage['title'].append(deal['title'])
-        deal_by_stage['description'].append(deal['description'])
-
-    df = pd.DataFrame(deal_by_stage)
-    # Supondo que df já esteja carregado
-    # Criar as colunas 'id' e 'type'
-    df['id'] = df['person'].fillna(df['organization'])
-    df['type'] = df['person'].apply(lambda x: 'person' if pd.notna(x) else 'organization')
-    
-    
-
-    # Remover as colunas 'person' e 'organization'
-    df = df.drop(columns=['person', 'organization'])
-
-    df['stage_name'] = df['stage_name'].str.replace(r'^\d+\s*', '', regex=True)
-
-    # Filtragem por data
-    df['date_created'] = pd.to_datetime(df['date_created']).dt.date
-    df['date_won'] = pd.to_datetime(df['date_won']).dt.date
-    df['date_lost'] = pd.to_datetime(df['date_lost']).dt.date
-    
-    if filter_by_status:
-        df = df[df['stage_status'] == 'Em andamento']
-    
-    return df
-    
-
-def process_line_data(df):
-    df = df.copy()
-    
-    # Transformação da coluna 'stage_detail'
-    df['stage_detail'] = df['stage_detail'].replace({
-        'CONTATO': '1.1 LEADS',
-        'TYPEFORM': '2.1 VALIDAÇÃO',
-        'CONTRATO': '3.1 ATIVOS'
-    })
-    
-    # Remover as linhas onde 'stage_detail' começa com "5 " ou "6 "
-    df = df[~df['stage_detail'].str.startswith(('5', '6'))]
-    
-    return df
-    
-
-def process_bar_data(df):
-    df = df.copy()
-    
-    df_filtered = df[(df['stage_name'] == 'AMBULANTE ESSENCIAL') | df['description'].str.contains("CA", na=False)]
-
-
-    dt_filtered = df_filtered.loc[df_filtered.groupby('id')['date_created'].idxmax()]
-    df_filtered = df.dropna(subset=['id'])
-
-    dt_filtered = dt_filtered[~dt_filtered['stage_detail'].str.contains('1', na=False)]
-    d = dt_filtered['stage_detail'].value_counts()
-
-    df_bar = d.reset_index()
-    df_bar.columns = ['stage_detail', 'count']
-    
-    return df_bar
-
+import metrics
+from agendor import fetch_columns
+from client_data import client_dataset
+from deal_table import COLUMNS as DEAL_TABLE_COLUMNS
+from export import FORMATS as EXPORT_FORMATS, export_chunks, parquet_available, stream_csv, stream_parquet
+from deal_store import DealStore, sync_deals
+from figure_cache import DiskBackend, FigureCache
+from processing import stage_detail_order
+from profiling import ProfileCapture
+from shared_snapshot import SharedSnapshotStore
+from snapshot import SnapshotRefresher, build_snapshot
+from timeseries import GRANULARITIES
+from webhooks import WebhookIngest
+
+# Caminho do store local (SQLite); se definido, ativa a sincronização incremental
+DEAL_STORE_PATH = os.environ.get('DEAL_STORE_PATH')
+
+# Intervalo (segundos) entre atualizações do snapshot em segundo plano; 0 desativa
+REFRESH_INTERVAL = int(os.environ.get('REFRESH_INTERVAL', 900))
+
+# Diretório do snapshot compartilhado entre os workers do gunicorn: um processo busca e grava
+# os dados, os demais abrem o arquivo com mmap. SHARED_SNAPSHOT_POLL (segundos) é o intervalo
+# com que cada worker verifica se há uma versão nova
+SHARED_SNAPSHOT_DIR = os.environ.get('SHARED_SNAPSHOT_DIR')
+SHARED_SNAPSHOT_POLL = int(os.environ.get('SHARED_SNAPSHOT_POLL', 60))
+
+# Cache de figuras: entradas em memória por processo (0 desativa) e, opcionalmente, um
+# diretório compartilhado entre os workers do gunicorn
+FIGURE_CACHE_SIZE = int(os.environ.get('FIGURE_CACHE_SIZE', 256))
+FIGURE_CACHE_DIR = os.environ.get('FIGURE_CACHE_DIR')
+FIGURE_CACHE_DISK_SIZE = int(os.environ.get('FIGURE_CACHE_DISK_SIZE', 1024))
+
+# Sem nenhum snapshot carregado, intervalo (segundos) para tentar de novo após uma falha
+SNAPSHOT_RETRY_INTERVAL = int(os.environ.get('SNAPSHOT_RETRY_INTERVAL', 30))
+
+# Linhas por página da tabela de deals (paginada, ordenada e filtrada no servidor)
+DEAL_TABLE_PAGE_SIZE = int(os.environ.get('DEAL_TABLE_PAGE_SIZE', 20))
+
+# Filtragem no navegador: a página recebe os dados pré-agregados do snapshot e os filtros de
+# data e funil rodam em callbacks clientside; o servidor só é consultado a cada
+# CLIENTSIDE_POLL_SECONDS para saber se há um snapshot novo
+CLIENTSIDE_FILTERING = os.environ.get('CLIENTSIDE_FILTERING') == '1'
+CLIENTSIDE_POLL_SECONDS = int(os.environ.get('CLIENTSIDE_POLL_SECONDS', 60))
+
+# Webhook do Agendor (deals criados, alterados e removidos) aplicado direto no snapshot. Só
+# fica ativo com WEBHOOK_TOKEN, que precisa vir no cabeçalho X-Webhook-Token ou no parâmetro
+# ?token= (sem ele o endpoint responde 403); WEBHOOK_RECORD_PATH grava os corpos recebidos
+# (JSONL) para reproduzi-los depois
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/webhooks/agendor')
+WEBHOOK_TOKEN = os.environ.get('WEBHOOK_TOKEN')
+WEBHOOK_RECORD_PATH = os.environ.get('WEBHOOK_RECORD_PATH')
+
+# Exportação dos deals filtrados (CSV ou Parquet), gerada em fatias de EXPORT_CHUNK_ROWS linhas
+# enquanto é enviada; Parquet precisa do pyarrow instalado
+EXPORT_PATH = os.environ.get('EXPORT_PATH', '/export/deals')
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 50_000))
+
+# Cabeçalho Server-Timing (etapas de cada callback) nas respostas do Dash; 0 desativa
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') != '0'
+
+# Perfis de amostragem (opcional). Com PROFILE_DIR, requisições com o cabeçalho X-Profile: 1 ou
+# o cookie profile=1 são perfiladas; com PROFILE=1 todos os callbacks e a carga do snapshot são
+# amostrados e os que passarem de PROFILE_THRESHOLD_MS são gravados (ficam os PROFILE_KEEP últimos)
+PROFILE = os.environ.get('PROFILE') == '1'
+PROFILE_DIR = os.environ.get('PROFILE_DIR') or (os.path.join(tempfile.gettempdir(), 'dashboard-profiles') if PROFILE else None)
+PROFILE_THRESHOLD_MS = float(os.environ.get('PROFILE_THRESHOLD_MS', 500))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))
+
+
+profiler = (ProfileCapture(PROFILE_DIR, PROFILE_THRESHOLD_MS / 1000, PROFILE_INTERVAL_MS / 1000, PROFILE_KEEP,
+                           always=PROFILE)
+            if PROFILE_DIR else None)
+
+
+def profiled(name, func):
+    # Com PROFILE=1 cada chamada de `func` é amostrada e as lentas viram perfis em disco
+    return profiler.wrap(name, func) if profiler else func
+
+
+def load_deals():
+    # Deals já nas colunas tipadas: cada página da API é achatada ao chegar e descartada
+    if DEAL_STORE_PATH:
+        store = DealStore(DEAL_STORE_PATH)
+        try:
+            return sync_deals(store)
+        finally:
+            store.close()
+    return fetch_columns()
+
+
+def load_disk_snapshot():
+    """Último snapshot gravado em disco, sem acessar a API (None se não houver)."""
+    if SHARED_SNAPSHOT_DIR:
+        return shared_snapshot.load(refresh=False)
+    elif DEAL_STORE_PATH and os.path.exists(DEAL_STORE_PATH):
+        store = DealStore(DEAL_STORE_PATH)
+        try:
+            columns = store.load_columns()
+        finally:
+            store.close()
+        if len(columns['title']):
+            return build_snapshot(columns, 1, data_at=datetime.fromtimestamp(os.path.getmtime(DEAL_STORE_PATH)))
+    return None
+
+
+# O servidor sobe na hora: usa o último snapshot do disco (se houver) e busca os dados em
+# segundo plano; até a primeira carga terminar as páginas mostram "carregando"
+if SHARED_SNAPSHOT_DIR:
+    shared_snapshot = SharedSnapshotStore(SHARED_SNAPSHOT_DIR, load_deals, max_age=REFRESH_INTERVAL)
+    snapshots = SnapshotRefresher(
+        profiled('shared_snapshot_load', shared_snapshot.load),
+        min(REFRESH_INTERVAL, SHARED_SNAPSHOT_POLL) or SHARED_SNAPSHOT_POLL,
+        # O snapshot já vem montado do disco; a troca só renumera a versão
+        build=lambda snapshot, version: snapshot,
+        retry_interval=SNAPSHOT_RETRY_INTERVAL,
+    )
+else:
+    snapshots = SnapshotRefresher(profiled('load_deals', load_deals), REFRESH_INTERVAL,
+                                  build=profiled('build_snapshot', build_snapshot),
+                                  retry_interval=SNAPSHOT_RETRY_INTERVAL)
+snapshots.warm_start(profiled('load_disk_snapshot', load_disk_snapshot))
+snapshots.start()
+
+# No modo compartilhado só o worker que recebe o evento o aplica; os demais só veem a mudança
+# no próximo snapshot compartilhado
+webhooks = WebhookIngest(snapshots, store=DealStore(DEAL_STORE_PATH) if DEAL_STORE_PATH else None,
+                         record_path=WEBHOOK_RECORD_PATH)
+
+figure_cache = FigureCache(
+    FIGURE_CACHE_SIZE,
+    disk=DiskBackend(FIGURE_CACHE_DIR, FIGURE_CACHE_DISK_SIZE) if FIGURE_CACHE_DIR else None,
+)
 
-# Buscar os dados **apenas uma vez** ao iniciar o servidor
-deals = fetch_data()
-df = process_data(deals)
-df_line = process_line_data(df)
-df_line['date_created'] = pd.to_datetime(df_line['date_created']).dt.date
-df_bar = process_bar_data(df)
 
+def data_version():
+    # Impressão digital dos dados: igual entre workers e muda a cada snapshot novo
+    return snapshots.current.fingerprint
 
-def sort_stage_detail(stage_detail):
-    """Ordena os valores de 'stage_detail' assumindo o formato numérico 'X.Y'"""
-    try:
-        parts = stage_detail.split(' ')[0].split('.')  # Pega apenas a parte numérica antes do espaço
-        parts = [int(p) if p.isdigit() else 0 for p in parts]  # Converte para inteiro, tratando casos inesperados
-        return tuple(parts)  # Retorna como tupla para ordenação correta
-    except Exception as e:
-        print(f"Erro ao tentar ordenar stage_detail '{stage_detail}': {e}")
-        return (float('inf'),)  # Empurra valores problemáticos para o final da ordenação
-        
 # Link externo para CSS
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
-# Criar o aplicativo Dash
-app = Dash(__name__, external_stylesheets=external_stylesheets)
+# Criar o aplicativo Dash (o layout muda entre "carregando" e o dashboard, então os ids dos
+# callbacks nem sempre estão na página)
+app = Dash(__name__, external_stylesheets=external_stylesheets, suppress_callback_exceptions=True)
 server = app.server  # Esta linha é crucial para o deploy com Gunicorn
 app.title = "Essencial - Dashbard"
+metrics.instrument_dash(server, send_server_timing=SERVER_TIMING)
+if profiler:
+    profiler.install(server)
+
+
+def _snapshot_value(read):
+    # Valor lido do snapshot atual na hora da coleta (nada enquanto carrega)
+    snap = snapshots.current
+    return read(snap) if snap is not None else None
+
+
+metrics.gauge('snapshot_age_seconds', 'Idade dos dados do snapshot atual.',
+              func=lambda: _snapshot_value(lambda snap: (datetime.now() - snap.data_at).total_seconds()))
+metrics.gauge('snapshot_version', 'Versão local do snapshot atual.',
+              func=lambda: _snapshot_value(lambda snap: snap.version))
+metrics.gauge('snapshot_rows', 'Linhas dos frames do snapshot atual.', ['frame'],
+              func=lambda: _snapshot_value(lambda snap: {
+                  (frame,): snap.sizes[frame] for frame in ('all', 'open', 'line', 'latest')
+              }))
+metrics.gauge('snapshot_ready', '1 com snapshot carregado, 0 enquanto carrega.',
+              func=lambda: int(snapshots.current is not None))
+metrics.counter('figure_cache_requests_total', 'Consultas ao cache de figuras por resultado.', ['result'],
+                func=lambda: {('hit',): figure_cache.hits, ('miss',): figure_cache.misses})
+metrics.gauge('figure_cache_hit_ratio', 'Fração das consultas ao cache de figuras atendidas pelo cache.',
+              func=lambda: figure_cache.hits / (figure_cache.hits + figure_cache.misses)
+              if figure_cache.hits + figure_cache.misses else None)
+metrics.gauge('figure_cache_entries', 'Entradas do cache de figuras em memória.', func=lambda: len(figure_cache))
+
+
+@server.route('/metrics')
+def metrics_endpoint():
+    """Métricas deste processo no formato texto do Prometheus (cada worker do gunicorn tem as suas)."""
+    return Response(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@server.route('/ready')
+def ready():
+    """Prontidão para o load balancer: 200 com snapshot carregado, 503 enquanto carrega."""
+    snap = snapshots.current
+    body = {
+        'state': snapshots.state,
+        'refreshing': snapshots.refreshing,
+        'last_attempt_at': snapshots.last_attempt_at.isoformat() if snapshots.last_attempt_at else None,
+        'last_error': snapshots.last_error,
+    }
+    if snap is not None:
+        body.update({
+            'version': snap.version,
+            'fingerprint': snap.fingerprint,
+            'built_at': snap.built_at.isoformat(),
+            'data_at': snap.data_at.isoformat(),
+            'age_seconds': round((datetime.now() - snap.data_at).total_seconds(), 1),
+            'deals': snap.sizes['all'],
+        })
+    return jsonify(body), 200 if snap is not None else 503
+
+@server.route(WEBHOOK_PATH, methods=['POST'])
+def webhook():
+    """Recebe eventos de deals e retorna quantos foram aplicados, repetidos, atrasados ou ignorados."""
+    # Sem token qualquer um poderia remover deals (e a sincronização não os traz de volta)
+    if not WEBHOOK_TOKEN:
+        return jsonify({'error': 'webhook desativado: defina WEBHOOK_TOKEN'}), 403
+    token = request.headers.get('X-Webhook-Token') or request.args.get('token') or ''
+    if not hmac.compare_digest(token.encode(), WEBHOOK_TOKEN.encode()):
+        return jsonify({'error': 'token inválido'}), 401
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return jsonify({'error': 'corpo JSON inválido'}), 400
+    return jsonify(webhooks.handle(payload))
+
+
+@server.route(EXPORT_PATH)
+def export_deals():
+    """Deals do funil (?stage=) criados nas janelas (?start=&end=, repetidos) em CSV ou Parquet (?format=).
+
+    O arquivo é gerado em fatias enquanto é enviado, sobre o snapshot do início da
+    requisição, sem montar o resultado inteiro na memória.
+    """
+    snap = snapshots.current
+    if snap is None:
+        return jsonify({'error': 'dados carregando'}), 503
+    file_format = request.args.get('format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'formato inválido: {file_format}'}), 400
+    if file_format == 'parquet' and not parquet_available():
+        return jsonify({'error': 'exportação em Parquet requer o pacote pyarrow'}), 501
+    # parse_windows ignora janelas incompletas; aqui uma delas viraria o histórico inteiro
+    starts, ends = request.args.getlist('start'), request.args.getlist('end')
+    if len(starts) != len(ends) or not all(starts) or not all(ends):
+        return jsonify({'error': 'cada janela precisa de start e end'}), 400
+    try:
+        windows = [(start, end) for _, start, end in parse_windows(starts, ends)]
+    except ValueError:
+        return jsonify({'error': 'data inválida'}), 400
+    stage_name = request.args.get('stage')
+    if stage_name == 'Geral':
+        stage_name = None
+
+    chunks = export_chunks(snap.processed(None), stage_name, windows, EXPORT_CHUNK_ROWS)
+    stream = stream_parquet(chunks) if file_format == 'parquet' else stream_csv(chunks)
+    content_type, extension = EXPORT_FORMATS[file_format]
+    return Response(stream_with_context(stream), content_type=content_type, headers={
+        'Content-Disposition': f'attachment; filename=deals-{snap.data_at:%Y%m%d-%H%M}.{extension}',
+    })
 
-# Valor inicial do filtro de data
-default_start_date = datetime.today() - timedelta(days=60)
-default_end_date = datetime.today()
 
-# Ajuste para data de início dos leads
-leads_start_date = (default_start_date + timedelta(days=30)).date()  # Converter para tipo 'date'
+def parse_date(value):
+    """Converte a data ISO vinda do DatePickerRange no dia (Timestamp) usado nos frames."""
+    return pd.Timestamp(datetime.fromisoformat(value).date())
 
-# Filtrando os dados para considerar apenas 'LEADS' no 'stage_detail'
-leads_df = df_line[df_line['stage_detail'] == '1.1 LEADS']
 
-# Convertendo 'date_created' para tipo 'date' para comparações
-leads_df['date_created'] = pd.to_datetime(leads_df['date_created']).dt.date
+# Valor inicial do filtro de data (recalculado a cada carregamento da página)
+def default_date_range():
+    return datetime.today() - timedelta(days=60), datetime.today()
 
-# Filtrando pela data
-leads_df = leads_df[leads_df['date_created'] >= leads_start_date]
 
+def loading_layout():
+    # Página provisória enquanto o primeiro snapshot carrega; recarrega sozinha quando ficar pronto
+    return html.Div([
+        html.H1("Essencial", style={'color': '#003366', 'margin': '0'}),
+        html.H3("Carregando dados, aguarde...", style={'color': '#003366'}),
+        dcc.Interval(id='loading-poll', interval=5000),
+        dcc.Store(id='loading-ready'),
+    ], style={'font-family': 'Arial, sans-serif', 'padding': '20px', 'textAlign': 'center'})
 
-# Contando a quantidade de leads por data
-leads_count = leads_df.groupby('date_created').size().reset_index(name='total_leads')
 
-df_stage_counts = df.loc[df.groupby('id')['date_created'].idxmax()]
+@app.callback(
+    Output('loading-ready', 'data'),
+    Input('loading-poll', 'n_intervals'),
+    prevent_initial_call=True
+)
+def check_ready(n_intervals):
+    return True if snapshots.current is not None else dash.no_update
+
+
+# Recarrega a página no navegador assim que o snapshot ficar pronto
+app.clientside_callback(
+    "function(ready) { if (ready) { window.location.reload(); } return !!ready; }",
+    Output('loading-poll', 'disabled'),
+    Input('loading-ready', 'data'),
+    prevent_initial_call=True
+)
 
-stage_counts = df_stage_counts['stage_name'].value_counts().reset_index()
-stage_counts.columns = ['Stage Name', 'Client Count']
 
+# Layout do dashboard (montado a cada carregamento da página a partir do snapshot atual)
+def serve_layout():
+    snap = snapshots.current
+    if snap is None:
+        return loading_layout()
+    default_start_date, default_end_date = default_date_range()
+    first_day, last_day = snap.line_date_range()
 
-# Layout do dashboard
-app.layout = html.Div(children=[
-    # Cabeçalho com título e logo
-    html.Div([
-        html.Img(src='../assets/essencial_logo.jpg', style={'height': '80px', 'margin-right': '20px'}),
-        html.H1("Essencial", style={'color': '#003366', 'margin': '0'})
-    ], style={'display': 'flex', 'align-items': 'center', 'justify-content': 'center', 'padding': '20px'}),
+    layout = html.Div(children=[
+        # Cabeçalho com título e logo
+        html.Div([
+            html.Img(src='../assets/essencial_logo.jpg', style={'height': '80px', 'margin-right': '20px'}),
+            html.H1("Essencial", style={'color': '#003366', 'margin': '0'})
+        ], style={'display': 'flex', 'align-items': 'center', 'justify-content': 'center', 'padding': '20px'}),
     
-    # Dropdown estilizado e centralizado
-    html.Div([
-        dcc.Dropdown(
-            id='stage-detail-filter',
-            options=[{'label': 'Geral', 'value': 'Geral'}] + 
-                    [{'label': stage, 'value': stage} for stage in sorted(df_line['stage_name'].unique()) 
-                     if stage != "AMBULANTE ESSENCIAL"],
-            value='Geral',
-            clearable=False,
-            style={
-                'width': '80%', 'padding': '12px', 'borderRadius': '10px',
-                'backgroundColor': '#f5f5f5', 'border': '1px solid #ccc',
-                'fontSize': '20px', 'textAlign': 'center', 'margin-top': '5px'
-            }
-        )
-    ], style={'display': 'flex', 'justify-content': 'center', 'margin-top': '20px', 'margin-bottom': '20px'}),
+        # Dropdown estilizado e centralizado
+        html.Div([
+            dcc.Dropdown(
+                id='stage-detail-filter',
+                options=[{'label': 'Geral', 'value': 'Geral'}] + 
+                        [{'label': stage, 'value': stage} for stage in sorted(snap.line_stages()) 
+                         if stage != "AMBULANTE ESSENCIAL"],
+                value='Geral',
+                clearable=False,
+                style={
+                    'width': '80%', 'padding': '12px', 'borderRadius': '10px',
+                    'backgroundColor': '#f5f5f5', 'border': '1px solid #ccc',
+                    'fontSize': '20px', 'textAlign': 'center', 'margin-top': '5px'
+                }
+            )
+        ], style={'display': 'flex', 'justify-content': 'center', 'margin-top': '20px', 'margin-bottom': '20px'}),
     
-    html.Div([
-        html.H3("Contagem de Cliente por Estágio", style={'color': '#003366', 'textAlign': 'center', 'margin-bottom': '20px'}),
-        dash_table.DataTable(
-            id='client-stage-table',  # Adicionamos um ID para o callback
-            columns=[
-                {'name': 'Nome do Estágio', 'id': 'Stage Name'},
-                {'name': 'Quantidade de Clientes', 'id': 'Client Count'}
-            ],
-            data=stage_counts.to_dict('records'),
-            style_table={'margin': 'auto', 'width': '60%', 'borderRadius': '10px', 'overflow': 'hidden'},
-            style_header={
-                'backgroundColor': '#003366', 'color': 'white', 'fontWeight': 'bold', 'textAlign': 'center',
-                'border': '1px solid white'
-            },
-            style_data={
-                'backgroundColor': '#f9f9f9', 'color': '#003366', 'textAlign': 'center', 'border': '1px solid #ddd'
-            },
-            style_data_conditional=[
-                {'if': {'row_index': 'odd'}, 'backgroundColor': '#e6f2ff'}
-            ],
-            page_size=10
-        )
-    ], style={'margin-bottom': '40px'}),
-
-    # Container para os filtros dinâmicos
-    html.Div(id='date-filters-container', children=[
         html.Div([
-            html.Label(f'Filtro 1', style={'color': '#003366'}),
-            dcc.DatePickerRange(
-                id={'type': 'date-filter', 'index': 0},
-                min_date_allowed=df_line['date_created'].min(),
-                max_date_allowed=df_line['date_created'].max(),
-                start_date=default_start_date,
-                end_date=default_end_date,
-                display_format='DD/MM/YYYY',
-                style={'marginBottom': '10px'}
+            html.H3("Contagem de Cliente por Estágio", style={'color': '#003366', 'textAlign': 'center', 'margin-bottom': '20px'}),
+            dash_table.DataTable(
+                id='client-stage-table',  # Adicionamos um ID para o callback
+                columns=[
+                    {'name': 'Nome do Estágio', 'id': 'Stage Name'},
+                    {'name': 'Quantidade de Clientes', 'id': 'Client Count'}
+                ],
+                data=snap.stage_counts.to_dict('records'),
+                style_table={'margin': 'auto', 'width': '60%', 'borderRadius': '10px', 'overflow': 'hidden'},
+                style_header={
+                    'backgroundColor': '#003366', 'color': 'white', 'fontWeight': 'bold', 'textAlign': 'center',
+                    'border': '1px solid white'
+                },
+                style_data={
+                    'backgroundColor': '#f9f9f9', 'color': '#003366', 'textAlign': 'center', 'border': '1px solid #ddd'
+                },
+                style_data_conditional=[
+                    {'if': {'row_index': 'odd'}, 'backgroundColor': '#e6f2ff'}
+                ],
+                page_size=10
             )
-        ], style={'border': '2px solid #003366', 'padding': '10px', 'borderRadius': '5px'})
-    ]),
-
-    # Botão para adicionar filtros
-    html.Button("Adicionar Filtro", id="add-filter-btn", n_clicks=0, style={'background-color': '#003366', 'color': 'white'}),
-
-    # Gráfico
-    dcc.Graph(id='line-chart'),
-
-    # Gráfico de barras
-    dcc.Graph(
-        id='bar-chart',
-        figure=px.bar(
-            df_bar, x='stage_detail', y='count', text='count',
-            title="Visão Geral por Stage Detail"
-        ).update_traces(
-            texttemplate='%{text}', textposition='outside'
-        ).update_layout(
-            uniformtext_minsize=8, uniformtext_mode='hide',
-            plot_bgcolor='white', paper_bgcolor='rgba(0,0,0,0)',
-            font={'color': '#003366'}
-        )
-    ),
+        ], style={'margin-bottom': '40px'}),
+
+        # Container para os filtros dinâmicos
+        html.Div(id='date-filters-container', children=[
+            html.Div([
+                html.Label(f'Filtro 1', style={'color': '#003366'}),
+                dcc.DatePickerRange(
+                    id={'type': 'date-filter', 'index': 0},
+                    min_date_allowed=first_day,
+                    max_date_allowed=last_day,
+                    start_date=default_start_date,
+                    end_date=default_end_date,
+                    display_format='DD/MM/YYYY',
+                    style={'marginBottom': '10px'}
+                )
+            ], style={'border': '2px solid #003366', 'padding': '10px', 'borderRadius': '5px'})
+        ]),
+
+        # Botão para adicionar filtros
+        html.Button("Adicionar Filtro", id="add-filter-btn", n_clicks=0, style={'background-color': '#003366', 'color': 'white'}),
+
+        # Exportação dos deals com o funil e os filtros de data atuais (links montados no navegador)
+        html.Div([
+            html.A("Exportar CSV", id='export-csv-link', href=f'{EXPORT_PATH}?format=csv',
+                   style={'color': '#003366', 'margin-right': '20px'}),
+            html.A("Exportar Parquet", id='export-parquet-link', href=f'{EXPORT_PATH}?format=parquet',
+                   style={'color': '#003366'}),
+        ], style={'margin-top': '10px'}),
+
+        # Filtros que estão desenhados nos gráficos (permite atualizar só a linha do filtro alterado)
+        dcc.Store(id='charted-filters'),
+
+        # Gráfico
+        dcc.Graph(id='line-chart'),
+
+        # Gráfico de barras
+        dcc.Graph(
+            id='bar-chart',
+            figure=px.bar(
+                snap.df_bar, x='stage_detail', y='count', text='count',
+                title="Visão Geral por Stage Detail"
+            ).update_traces(
+                texttemplate='%{text}', textposition='outside'
+            ).update_layout(
+                uniformtext_minsize=8, uniformtext_mode='hide',
+                plot_bgcolor='white', paper_bgcolor='rgba(0,0,0,0)',
+                font={'color': '#003366'}
+            )
+        ),
     
-    # 📌 **Novo Gráfico**: Barras por Stage Name (Clientes Ganhos)
-    html.Div(id='chart-won-container'),
+        # 📌 **Novo Gráfico**: Barras por Stage Name (Clientes Ganhos)
+        html.Div(id='chart-won-container'),
     
-    html.Div(id='chart-lost-container'),
+        html.Div(id='chart-lost-container'),
     
-    dcc.Graph(id='lost-reason-chart'),
+        dcc.Graph(id='lost-reason-chart'),
+
+        # Deals um a um, no funil escolhido: só a página visível vem do servidor
+        html.Div([
+            html.H3("Deals", style={'color': '#003366', 'textAlign': 'center', 'margin-bottom': '20px'}),
+            dash_table.DataTable(
+                id='deal-table',
+                columns=[{'name': name, 'id': column, 'type': kind} for column, name, kind in DEAL_TABLE_COLUMNS],
+                page_action='custom', page_current=0, page_size=DEAL_TABLE_PAGE_SIZE,
+                sort_action='custom', sort_mode='multi', sort_by=[],
+                filter_action='custom', filter_query='', filter_options={'case': 'insensitive'},
+                style_table={'margin': 'auto', 'width': '90%', 'overflowX': 'auto'},
+                style_header={
+                    'backgroundColor': '#003366', 'color': 'white', 'fontWeight': 'bold', 'textAlign': 'center',
+                    'border': '1px solid white'
+                },
+                style_data={
+                    'backgroundColor': '#f9f9f9', 'color': '#003366', 'textAlign': 'center', 'border': '1px solid #ddd'
+                },
+                style_data_conditional=[
+                    {'if': {'row_index': 'odd'}, 'backgroundColor': '#e6f2ff'}
+                ]
+            )
+        ], style={'margin-top': '40px', 'margin-bottom': '40px'}),
     
-    # Gráfico de evolução Leads (sem callback, independente)
-    dcc.Graph(
-        id='evolucao-leads',
-        figure=px.line(
-            leads_count, 
-            x='date_created', 
-            y='total_leads', 
-            title="Evolução de Leads", 
-            markers=True
-        ).update_layout(
-            plot_bgcolor='rgba(0,0,0,0)', 
-            paper_bgcolor='rgba(0,0,0,0)', 
-            font={'color': '#003366'}
-        ),
-        style={'display': 'block'}
-    ),
+        # Evolução de Leads com intervalo e granularidade próprios (independente dos filtros acima)
+        html.Div(id='evolucao-leads', children=[
+            html.Div([
+                dcc.DatePickerRange(
+                    id='leads-date-range',
+                    min_date_allowed=snap.daily_counts.start,
+                    max_date_allowed=snap.daily_counts.end,
+                    start_date=(datetime.today() - timedelta(days=30)).date(),
+                    end_date=datetime.today().date(),
+                    display_format='DD/MM/YYYY',
+                    style={'marginRight': '20px'}
+                ),
+                dcc.RadioItems(
+                    id='leads-granularity',
+                    options=[{'label': label, 'value': value} for value, (_, label) in GRANULARITIES.items()],
+                    value='D',
+                    inline=True,
+                    inputStyle={'margin-left': '10px', 'margin-right': '4px'},
+                    style={'color': '#003366'}
+                ),
+            ], style={'display': 'flex', 'align-items': 'center', 'justify-content': 'center'}),
+            dcc.Graph(id='leads-chart'),
+        ], style={'display': 'block'}),
     
-], style={'font-family': 'Arial, sans-serif', 'padding': '20px', 'backgroundColor': '#FFFFFF'})
+    ], style={'font-family': 'Arial, sans-serif', 'padding': '20px', 'backgroundColor': '#FFFFFF'})
+
+    if CLIENTSIDE_FILTERING:
+        # Dados pré-agregados para os callbacks clientside e verificação periódica de snapshot novo
+        layout.children += [
+            dcc.Store(id='dashboard-data', data=client_data()),
+            dcc.Store(id='dashboard-data-version', data=snap.fingerprint),
+            dcc.Interval(id='dashboard-data-poll', interval=CLIENTSIDE_POLL_SECONDS * 1000),
+        ]
+    return layout
+
+
+app.layout = serve_layout
 
 
 @app.callback(
     Output('date-filters-container', 'children'),
     [Input('add-filter-btn', 'n_clicks'),
-     Input({'type': 'remove-filter-btn', 'index': dash.ALL}, 'n_clicks')],
-    State('date-filters-container', 'children')
+     Input({'type': 'remove-filter-btn', 'index': dash.ALL}, 'n_clicks')]
 )
-def update_filters(n_clicks, remove_clicks, children):
+def update_filters(n_clicks, remove_clicks):
+    # Atualização parcial (Patch): o navegador não envia a lista de filtros e a resposta
+    # traz só o filtro adicionado ou a posição removida
     ctx = dash.callback_context
-
-    if not children:
-        children = []
-
-    # 🔍 Verifica se um botão "Remover" foi acionado
-    if ctx.triggered and 'remove-filter-btn' in ctx.triggered[0]['prop_id']:
-        try:
-            triggered_id = eval(ctx.triggered[0]['prop_id'].replace(".n_clicks", ""))
-            index_to_remove = triggered_id.get("index", None)
-
-            if index_to_remove is not None:
-                # 🔥 Remove elementos filtrando pelo ID diretamente
-                children = [child for child in children if 
-                            not (isinstance(child, dict) and 'props' in child and 
-                                 any('id' in c['props'] and c['props']['id'].get('index') == index_to_remove
-                                     for c in child['props'].get('children', [])))]
-                return children
-        except Exception as e:
-            print(f"Erro ao remover filtro: {e}", flush=True)
+    children = dash.Patch()
+
+    # 🔍 Verifica se um botão "Remover" foi acionado (id já vem como dict, sem eval)
+    triggered_id = ctx.triggered_id
+    if isinstance(triggered_id, dict) and triggered_id.get('type') == 'remove-filter-btn':
+        if not ctx.triggered[0]['value']:
+            # Botão recém-criado (n_clicks=0) não remove nada
+            return dash.no_update
+        # Os botões "Remover" aparecem na mesma ordem dos filtros; o Filtro 1 (posição 0) não tem botão
+        remove_ids = [item['id'] for item in ctx.inputs_list[1]]
+        if triggered_id not in remove_ids:
+            return dash.no_update
+        del children[remove_ids.index(triggered_id) + 1]
+        return children
 
     # Se for o botão de adicionar filtro
-    if n_clicks > 0:
-        new_filter_index = n_clicks + 1
-        new_filter = html.Div([
-            html.Label(f'Filtro {new_filter_index}', style={'color': '#003366'}),
-            dcc.DatePickerRange(
-                id={'type': 'date-filter', 'index': new_filter_index},
-                min_date_allowed=df_line['date_created'].min(),
-                max_date_allowed=df_line['date_created'].max(),
-                start_date=default_start_date,
-                end_date=default_end_date,
-                display_format='DD/MM/YYYY',
-                style={'marginRight': '10px'}
-            ),
-            html.Button("Remover", id={'type': 'remove-filter-btn', 'index': new_filter_index},
-                        n_clicks=0, style={'background-color': 'red', 'color': 'white', 'margin-left': '10px'})
-        ], style={'border': '2px solid #003366', 'padding': '10px', 'border-radius': '5px', 'margin-bottom': '10px'})
-        children.append(new_filter)
+    if triggered_id != 'add-filter-btn' or not n_clicks:
+        return dash.no_update
+
+    first_day, last_day = snapshots.current.line_date_range()
+    default_start_date, default_end_date = default_date_range()
+    new_filter_index = n_clicks + 1
+    new_filter = html.Div([
+        html.Label(f'Filtro {new_filter_index}', style={'color': '#003366'}),
+        dcc.DatePickerRange(
+            id={'type': 'date-filter', 'index': new_filter_index},
+            min_date_allowed=first_day,
+            max_date_allowed=last_day,
+            start_date=default_start_date,
+            end_date=default_end_date,
+            display_format='DD/MM/YYYY',
+            style={'marginRight': '10px'}
+        ),
+        html.Button("Remover", id={'type': 'remove-filter-btn', 'index': new_filter_index},
+                    n_clicks=0, style={'background-color': 'red', 'color': 'white', 'margin-left': '10px'})
+    ], style={'border': '2px solid #003366', 'padding': '10px', 'border-radius': '5px', 'margin-bottom': '10px'})
+    children.append(new_filter)
 
     return children
 
 
-# Criamos um DataFrame auxiliar para mapear stage_name e stage_detail
-df_stage_mapping = df_line[['stage_name', 'stage_detail']].drop_duplicates(subset=['stage_detail'])
+def parse_windows(start_dates, end_dates):
+    """Janelas (posição do filtro, início, fim) dos filtros de data preenchidos, convertidas uma única vez."""
+    windows = []
+    for i, (start_date, end_date) in enumerate(zip(start_dates or [], end_dates or [])):
+        if start_date and end_date:
+            windows.append((i, parse_date(start_date), parse_date(end_date)))
+    return windows
 
-# Filtramos apenas os detalhes ordenados e fazemos um merge para manter a relação com stage_name
-df_stage_mapping = df_stage_mapping.sort_values(by='stage_detail', key=lambda x: x.map(sort_stage_detail))
 
-@app.callback(
-    Output('line-chart', 'figure'),
-    [Input({'type': 'date-filter', 'index': dash.ALL}, 'start_date'),
-    Input({'type': 'date-filter', 'index': dash.ALL}, 'end_date'),
-    Input('stage-detail-filter', 'value'),
-])
-def update_chart(start_dates, end_dates, selected_stage_name):
+def line_axis(df_stage_mapping, selected_stage_name):
+    """Estágios do eixo X do gráfico de linha (todos ou só os do funil escolhido)."""
+    if selected_stage_name != 'Geral':
+        full_df = df_stage_mapping[df_stage_mapping['stage_name'] == selected_stage_name]
+        return full_df[['stage_detail']]
+    return df_stage_mapping[['stage_detail']]
+
+
+def line_counts(snap, windows, selected_stage_name):
+    """Último deal de cada cliente dentro de cada janela, por 'stage_detail' (todas as janelas de uma vez)."""
+    cube = snap.cubes['created']
+    dates = [(start_date, end_date) for _, start_date, end_date in windows]
+    if selected_stage_name != 'Geral':
+        return cube.rollup_windows('stage_detail', dates, where={'stage_name': selected_stage_name},
+                                   alive='alive_in_stage')
+    return cube.rollup_windows('stage_detail', dates, alive='alive')
+
+
+def build_line_trace(snap, counts, position, selected_stage_name):
+    """Linha "Filtro {position + 1}" do gráfico de evolução a partir das contagens da janela."""
+    filtered_df = counts.reset_index(name='total')
+
+    # Adicionar valores ausentes para garantir alinhamento com o eixo X fixo
+    full_df = line_axis(snap.df_stage_mapping, selected_stage_name)
+    filtered_df = full_df.merge(filtered_df, on='stage_detail', how='left').fillna({'total': 0})
+
+    return go.Scatter(
+        x=filtered_df['stage_detail'],
+        y=filtered_df['total'],
+        mode='lines+markers',
+        name=f'Filtro {position + 1}'
+    )
+
+
+def build_line_chart(snap, windows, selected_stage_name):
     fig = go.Figure()
-    if not start_dates or not end_dates:
+    if not windows:
         return fig
 
-    for i, (start_date, end_date) in enumerate(zip(start_dates, end_dates)):
-        if start_date and end_date:
-            start_date = datetime.fromisoformat(start_date).date()
-            end_date = datetime.fromisoformat(end_date).date()
-            filtered_df = df_line[(df_line['date_created'] >= start_date) & (df_line['date_created'] <= end_date)]
-            
-            if selected_stage_name != 'Geral':
-                filtered_df = filtered_df[filtered_df['stage_name'] == selected_stage_name]
-                full_df = df_stage_mapping[df_stage_mapping['stage_name'] == selected_stage_name]
-                full_df = full_df[['stage_detail']]
-            else:
-                full_df = df_stage_mapping[['stage_detail']]
-            
-            filtered_df = filtered_df.loc[filtered_df.groupby('id')['date_created'].idxmax()]
-
-            # Agrupar os dados por 'stage_detail'
-            filtered_df = filtered_df.groupby('stage_detail').size().reset_index(name='total')
-
-            # Adicionar valores ausentes para garantir alinhamento com o eixo X fixo
-            filtered_df = full_df.merge(filtered_df, on='stage_detail', how='left').fillna(0)
-
-            # Adicionar linha ao gráfico
-            fig.add_scatter(
-                x=filtered_df['stage_detail'],
-                y=filtered_df['total'],
-                mode='lines+markers',
-                name=f'Filtro {i + 1}'
-            )
+    # Adicionar uma linha por filtro ao gráfico
+    for (i, _, _), counts in zip(windows, line_counts(snap, windows, selected_stage_name)):
+        fig.add_trace(build_line_trace(snap, counts, i, selected_stage_name))
 
     # Configurar layout
+    full_df = line_axis(snap.df_stage_mapping, selected_stage_name)
     fig.update_layout(
         title="Evolução por Stage Detail",
         xaxis_title="Stage Detail",
@@ -395,43 +591,210 @@ def update_chart(start_dates, end_dates, selected_stage_name):
 
     return fig
 
-@app.callback(
-    Output('client-stage-table', 'data'), # Atualiza a tabela
-    [Input('stage-detail-filter', 'value')]
-)
-def update_data_table(selected_stage_name):
-    global df_stage_counts
-    df_stage_counts_temp = df_stage_counts.copy()
-    
+
+def build_closed_chart(grouped_df, label):
+    """Pizza + barras dos clientes ganhos ou perdidos por stage_name (`label`: 'Ganhos' / 'Perdidos')."""
+    # 🔵 Gráfico de Pizza (Proporção)
+    pie_chart = px.pie(
+        grouped_df, 
+        names='stage_name', 
+        values='total', 
+        hole=0.4,  
+        title=f"Distribuição Percentual dos Clientes {label}"
+    ).update_traces(
+        textposition='inside',
+        textinfo='percent',  # Mostra o percentual e o nome da categoria
+        insidetextorientation='radial'  # Ajusta o texto dentro da fatia
+    )
+
+    # 🔴 Gráfico de Barras (Quantidade)
+    bar_chart = px.bar(
+        grouped_df, 
+        x='stage_name', 
+        y='total', 
+        text='total',
+        title=f"Quantidade de Clientes {label}",
+        color='stage_name', 
+        labels={'total': 'Clientes'},
+    ).update_traces(
+        texttemplate='%{text}', 
+        textposition='outside'
+    ).update_layout(
+        yaxis=dict(range=[0, grouped_df['total'].max() * 1.2])  # Adiciona 20% de espaço extra no topo
+    )
+
+    # Layout lado a lado
+    return html.Div([
+        dcc.Graph(figure=pie_chart, style={'width': '48%', 'display': 'inline-block'}),
+        dcc.Graph(figure=bar_chart, style={'width': '48%', 'display': 'inline-block'}),
+    ])
+
+
+def loss_reason_counts(snap, windows, selected_stage_name):
+    """Motivos de perda dos clientes perdidos em cada janela (todas as janelas de uma vez)."""
+    # Clientes perdidos no intervalo de datas (no cubo, 'loss_reason' vazio já é "Outro")
+    where = {'stage_status': 'Perdido'}
+
+    # Se um stage_name for selecionado, filtra por ele
+    if selected_stage_name != 'Geral':
+        where['stage_name'] = selected_stage_name
+
+    dates = [(start_date, end_date) for _, start_date, end_date in windows]
+    return snap.cubes['lost'].rollup_windows('loss_reason', dates, where=where)
+
+
+def build_loss_reason_trace(loss_reason_counts, position):
+    """Barras "Filtro {position + 1}" dos motivos de perda e o topo do eixo Y para elas."""
+    # Motivos em ordem alfabética, como no groupby original
+    loss_reason_counts.index = loss_reason_counts.index.astype(object)
+    loss_reason_counts = loss_reason_counts.sort_index().reset_index(name='total')
+
+    # Soma total das perdas
+    total_losses = loss_reason_counts['total'].sum()
+
+    # Adiciona a barra "Total" com uma cor diferente
+    loss_reason_counts = pd.concat([
+        loss_reason_counts, 
+        pd.DataFrame({'loss_reason': ['Total'], 'total': [total_losses]})
+    ]).sort_values(by='total', ascending=False, kind='stable')  # Empates em ordem alfabética, como no navegador
+
+    # Criar gráfico de barras com labels acima das barras
+    trace = go.Bar(
+        x=loss_reason_counts['loss_reason'],
+        y=loss_reason_counts['total'],
+        text=loss_reason_counts['total'],  # Adiciona os valores
+        textposition='outside',  # Posiciona o texto acima das barras
+        marker_color=['#ff7f0e'] + ['#1f77b4'] * (len(loss_reason_counts) - 1),  # Azul padrão, última barra laranja
+        name=f'Filtro {position + 1}'
+    )
+    return trace, [0, loss_reason_counts['total'].max() * 1.2]
+
+
+def build_loss_reason_chart(snap, windows, selected_stage_name):
+    fig = go.Figure()
+
+    for (i, _, _), counts in zip(windows, loss_reason_counts(snap, windows, selected_stage_name)):
+        trace, y_range = build_loss_reason_trace(counts, i)
+        # O eixo Y fica com a escala do último filtro
+        fig.add_trace(trace).update_layout(yaxis=dict(range=y_range))
+
+    # Configuração do layout
+    fig.update_layout(
+        title="Motivos de Perda",
+        xaxis_title="Motivo de Perda",
+        yaxis_title="Total de Clientes Perdidos",
+        barmode='group',
+        uniformtext_minsize=8,  # Tamanho mínimo dos textos
+        uniformtext_mode='hide',  # Esconde textos sobrepostos
+        plot_bgcolor='rgba(0,0,0,0)', 
+        paper_bgcolor='rgba(0,0,0,0)', 
+        font={'color': '#003366'},
+        showlegend=True
+    )
+
+    return fig
+
+
+def build_closed_charts(snap, start_date, end_date):
+    """Gráficos de ganhos e perdidos por stage_name para a primeira janela preenchida."""
+    # 📊 Contar clientes ganhos / perdidos no período por stage_name
+    won_df = (snap.cubes['won'].rollup('stage_name', start_date, end_date, where={'stage_status': 'Ganho'})
+              .reset_index(name='total'))
+    lost_df = (snap.cubes['lost'].rollup('stage_name', start_date, end_date, where={'stage_status': 'Perdido'})
+               .reset_index(name='total'))
+    return build_closed_chart(won_df, 'Ganhos'), build_closed_chart(lost_df, 'Perdidos')
+
+
+@metrics.timed('date_outputs')
+@figure_cache.memoize('date-outputs', data_version)
+def date_outputs(start_dates, end_dates, selected_stage_name):
+    """Saídas que dependem dos filtros de data: linha, ganhos, perdidos e motivos de perda.
+
+    As datas são convertidas uma vez e as linhas e motivos de perda de todas as
+    janelas saem de uma única passada pelo cubo (`rollup_windows`).
+    """
+    snap = snapshots.current
+    if not start_dates or not end_dates:
+        no_data = html.Div("Nenhum dado disponível", style={'textAlign': 'center', 'color': '#003366'})
+        if selected_stage_name != 'Geral':
+            no_data = None
+        return go.Figure(), no_data, no_data, go.Figure()
+
+    windows = parse_windows(start_dates, end_dates)
+
+    # Ganhos e perdidos por stage_name só aparecem no "Geral" e usam o primeiro filtro preenchido
+    won_chart = lost_chart = None
+    if selected_stage_name == 'Geral':
+        won_chart = lost_chart = html.Div("Nenhum dado disponível", style={'textAlign': 'center', 'color': '#003366'})
+        if windows:
+            _, start_date, end_date = windows[0]
+            won_chart, lost_chart = build_closed_charts(snap, start_date, end_date)
+
+    return (
+        build_line_chart(snap, windows, selected_stage_name),
+        won_chart,
+        lost_chart,
+        build_loss_reason_chart(snap, windows, selected_stage_name),
+    )
+
+
+@metrics.timed('window_patches')
+def window_patches(snap, start_dates, end_dates, position, selected_stage_name):
+    """Atualização parcial quando só o filtro na `position` mudou e os demais continuam iguais.
+
+    Recalcula apenas a linha e as barras desse filtro e as envia como Patch; ganhos e
+    perdidos só mudam se ele for o primeiro filtro preenchido.
+    """
+    if not (start_dates[position] and end_dates[position]):
+        # Filtro continua incompleto: nenhum gráfico muda
+        return [dash.no_update] * 4
+
+    windows = parse_windows(start_dates, end_dates)
+    trace_position = [i for i, _, _ in windows].index(position)
+    window = windows[trace_position]
+
+    line_chart = dash.Patch()
+    counts, = line_counts(snap, [window], selected_stage_name)
+    line_chart['data'][trace_position] = build_line_trace(snap, counts, position, selected_stage_name)
+
+    loss_reason_chart = dash.Patch()
+    counts, = loss_reason_counts(snap, [window], selected_stage_name)
+    trace, y_range = build_loss_reason_trace(counts, position)
+    loss_reason_chart['data'][trace_position] = trace
+    if trace_position == len(windows) - 1:
+        loss_reason_chart['layout']['yaxis']['range'] = y_range
+
+    won_chart = lost_chart = dash.no_update
+    if trace_position == 0 and selected_stage_name == 'Geral':
+        won_chart, lost_chart = build_closed_charts(snap, window[1], window[2])
+
+    return [line_chart, won_chart, lost_chart, loss_reason_chart]
+
+
+def build_stage_table(cube, selected_stage_name):
     # Se for "Geral", mostrar todos os estágios
     if selected_stage_name == 'Geral':
-        stage_counts = df_stage_counts_temp['stage_name'].value_counts().reset_index()
+        stage_counts = (cube.rollup('stage_name')
+                        .sort_values(ascending=False)  # Maior contagem primeiro, como no value_counts
+                        .reset_index())
         stage_counts.columns = ['Stage Name', 'Client Count']
     else: 
-        df_stage_counts_temp = df_stage_counts_temp[df_stage_counts_temp['stage_name'] == selected_stage_name]
-                                
-        stage_counts = (df_stage_counts_temp['stage_detail']
-                        .value_counts()
-                        .reset_index()
-                        .sort_values(by='stage_detail', key=lambda x: x.map(sort_stage_detail)))
+        stage_counts = cube.rollup('stage_detail', where={'stage_name': selected_stage_name}).reset_index()
         stage_counts.columns = ['Stage Name', 'Client Count']
+        stage_counts = stage_counts.iloc[stage_detail_order(stage_counts['Stage Name'], stage_counts['Client Count'])]
         
     return stage_counts.to_dict('records')  # Retorna os dados no formato correto
 
-@app.callback(
-    Output('bar-chart', 'figure'),
-    Input('stage-detail-filter', 'value')
-)
-def update_bar_chart(selected_stage_name):
-    filtered_df = df.copy()
-    # Filtrar os dados conforme a seleção do dropdown
-    if selected_stage_name != 'Geral':
-        filtered_df = filtered_df[filtered_df['stage_name'] == selected_stage_name]
-        
+
+def build_bar_chart(cubes, selected_stage_name):
+    # Último registro por ID (no geral ou dentro do funil escolhido), pré-agregado no snapshot
+    if selected_stage_name == 'Geral':
+        filtered_df = cubes['latest'].rollup('stage_detail')
+    else:
+        filtered_df = cubes['latest_in_stage'].rollup('stage_detail', where={'stage_name': selected_stage_name})
+
     filtered_df = (filtered_df
-        .loc[lambda df_: df_.groupby('id')['date_created'].idxmax()]  # Mantém o último registro por ID
-        .dropna(subset=['id'])  # Remove linhas com id nulo
-        ['stage_detail'].value_counts()  # Conta os valores de stage_detail
+        .sort_values(ascending=False)  # Maior contagem primeiro, como no value_counts
         .reset_index(name='count')  # Define o nome correto da coluna gerada
     )
 
@@ -446,7 +809,8 @@ def update_bar_chart(selected_stage_name):
         plot_bgcolor='white', paper_bgcolor='rgba(0,0,0,0)',
         xaxis=dict(
         categoryorder='array', 
-        categoryarray=sorted(filtered_df['stage_detail'], key=sort_stage_detail)
+        categoryarray=filtered_df['stage_detail'].iloc[
+            stage_detail_order(filtered_df['stage_detail'], filtered_df['count'])].tolist()
         ),# Ordenação personalizada,
         xaxis_title="Estágio no Funil",
         yaxis_title="Quantidade de Clientes",
@@ -458,225 +822,179 @@ def update_bar_chart(selected_stage_name):
     return fig
 
 
-@app.callback(
-    Output('chart-won-container', 'children'),
-    [
-        Input({'type': 'date-filter', 'index': dash.ALL}, 'start_date'),
-        Input({'type': 'date-filter', 'index': dash.ALL}, 'end_date'),
-        Input('stage-detail-filter', 'value')
+@metrics.timed('stage_outputs')
+@figure_cache.memoize('stage-outputs', data_version)
+def stage_outputs(selected_stage_name):
+    """Saídas que dependem só do dropdown: gráfico de barras, tabela e visibilidade dos leads."""
+    cubes = snapshots.current.cubes
+    # Gráfico de evolução de leads só aparece no "Geral"
+    leads_style = {'display': 'block'} if selected_stage_name == "Geral" else {'display': 'none'}
+    return build_bar_chart(cubes, selected_stage_name), build_stage_table(cubes['latest'], selected_stage_name), leads_style
 
-    ]
-)
-def update_chart(start_dates, end_dates, selected_stage_name):
-    
-    if selected_stage_name != 'Geral':
-        return None
-    
-    if not start_dates or not end_dates:
-        return html.Div("Nenhum dado disponível", style={'textAlign': 'center', 'color': '#003366'})
-    
-    df = process_data(deals, filter_by_status=False)
 
-    for start_date, end_date in zip(start_dates, end_dates):
-        if start_date and end_date:
-            start_date = datetime.fromisoformat(start_date).date()
-            end_date = datetime.fromisoformat(end_date).date()
-
-            # 🔍 Filtrar os dados dentro do período e com status "Ganho"
-            filtered_df = df[(df['date_won'] >= start_date) & 
-                             (df['date_won'] <= end_date) & 
-                             (df['stage_status'] == 'Ganho')]
-
-            # 📊 Contar clientes por stage_name
-            grouped_df = filtered_df.groupby('stage_name').size().reset_index(name='total')
-
-            # 🔵 Gráfico de Pizza (Proporção)
-            pie_chart = px.pie(
-                grouped_df, 
-                names='stage_name', 
-                values='total', 
-                hole=0.4,  
-                title="Distribuição Percentual dos Clientes Ganhos"
-            ).update_traces(
-                textposition='inside',
-                textinfo='percent',  # Mostra o percentual e o nome da categoria
-                insidetextorientation='radial'  # Ajusta o texto dentro da fatia
-            )
+def filters_state(start_dates, end_dates):
+    """[índice do filtro, preenchido?] de cada filtro, na ordem da tela: define as linhas dos gráficos."""
+    filter_ids = [item['id']['index'] for item in dash.ctx.inputs_list[0]]
+    return [[index, bool(start and end)] for index, start, end in zip(filter_ids, start_dates, end_dates)]
 
-            # 🔴 Gráfico de Barras (Quantidade)
-            bar_chart = px.bar(
-                grouped_df, 
-                x='stage_name', 
-                y='total', 
-                text='total',
-                title="Quantidade de Clientes Ganhos",
-                color='stage_name', 
-                labels={'total': 'Clientes'},
-            ).update_traces(
-                texttemplate='%{text}', 
-                textposition='outside'
-            ).update_layout(
-                yaxis=dict(range=[0, grouped_df['total'].max() * 1.2])  # Adiciona 20% de espaço extra no topo
-            )
 
-            # Layout lado a lado
-            return html.Div([
-                dcc.Graph(figure=pie_chart, style={'width': '48%', 'display': 'inline-block'}),
-                dcc.Graph(figure=bar_chart, style={'width': '48%', 'display': 'inline-block'}),
-            ])
+DASHBOARD_OUTPUTS = [
+    Output('line-chart', 'figure'),
+    Output('chart-won-container', 'children'),
+    Output('chart-lost-container', 'children'),
+    Output('lost-reason-chart', 'figure'),
+    Output('bar-chart', 'figure'),
+    Output('client-stage-table', 'data'),
+    Output('evolucao-leads', 'style'),
+]
+DASHBOARD_INPUTS = [
+    Input({'type': 'date-filter', 'index': dash.ALL}, 'start_date'),
+    Input({'type': 'date-filter', 'index': dash.ALL}, 'end_date'),
+    Input('stage-detail-filter', 'value'),
+]
+
+
+# Um único callback para todos os gráficos: cada interação é uma requisição só, as datas
+# são lidas uma vez e as saídas que não dependem do input alterado não são recalculadas
+def update_dashboard(start_dates, end_dates, selected_stage_name, charted_filters):
+    # O que os gráficos passam a mostrar: filtros e snapshot (um refresh entre duas mudanças
+    # de data deixaria as demais linhas do Patch no snapshot anterior)
+    snap = snapshots.current
+    state = {'filters': filters_state(start_dates, end_dates), 'fingerprint': snap.fingerprint}
+    triggered = list(dash.ctx.triggered_prop_ids.values())
+    only_dates = all(isinstance(t, dict) and t.get('type') == 'date-filter' for t in triggered)
+    changed = {t['index'] for t in triggered if isinstance(t, dict) and t.get('type') == 'date-filter'}
+
+    # Só um filtro de data mudou (nada além dele, nem o funil) e os gráficos já mostram os
+    # mesmos filtros do mesmo snapshot: atualiza apenas as linhas desse filtro (Patch) em vez
+    # de recalcular todas
+    if triggered and only_dates and len(changed) == 1 and state == charted_filters:
+        position = [index for index, _ in state['filters']].index(changed.pop())
+        outputs = window_patches(snap, start_dates, end_dates, position, selected_stage_name)
+    else:
+        outputs = list(date_outputs(start_dates, end_dates, selected_stage_name))
+
+    # Mudança só nas datas: barras, tabela e visibilidade dos leads continuam iguais (o funil
+    # pode ter mudado junto, então procura em todos os ids alterados e não só no primeiro)
+    if not dash.ctx.triggered_prop_ids or 'stage-detail-filter.value' in dash.ctx.triggered_prop_ids:
+        outputs += stage_outputs(selected_stage_name)
+    else:
+        outputs += [dash.no_update] * 3
+
+    return outputs + [dash.no_update if state == charted_filters else state]
+
+
+@metrics.timed('leads_chart')
+@figure_cache.memoize('leads-chart', data_version)
+def leads_chart(start_date, end_date, granularity):
+    """Leads criados por dia, semana ou mês no intervalo, a partir das somas acumuladas do snapshot."""
+    # Sem data, o intervalo vai até o início / fim dos dados
+    leads = snapshots.current.daily_counts.series(
+        parse_date(start_date) if start_date else None, parse_date(end_date) if end_date else None,
+        granularity or 'D', where={'stage_detail': '1.1 LEADS', 'stage_status': 'Em andamento'}
+    )
+    leads_count = leads.rename_axis('date_created').reset_index(name='total_leads')
+    return px.line(
+        leads_count, 
+        x='date_created', 
+        y='total_leads', 
+        title="Evolução de Leads", 
+        markers=True
+    ).update_layout(
+        plot_bgcolor='rgba(0,0,0,0)', 
+        paper_bgcolor='rgba(0,0,0,0)', 
+        font={'color': '#003366'}
+    )
 
-    
-    return html.Div("Nenhum dado disponível", style={'textAlign': 'center', 'color': '#003366'})
 
 @app.callback(
-    Output('chart-lost-container', 'children'),
-    [
-        Input({'type': 'date-filter', 'index': dash.ALL}, 'start_date'),
-        Input({'type': 'date-filter', 'index': dash.ALL}, 'end_date'),
-        Input('stage-detail-filter', 'value')
-        
-    ]
+    Output('leads-chart', 'figure'),
+    [Input('leads-date-range', 'start_date'),
+     Input('leads-date-range', 'end_date'),
+     Input('leads-granularity', 'value')]
+)
+def update_leads_chart(start_date, end_date, granularity):
+    return leads_chart(start_date, end_date, granularity)
+
+
+# Links de exportação acompanham os filtros sem ir ao servidor (o arquivo é gerado só no clique)
+app.clientside_callback(
+    """
+    function(starts, ends, stage) {
+        const params = new URLSearchParams();
+        if (stage && stage !== 'Geral') { params.append('stage', stage); }
+        (starts || []).forEach(function(start, i) {
+            if (start && ends[i]) { params.append('start', start); params.append('end', ends[i]); }
+        });
+        return ['csv', 'parquet'].map(function(format) {
+            params.set('format', format);
+            return EXPORT_PATH + '?' + params.toString();
+        });
+    }
+    """.replace('EXPORT_PATH', json.dumps(EXPORT_PATH)),
+    [Output('export-csv-link', 'href'),
+     Output('export-parquet-link', 'href')],
+    DASHBOARD_INPUTS
 )
-def update_chart(start_dates, end_dates, selected_stage_name):
-    if selected_stage_name != 'Geral':
-        return None
-    
-    if not start_dates or not end_dates:
-        return html.Div("Nenhum dado disponível", style={'textAlign': 'center', 'color': '#003366'})
-    
-    df = process_data(deals, filter_by_status=False)
-
-    for start_date, end_date in zip(start_dates, end_dates):
-        if start_date and end_date:
-            start_date = datetime.fromisoformat(start_date).date()
-            end_date = datetime.fromisoformat(end_date).date()
-
-            # 🔍 Filtrar os dados dentro do período e com status "Perdido"
-            filtered_df = df[(df['date_lost'] >= start_date) & 
-                             (df['date_lost'] <= end_date) & 
-                             (df['stage_status'] == 'Perdido')]
-
-            # 📊 Contar clientes por stage_name
-            grouped_df = filtered_df.groupby('stage_name').size().reset_index(name='total')
-
-            # 🔵 Gráfico de Pizza (Proporção)
-            pie_chart = px.pie(
-                grouped_df, 
-                names='stage_name', 
-                values='total', 
-                hole=0.4,  
-                title="Distribuição Percentual dos Clientes Perdidos"
-            ).update_traces(
-                textposition='inside',
-                textinfo='percent',  # Mostra o percentual e o nome da categoria
-                insidetextorientation='radial'  # Ajusta o texto dentro da fatia
-            )
-
-            # 🔴 Gráfico de Barras (Quantidade)
-            bar_chart = px.bar(
-                grouped_df, 
-                x='stage_name', 
-                y='total', 
-                text='total',
-                title="Quantidade de Clientes Perdidos",
-                color='stage_name', 
-                labels={'total': 'Clientes'},
-            ).update_traces(
-                texttemplate='%{text}', 
-                textposition='outside'
-            ).update_layout(
-                yaxis=dict(range=[0, grouped_df['total'].max() * 1.2])  # Adiciona 20% de espaço extra no topo
-            )
-
-            # Layout lado a lado
-            return html.Div([
-                dcc.Graph(figure=pie_chart, style={'width': '48%', 'display': 'inline-block'}),
-                dcc.Graph(figure=bar_chart, style={'width': '48%', 'display': 'inline-block'}),
-            ])
 
-    return html.Div("Nenhum dado disponível", style={'textAlign': 'center', 'color': '#003366'})
 
 @app.callback(
-    Output('lost-reason-chart', 'figure'),
-    [Input({'type': 'date-filter', 'index': dash.ALL}, 'start_date'),
-     Input({'type': 'date-filter', 'index': dash.ALL}, 'end_date'),
-     Input('stage-detail-filter', 'value')]  # Filtro do stage_name
+    [Output('deal-table', 'data'),
+     Output('deal-table', 'page_count'),
+     Output('deal-table', 'page_current')],
+    [Input('deal-table', 'page_current'),
+     Input('deal-table', 'page_size'),
+     Input('deal-table', 'sort_by'),
+     Input('deal-table', 'filter_query'),
+     Input('stage-detail-filter', 'value')]
 )
-def update_loss_reason_chart(start_dates, end_dates, selected_stage_name):
-    fig = go.Figure()
-    df = process_data(deals, filter_by_status=None)
-
-    if not start_dates or not end_dates:
-        return fig  # Retorna gráfico vazio se não houver datas selecionadas
-
-    for i, (start_date, end_date) in enumerate(zip(start_dates, end_dates)):
-        if start_date and end_date:
-            start_date = datetime.fromisoformat(start_date).date()
-            end_date = datetime.fromisoformat(end_date).date()
-
-            # Filtra os clientes perdidos no intervalo de datas
-            filtered_df = df[(df['date_lost'] >= start_date) & 
-                             (df['date_lost'] <= end_date) & 
-                             (df['stage_status'] == 'Perdido')]
-
-            # Substitui valores vazios de 'loss_reason' por "Outro"
-            filtered_df['loss_reason'] = filtered_df['loss_reason'].fillna("Outro")
-
-            # Se um stage_name for selecionado, filtra por ele
-            if selected_stage_name != 'Geral':
-                filtered_df = filtered_df[filtered_df['stage_name'] == selected_stage_name]
-
-            # Conta os motivos de perda e ordena do maior para o menor
-            loss_reason_counts = (filtered_df.groupby('loss_reason')
-                                  .size()
-                                  .reset_index(name='total'))
-
-            # Soma total das perdas
-            total_losses = loss_reason_counts['total'].sum()
-
-            # Adiciona a barra "Total" com uma cor diferente
-            loss_reason_counts = pd.concat([
-                loss_reason_counts, 
-                pd.DataFrame({'loss_reason': ['Total'], 'total': [total_losses]})
-            ]).sort_values(by='total', ascending=False)
-
-            # Criar gráfico de barras com labels acima das barras
-            fig.add_trace(go.Bar(
-                x=loss_reason_counts['loss_reason'],
-                y=loss_reason_counts['total'],
-                text=loss_reason_counts['total'],  # Adiciona os valores
-                textposition='outside',  # Posiciona o texto acima das barras
-                marker_color=['#ff7f0e'] + ['#1f77b4'] * (len(loss_reason_counts) - 1),  # Azul padrão, última barra laranja
-                name=f'Filtro {i + 1}'
-            )).update_layout(
-                yaxis=dict(range=[0, loss_reason_counts['total'].max() * 1.2])
-            )
-
-    # Configuração do layout
-    fig.update_layout(
-        title="Motivos de Perda",
-        xaxis_title="Motivo de Perda",
-        yaxis_title="Total de Clientes Perdidos",
-        barmode='group',
-        uniformtext_minsize=8,  # Tamanho mínimo dos textos
-        uniformtext_mode='hide',  # Esconde textos sobrepostos
-        plot_bgcolor='rgba(0,0,0,0)', 
-        paper_bgcolor='rgba(0,0,0,0)', 
-        font={'color': '#003366'},
-        showlegend=True
+@metrics.timed('deal_table')
+def update_deal_table(page_current, page_size, sort_by, filter_query, selected_stage_name):
+    # Nova ordem, filtro ou funil voltam para a primeira página
+    if 'deal-table.page_current' not in dash.ctx.triggered_prop_ids:
+        page_current = 0
+    stage_name = None if selected_stage_name == 'Geral' else selected_stage_name
+    data, page_count, page_current = snapshots.current.deal_table.page(
+        page_current, page_size or DEAL_TABLE_PAGE_SIZE, stage_name, filter_query, sort_by)
+    return data, page_count, page_current
+
+
+@figure_cache.memoize('client-data', data_version)
+def client_data():
+    """Dados do snapshot atual para a filtragem no navegador (um conjunto por snapshot)."""
+    snap = snapshots.current
+    stages = ['Geral'] + sorted(snap.line_stages())
+    return client_dataset(
+        snap,
+        line_axes={stage: line_axis(snap.df_stage_mapping, stage)['stage_detail'] for stage in stages},
+        stage_outputs={stage: stage_outputs(stage) for stage in stages},
     )
 
-    return fig
 
+if CLIENTSIDE_FILTERING:
+    # Datas e funil filtrados no navegador (assets/dashboard_clientside.js)
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='update'),
+        DASHBOARD_OUTPUTS,
+        DASHBOARD_INPUTS + [Input('dashboard-data', 'data')],
+    )
 
-@app.callback(
-    Output('evolucao-leads', 'style'),  # Altera a visibilidade do gráfico
-    Input('stage-detail-filter', 'value')  # Monitora o dropdown
-)
-def toggle_graph_visibility(selected_stage):
-    if selected_stage == "Geral":
-        return {'display': 'block'}  # Mostra o gráfico
-    return {'display': 'none'}  # Esconde o gráfico
+    @app.callback(
+        [Output('dashboard-data', 'data'),
+         Output('dashboard-data-version', 'data')],
+        Input('dashboard-data-poll', 'n_intervals'),
+        State('dashboard-data-version', 'data'),
+        prevent_initial_call=True
+    )
+    def refresh_client_data(n_intervals, version):
+        # Só reenvia os dados quando o snapshot mudou
+        snap = snapshots.current
+        if snap is None or snap.fingerprint == version:
+            return dash.no_update, dash.no_update
+        return client_data(), snap.fingerprint
+else:
+    app.callback(DASHBOARD_OUTPUTS + [Output('charted-filters', 'data')], DASHBOARD_INPUTS,
+                 State('charted-filters', 'data'))(update_dashboard)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8050))
@@ -0,0 +1,190 @@
+// Filtragem no navegador (CLIENTSIDE_FILTERING=1): monta no cliente os gráficos que dependem
+// das datas e do funil a partir dos dados pré-agregados do snapshot (client_data.py), com o
+// mesmo resultado dos callbacks do servidor em app.py.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    dashboard: (function () {
+        var DAY_MS = 86400000;
+        var TRANSPARENT = 'rgba(0,0,0,0)';
+        var FONT = {color: '#003366'};
+
+        function toDay(value) {
+            // 'AAAA-MM-DD' (com ou sem hora) -> dias desde 1970-01-01, como em client_data._days
+            var s = String(value);
+            return Date.UTC(+s.slice(0, 4), +s.slice(5, 7) - 1, +s.slice(8, 10)) / DAY_MS;
+        }
+
+        function lowerBound(days, value) {
+            var lo = 0, hi = days.length;
+            while (lo < hi) {
+                var mid = (lo + hi) >> 1;
+                if (days[mid] < value) { lo = mid + 1; } else { hi = mid; }
+            }
+            return lo;
+        }
+
+        // Soma 'count' por `by` nas linhas com dia em [start, end]; `keep(i)` filtra as linhas
+        function rollup(table, by, start, end, keep) {
+            var totals = {};
+            var hi = lowerBound(table.day, end + 1);
+            for (var i = lowerBound(table.day, start); i < hi; i++) {
+                var code = table[by][i];
+                if (code < 0 || (keep && !keep(i))) { continue; }
+                totals[code] = (totals[code] || 0) + table.count[i];
+            }
+            var result = [];
+            Object.keys(totals).map(Number).sort(function (a, b) { return a - b; }).forEach(function (code) {
+                if (totals[code] > 0) {
+                    result.push([table[by + '_categories'][code], totals[code]]);
+                }
+            });
+            return result;
+        }
+
+        function figure(data, traces, layout) {
+            return {data: traces, layout: Object.assign({template: data.template}, layout || {})};
+        }
+
+        function component(namespace, type, props) {
+            return {namespace: namespace, type: type, props: props};
+        }
+
+        function noData() {
+            return component('dash_html_components', 'Div', {
+                children: 'Nenhum dado disponível', style: {textAlign: 'center', color: '#003366'}
+            });
+        }
+
+        function lineCounts(data, stage, start, end) {
+            if (stage === 'Geral') {
+                var line = data.line;
+                return rollup(line, 'stage_detail', start, end, function (i) {
+                    return line.alive[i] < 0 || line.alive[i] > end;
+                });
+            }
+            var table = data.line_in_stage;
+            var stageCode = table.stage_name_categories.indexOf(stage);
+            return rollup(table, 'stage_detail', start, end, function (i) {
+                return table.stage_name[i] === stageCode &&
+                    (table.alive_in_stage[i] < 0 || table.alive_in_stage[i] > end);
+            });
+        }
+
+        function lineChart(data, windows, stage) {
+            if (!windows.length) { return figure(data, []); }
+            var axis = data.line_axes[stage] || [];
+            var traces = windows.map(function (w) {
+                var totals = {};
+                lineCounts(data, stage, w[1], w[2]).forEach(function (pair) { totals[pair[0]] = pair[1]; });
+                return {
+                    type: 'scatter', mode: 'lines+markers', name: 'Filtro ' + (w[0] + 1),
+                    x: axis, y: axis.map(function (detail) { return totals[detail] || 0; })
+                };
+            });
+            return figure(data, traces, {
+                title: {text: 'Evolução por Stage Detail'},
+                xaxis: {title: {text: 'Stage Detail'}, categoryorder: 'array', categoryarray: axis},
+                yaxis: {title: {text: 'Total'}},
+                plot_bgcolor: TRANSPARENT, paper_bgcolor: TRANSPARENT, font: FONT, showlegend: true
+            });
+        }
+
+        function closedChart(data, counts, label) {
+            var names = counts.map(function (pair) { return pair[0]; });
+            var totals = counts.map(function (pair) { return pair[1]; });
+            var colors = (data.template.layout && data.template.layout.colorway) || [];
+            var pie = figure(data, [{
+                type: 'pie', name: '', labels: names, values: totals, hole: 0.4, textposition: 'inside',
+                textinfo: 'percent', insidetextorientation: 'radial'
+            }], {title: {text: 'Distribuição Percentual dos Clientes ' + label}, legend: {tracegroupgap: 0}});
+            var bar = figure(data, counts.map(function (pair, i) {
+                return {
+                    type: 'bar', name: pair[0], legendgroup: pair[0], offsetgroup: pair[0], x: [pair[0]],
+                    y: [pair[1]], text: [pair[1]], texttemplate: '%{text}', textposition: 'outside',
+                    marker: {color: colors.length ? colors[i % colors.length] : undefined}
+                };
+            }), {
+                title: {text: 'Quantidade de Clientes ' + label}, barmode: 'relative',
+                legend: {title: {text: 'stage_name'}, tracegroupgap: 0},
+                xaxis: {title: {text: 'stage_name'}, categoryorder: 'array', categoryarray: names},
+                yaxis: {title: {text: 'Clientes'}, range: [0, Math.max.apply(null, totals.concat([0])) * 1.2]}
+            });
+            var style = {width: '48%', display: 'inline-block'};
+            return component('dash_html_components', 'Div', {children: [
+                component('dash_core_components', 'Graph', {figure: pie, style: style}),
+                component('dash_core_components', 'Graph', {figure: bar, style: style})
+            ]});
+        }
+
+        function closedCharts(data, start, end) {
+            return [
+                closedChart(data, rollup(data.won, 'stage_name', start, end), 'Ganhos'),
+                closedChart(data, rollup(data.lost, 'stage_name', start, end), 'Perdidos')
+            ];
+        }
+
+        function lossReasonChart(data, windows, stage) {
+            var lost = data.lost;
+            var stageCode = lost.stage_name_categories.indexOf(stage);
+            var yRange = null;
+            var traces = windows.map(function (w) {
+                var counts = rollup(lost, 'loss_reason', w[1], w[2], stage === 'Geral' ? null : function (i) {
+                    return lost.stage_name[i] === stageCode;
+                });
+                // Motivos em ordem alfabética + "Total", do maior para o menor (empates na ordem
+                // anterior, como no sort_values(kind='stable') do servidor)
+                counts.sort(function (a, b) { return a[0] < b[0] ? -1 : a[0] > b[0] ? 1 : 0; });
+                var total = counts.reduce(function (sum, pair) { return sum + pair[1]; }, 0);
+                counts.push(['Total', total]);
+                counts = counts.map(function (pair, i) { return [pair[0], pair[1], i]; });
+                counts.sort(function (a, b) { return b[1] - a[1] || a[2] - b[2]; });
+                var values = counts.map(function (pair) { return pair[1]; });
+                yRange = [0, Math.max.apply(null, values) * 1.2];
+                return {
+                    type: 'bar', name: 'Filtro ' + (w[0] + 1), x: counts.map(function (pair) { return pair[0]; }),
+                    y: values, text: values, textposition: 'outside',
+                    marker: {color: values.map(function (_, i) { return i === 0 ? '#ff7f0e' : '#1f77b4'; })}
+                };
+            });
+            var layout = {
+                title: {text: 'Motivos de Perda'}, xaxis: {title: {text: 'Motivo de Perda'}},
+                yaxis: {title: {text: 'Total de Clientes Perdidos'}}, barmode: 'group',
+                uniformtext: {minsize: 8, mode: 'hide'}, plot_bgcolor: TRANSPARENT, paper_bgcolor: TRANSPARENT,
+                font: FONT, showlegend: true
+            };
+            if (yRange) { layout.yaxis.range = yRange; }  // Escala do último filtro
+            return figure(data, traces, layout);
+        }
+
+        return {
+            update: function (startDates, endDates, stage, data) {
+                var noUpdate = window.dash_clientside.no_update;
+                if (!data) { return [noUpdate, noUpdate, noUpdate, noUpdate, noUpdate, noUpdate, noUpdate]; }
+
+                var stageOutputs = data.stage_outputs[stage] || [noUpdate, noUpdate, noUpdate];
+                if (!startDates || !startDates.length || !endDates || !endDates.length) {
+                    var empty = stage === 'Geral' ? noData() : null;
+                    return [figure(data, []), empty, empty, figure(data, [])].concat(stageOutputs);
+                }
+
+                var windows = [];
+                startDates.forEach(function (start, i) {
+                    if (start && endDates[i]) { windows.push([i, toDay(start), toDay(endDates[i])]); }
+                });
+
+                // Ganhos e perdidos só no "Geral", com o primeiro filtro preenchido
+                var won = null, lost = null;
+                if (stage === 'Geral') {
+                    won = lost = noData();
+                    if (windows.length) {
+                        var closed = closedCharts(data, windows[0][1], windows[0][2]);
+                        won = closed[0];
+                        lost = closed[1];
+                    }
+                }
+                return [
+                    lineChart(data, windows, stage), won, lost, lossReasonChart(data, windows, stage)
+                ].concat(stageOutputs);
+            }
+        };
+    })()
+});
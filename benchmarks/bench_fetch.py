@@ -0,0 +1,45 @@
+"""Compara o crawler sequencial com o concorrente contra o stub local.
+
+Uso: python -m benchmarks.bench_fetch --deals 20000 --latency 0.05 --workers 1 4 8
+"""
+import argparse
+import time
+
+from agendor import fetch_data
+from benchmarks.stub_api import StubAgendorAPI
+from benchmarks.synthetic import make_deals
+
+
+def run(deals, latency, workers_list, per_page, rate_limit):
+    stub = StubAgendorAPI(make_deals(deals), latency=latency, rate_limit_ratio=rate_limit).start()
+    results = []
+    try:
+        reference = None
+        for workers in workers_list:
+            started = time.perf_counter()
+            fetched = fetch_data(workers=workers, per_page=per_page, url=stub.url)
+            elapsed = time.perf_counter() - started
+
+            if reference is None:
+                reference = fetched
+            assert fetched == reference, f"workers={workers} retornou uma lista diferente"
+            results.append({'workers': workers, 'deals': len(fetched), 'seconds': round(elapsed, 3)})
+            print(f"workers={workers:>3}  deals={len(fetched):>8}  {elapsed:8.3f}s", flush=True)
+    finally:
+        stub.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--deals', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--per-page', type=int, default=100)
+    parser.add_argument('--rate-limit', type=float, default=0.0)
+    args = parser.parse_args()
+    run(args.deals, args.latency, args.workers, args.per_page, args.rate_limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Throughput da ingestão (process_data) antiga vs. colunar com deals sintéticos.
+
+Uso: python -m benchmarks.bench_ingest --sizes 10000 100000 1000000
+"""
+import argparse
+import gc
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import make_deals
+from processing import process_data
+
+
+def process_data_legacy(deals, filter_by_status='Em andamento'):
+    """Implementação original (laço por deal + apply), mantida só como referência."""
+    deal_by_stage = {
+        'stage_detail': [], 'stage_name': [], 'stage_number': [], 'stage_status': [],
+        'person': [], 'title': [], 'date_created': [], 'date_lost': [], 'date_won': [],
+        'organization': [], 'description': [], 'loss_reason': []
+    }
+
+    for deal in deals:
+        deal_by_stage['stage_detail'].append(deal['dealStage']['name'])
+        deal_by_stage['stage_number'].append(int(deal['dealStage']['sequence']))
+        deal_by_stage['stage_name'].append(deal['dealStage']['funnel']['name'])
+        deal_by_stage['stage_status'].append(deal['dealStatus']['name'])
+        if deal['lossReason']:
+            deal_by_stage['loss_reason'].append(deal['lossReason']['name'])
+        else:
+            deal_by_stage['loss_reason'].append(None)
+        if deal['person']:
+            deal_by_stage['person'].append(deal.get('person', {}).get('id'))
+        else:
+            deal_by_stage['person'].append(None)
+        if deal['organization']:
+            deal_by_stage['organization'].append(deal.get('organization', {}).get('id'))
+        else:
+            deal_by_stage['organization'].append(None)
+        deal_by_stage['date_created'].append(deal['createdAt'])
+        deal_by_stage['date_won'].append(deal['wonAt'])
+        deal_by_stage['date_lost'].append(deal['lostAt'])
+        deal_by_stage['title'].append(deal['title'])
+        deal_by_stage['description'].append(deal['description'])
+
+    df = pd.DataFrame(deal_by_stage)
+    df['id'] = df['person'].fillna(df['organization'])
+    df['type'] = df['person'].apply(lambda x: 'person' if pd.notna(x) else 'organization')
+    df = df.drop(columns=['person', 'organization'])
+    df['stage_name'] = df['stage_name'].str.replace(r'^\d+\s*', '', regex=True)
+    df['date_created'] = pd.to_datetime(df['date_created']).dt.date
+    df['date_won'] = pd.to_datetime(df['date_won']).dt.date
+    df['date_lost'] = pd.to_datetime(df['date_lost']).dt.date
+    if filter_by_status:
+        df = df[df['stage_status'] == 'Em andamento']
+    return df
+
+
+def as_legacy_schema(df):
+    """Converte o frame tipado (categorias, datetime64, int16) para os tipos da versão antiga."""
+    # deal_id só existe no frame novo (localiza o deal nos eventos de webhook)
+    df = df.drop(columns=['deal_id'])
+    for name in df.columns:
+        values = df[name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            df[name] = values.astype(object).where(values.notna(), None)
+        elif values.dtype.kind == 'M':
+            df[name] = values.dt.date
+    df['stage_number'] = df['stage_number'].astype('int64')
+    return df
+
+
+def _timed(func, *args, **kwargs):
+    gc.collect()
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def run(sizes, check=True):
+    results = []
+    for size in sizes:
+        deals = make_deals(size)
+        legacy, legacy_seconds = _timed(process_data_legacy, deals, filter_by_status=False)
+        columnar, columnar_seconds = _timed(process_data, deals, filter_by_status=False)
+        if check:
+            pd.testing.assert_frame_equal(legacy, as_legacy_schema(columnar))
+        del legacy, columnar, deals
+
+        row = {
+            'deals': size,
+            'legacy_seconds': round(legacy_seconds, 3),
+            'columnar_seconds': round(columnar_seconds, 3),
+            'legacy_deals_per_second': round(size / legacy_seconds),
+            'columnar_deals_per_second': round(size / columnar_seconds),
+            'speedup': round(legacy_seconds / columnar_seconds, 2),
+        }
+        results.append(row)
+        print(f"{size:>9} deals  antigo {legacy_seconds:7.2f}s  colunar {columnar_seconds:7.2f}s  "
+              f"({row['columnar_deals_per_second']:,} deals/s, {row['speedup']}x)", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--no-check', action='store_true', help='não compara as saídas')
+    args = parser.parse_args()
+    run(args.sizes, check=not args.no_check)
+
+
+if __name__ == '__main__':
+    main()
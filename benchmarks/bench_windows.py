@@ -0,0 +1,69 @@
+"""Roll-up de várias janelas de datas: uma chamada por janela vs. `rollup_windows`.
+
+Uso: python -m benchmarks.bench_windows --deals 200000 --windows 1 5 10
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_deals
+from snapshot import build_snapshot
+
+# (cubo, dimensão, filtro, coluna alive) como nos gráficos de linha e de motivos de perda
+QUERIES = {
+    'linha': ('created', 'stage_detail', None, 'alive'),
+    'motivos': ('lost', 'loss_reason', {'stage_status': 'Perdido'}, None),
+}
+
+
+def _windows(count, seed=0):
+    rng = np.random.default_rng(seed)
+    days = pd.date_range('2023-01-01', '2024-12-31')
+    return [tuple(sorted(rng.choice(days, 2))) for _ in range(count)]
+
+
+def _best(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def run(deals, window_counts, repeat=5):
+    snap = build_snapshot(make_deals(deals), version=1)
+    results = []
+    for name, (cube_name, by, where, alive) in QUERIES.items():
+        cube = snap.cubes[cube_name]
+        for count in window_counts:
+            windows = _windows(count)
+            looped, loop_seconds = _best(
+                lambda: [cube.rollup(by, start, end, where=where, alive=alive) for start, end in windows], repeat)
+            batched, batch_seconds = _best(lambda: cube.rollup_windows(by, windows, where=where, alive=alive), repeat)
+            for a, b in zip(looped, batched):
+                pd.testing.assert_series_equal(a, b, check_names=False)
+
+            row = {
+                'query': name, 'deals': deals, 'windows': count,
+                'loop_ms': round(loop_seconds * 1000, 2), 'batched_ms': round(batch_seconds * 1000, 2),
+            }
+            results.append(row)
+            print(f"{name:>8}  {count:>3} janelas  por janela {row['loop_ms']:8.2f}ms  "
+                  f"em lote {row['batched_ms']:8.2f}ms", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--deals', type=int, default=200_000)
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 5, 10])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.deals, args.windows, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
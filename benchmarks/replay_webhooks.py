@@ -0,0 +1,193 @@
+"""Reproduz eventos de webhook gravados (WEBHOOK_RECORD_PATH) e mede o tempo de cada corpo.
+
+Sem --url os eventos são aplicados localmente (WebhookIngest) sobre um snapshot de deals
+sintéticos e, com --check, o resultado final é comparado a uma reconstrução completa a
+partir dos mesmos deals; com --url os corpos são enviados ao endpoint de um servidor.
+--generate N grava antes N eventos sintéticos (com reenvios e eventos fora de ordem).
+
+Uso: python -m benchmarks.replay_webhooks eventos.jsonl --generate 200 --deals 100000 --check
+     python -m benchmarks.replay_webhooks eventos.jsonl --url http://localhost:8050/webhooks/agendor --token $WEBHOOK_TOKEN
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+import urllib.request
+from datetime import timedelta
+
+import numpy as np
+
+from benchmarks.synthetic import EPOCH, _iso, make_deal, make_deals
+from deal_store import parse_timestamp
+from processing import process_data
+from snapshot import SnapshotRefresher, snapshot_from_frame
+from timeseries import GRANULARITIES
+from webhooks import WebhookIngest
+
+
+def generate_events(deals, count, seed=7):
+    """Corpos de webhook sintéticos sobre `deals`: criações, mudanças de estágio e status,
+    remoções, mais alguns reenvios e eventos atrasados (que devem ser descartados).
+
+    Alguns eventos trazem updatedAt sem fuso (UTC) e alguns corpos juntam dois eventos,
+    misturando datas com e sem fuso; outros trazem updatedAt numérico e devem sair como
+    'invalid' sem alterar nada.
+    """
+    rng = random.Random(seed)
+    clients = max(1, int(len(deals) / 1.5))
+    current = {deal['id']: deal for deal in deals}
+    next_id = max(current) + 1
+    clock = EPOCH + timedelta(days=800)
+    bodies = []
+    for _ in range(count):
+        clock += timedelta(seconds=rng.randrange(1, 600))
+        kind = rng.random()
+        if kind < 0.2:
+            deal = dict(make_deal(next_id, rng, clients), updatedAt=_iso(clock))
+            next_id += 1
+            event = 'deal_created'
+        elif kind < 0.3:
+            deal = {'id': rng.choice(list(current)), 'updatedAt': _iso(clock)}
+            event = 'deal_deleted'
+        else:
+            other = current[rng.choice(list(current))]
+            deal = dict(current[rng.choice(list(current))], updatedAt=_iso(clock))
+            field = rng.choice(['dealStage', 'dealStatus', 'person'])
+            deal[field] = other[field]
+            if field == 'dealStatus':
+                deal.update(wonAt=other['wonAt'], lostAt=other['lostAt'], lossReason=other['lossReason'])
+            elif field == 'person':
+                deal['organization'] = other['organization']
+            event = 'deal_updated'
+        if rng.random() < 0.1:
+            deal['updatedAt'] = clock.replace(tzinfo=None).isoformat()  # sem fuso
+        if event == 'deal_deleted':
+            current.pop(deal['id'], None)
+        else:
+            current[deal['id']] = deal
+        body = {'event': event, 'data': deal}
+        if rng.random() < 0.05 and bodies and not isinstance(bodies[-1], list):
+            body = [bodies.pop(), body]  # dois eventos no mesmo corpo
+        bodies.append(body)
+        if rng.random() < 0.03:
+            other = current[rng.choice(list(current))]
+            bodies.append({'event': 'deal_updated', 'data': dict(other, title='NUMÉRICO',
+                                                                  updatedAt=int(clock.timestamp()) + 1)})
+        if rng.random() < 0.1:
+            bodies.append(body)  # reenvio
+        if rng.random() < 0.05 and len(bodies) > 3:
+            bodies.insert(len(bodies) - 3, bodies[-1])  # chega fora de ordem
+    return bodies
+
+
+def _post(url, body, token):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), method='POST',
+                                     headers={'Content-Type': 'application/json', 'X-Webhook-Token': token})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def _normalized(table):
+    table = table.reset_index(drop=True)
+    table = table.astype(object).where(table.notna(), None).astype(str)
+    return table.sort_values(list(table.columns)).reset_index(drop=True)
+
+
+def check(snap, deals):
+    """Compara os agregados do snapshot incremental com os de uma reconstrução completa."""
+    full = snapshot_from_frame(process_data(deals, filter_by_status=False), snap.version)
+    for name in full.cubes:
+        assert _normalized(snap.cubes[name].table).equals(_normalized(full.cubes[name].table)), name
+    for name in ('df_bar', 'stage_counts', 'df_stage_mapping', 'df_stage_counts'):
+        assert _normalized(getattr(snap, name)).equals(_normalized(getattr(full, name))), name
+    for granularity in GRANULARITIES:
+        assert snap.daily_counts.series(granularity=granularity).equals(full.daily_counts.series(granularity=granularity))
+    for status in (None, 'Em andamento'):
+        assert snap.processed(status)['deal_id'].tolist() == full.processed(status)['deal_id'].tolist(), status
+
+
+def replay_local(bodies, deals, verify):
+    refresher = SnapshotRefresher(lambda: None, 0)
+    refresher.warm_start(lambda: snapshot_from_frame(process_data(deals, filter_by_status=False), 1))
+    ingest = WebhookIngest(refresher)
+    seconds, results = [], {}
+    for body in bodies:
+        started = time.perf_counter()
+        summary = ingest.handle(body)
+        seconds.append(time.perf_counter() - started)
+        for result, count in summary.items():
+            if result != 'version':
+                results[result] = results.get(result, 0) + count
+    if verify:
+        # Estado final esperado: ordem de chegada dos deals, removidos fora
+        final = {deal['id']: deal for deal in deals}
+        states, invalid = _final_states(bodies)
+        assert results.get('invalid', 0) == invalid, (results, invalid)
+        for deal_id, (action, deal) in states.items():
+            if action == 'delete':
+                final.pop(deal_id, None)
+            else:
+                final[deal_id] = deal
+        check(refresher.current, list(final.values()))
+    return seconds, results
+
+
+def _final_states(bodies):
+    # Último evento (maior updatedAt) de cada deal, na ordem em que o deal apareceu; eventos
+    # com updatedAt que não é data ficam de fora e são contados
+    states, invalid = {}, 0
+    for body in bodies:
+        for item in body if isinstance(body, list) else [body]:
+            deal = item['data']
+            try:
+                when = parse_timestamp(deal['updatedAt'])
+            except (TypeError, ValueError):
+                invalid += 1
+                continue
+            seen = states.get(deal['id'])
+            if seen is None or seen[0] < when:
+                states[deal['id']] = (when, 'delete' if item['event'].endswith('_deleted') else 'upsert', deal)
+    return {deal_id: (action, deal) for deal_id, (_, action, deal) in states.items()}, invalid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('events', help='arquivo JSONL com um corpo de webhook por linha')
+    parser.add_argument('--url', help='endpoint do webhook de um servidor rodando')
+    parser.add_argument('--token', default='', help='WEBHOOK_TOKEN do servidor (com --url)')
+    parser.add_argument('--deals', type=int, default=100_000, help='deals sintéticos do snapshot local')
+    parser.add_argument('--generate', type=int, default=0, help='grava N eventos sintéticos antes')
+    parser.add_argument('--check', action='store_true', help='compara com a reconstrução completa')
+    args = parser.parse_args()
+
+    deals = make_deals(args.deals)
+    if args.generate:
+        with open(args.events, 'w', encoding='utf-8') as file:
+            for body in generate_events(deals, args.generate):
+                file.write(json.dumps(body, ensure_ascii=False) + '\n')
+    with open(args.events, encoding='utf-8') as file:
+        bodies = [json.loads(line) for line in file if line.strip()]
+
+    if args.url:
+        seconds, results = [], {}
+        for body in bodies:
+            started = time.perf_counter()
+            summary = _post(args.url, body, args.token)
+            seconds.append(time.perf_counter() - started)
+            for result, count in summary.items():
+                if result != 'version':
+                    results[result] = results.get(result, 0) + count
+    else:
+        seconds, results = replay_local(bodies, deals, args.check)
+
+    ms = np.array(seconds) * 1000
+    print(f"{len(bodies)} corpos  {results}", flush=True)
+    print(f"por corpo: mediana {statistics.median(ms):.1f}ms  p95 {np.percentile(ms, 95):.1f}ms  "
+          f"máx {ms.max():.1f}ms  total {ms.sum() / 1000:.2f}s", flush=True)
+    if args.check and not args.url:
+        print('igual à reconstrução completa', flush=True)
+
+
+if __name__ == '__main__':
+    main()
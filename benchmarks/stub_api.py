@@ -0,0 +1,128 @@
+"""Servidor local que imita a paginação do endpoint /v3/deals do Agendor.
+
+Uso: python -m benchmarks.stub_api --deals 20000 --port 8765 --latency 0.05
+e depois AGENDOR_URL=http://127.0.0.1:8765/v3/deals python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from agendor import UPDATED_SINCE_PARAM
+from benchmarks.synthetic import make_deals
+from deal_store import parse_timestamp
+
+
+class StubAgendorAPI:
+    """Guarda os deals em memória e serve páginas com latência e 429 opcionais."""
+
+    def __init__(self, deals, latency=0.0, rate_limit_ratio=0.0, retry_after=0, seed=0):
+        self.deals = deals
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rate_limited = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v3/deals"
+
+    def select(self, query):
+        """Aplica os filtros suportados da query string (hoje só a data de atualização)."""
+        if UPDATED_SINCE_PARAM in query:
+            since = parse_timestamp(query[UPDATED_SINCE_PARAM][-1])
+            return [deal for deal in self.deals if parse_timestamp(deal['updatedAt']) > since]
+        return self.deals
+
+    def page(self, query, base_url):
+        page = int(query.get('page', ['1'])[0])
+        per_page = int(query.get('per_page', ['100'])[-1])
+        deals = self.select(query)
+        start = (page - 1) * per_page
+        data = deals[start:start + per_page]
+        has_next = start + per_page < len(deals)
+        next_query = {key: values[-1] for key, values in query.items() if key not in ('page', 'per_page')}
+        next_url = f"{base_url}?" + urlencode(dict(next_query, page=page + 1, per_page=per_page))
+        return {
+            'data': data,
+            'links': {'next': next_url if has_next else None},
+            'meta': {'totalCount': len(deals)},
+        }
+
+    def _should_rate_limit(self):
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit_ratio and self._rng.random() < self.rate_limit_ratio:
+                self.rate_limited += 1
+                return True
+        return False
+
+    def start(self, host='127.0.0.1', port=0):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, extra_headers=()):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for key, value in extra_headers:
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path != '/v3/deals':
+                    return self._send(404, {'error': 'not found'})
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub._should_rate_limit():
+                    return self._send(429, {'error': 'rate limited'}, [('Retry-After', str(stub.retry_after))])
+                base_url = f"http://{self.headers.get('Host')}{parsed.path}"
+                self._send(200, stub.page(parse_qs(parsed.query), base_url))
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--deals', type=int, default=10000)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='segundos por requisição')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='fração de respostas 429')
+    args = parser.parse_args()
+
+    stub = StubAgendorAPI(make_deals(args.deals), latency=args.latency, rate_limit_ratio=args.rate_limit)
+    stub.start(port=args.port)
+    print(f"Stub do Agendor em {stub.url} com {args.deals} deals", flush=True)
+    try:
+        stub._thread.join()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
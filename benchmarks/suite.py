@@ -0,0 +1,286 @@
+"""Suíte de benchmarks: busca, processamento e callbacks do dashboard em vários tamanhos.
+
+Cada cenário roda com deals sintéticos (benchmarks.synthetic) servidos pelo stub local
+da API; os tempos são gravados em JSON para comparar commits.
+
+Uso: python -m benchmarks.suite --sizes 10000 100000 1000000 --output resultados.json
+     python -m benchmarks.suite --compare base.json resultados.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Filtros de data usados nos cenários de callback (dois filtros preenchidos)
+WINDOWS = [('2023-03-01', '2023-06-30'), ('2024-01-01', '2024-03-31')]
+FUNNEL = 'VAREJO'
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _measure(func, repeat):
+    """Executa `func` `repeat` vezes; retorna (resultado da última, lista de segundos)."""
+    seconds = []
+    for _ in range(repeat):
+        result = None  # libera o resultado anterior antes de medir de novo
+        gc.collect()
+        started = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - started)
+    return result, seconds
+
+
+class DashClient:
+    """Chama os callbacks pelo endpoint do Dash (serialização incluída), como o navegador."""
+
+    def __init__(self, dash_app):
+        self.app = dash_app
+        self.client = dash_app.server.test_client()
+
+    def _callback(self, output):
+        for key, entry in self.app.callback_map.items():
+            if output in key.strip('.').split('...'):
+                return key, entry
+        raise KeyError(output)
+
+    def post(self, output, inputs, changed=(), state=None):
+        key, entry = self._callback(output)
+        outputs = [dict(zip(('id', 'property'), item.rsplit('.', 1))) for item in key.strip('.').split('...')]
+        body = {
+            'output': key,
+            'outputs': outputs if key.startswith('..') else outputs[0],
+            'inputs': inputs,
+            'changedPropIds': list(changed),
+        }
+        if entry.get('state'):
+            body['state'] = [{'id': spec['id'], 'property': spec['property'], 'value': state}
+                             for spec in entry['state']]
+        response = self.client.post('/_dash-update-component', json=body)
+        if response.status_code not in (200, 204):
+            raise RuntimeError(f"{output}: HTTP {response.status_code} {response.get_data()[:200]!r}")
+        return response
+
+    def dashboard(self, windows, stage, changed=(), charted=None):
+        def dates(prop, values):
+            return [{'id': {'type': 'date-filter', 'index': i}, 'property': prop, 'value': value}
+                    for i, value in enumerate(values)]
+        inputs = [dates('start_date', [start for start, _ in windows]),
+                  dates('end_date', [end for _, end in windows]),
+                  {'id': 'stage-detail-filter', 'property': 'value', 'value': stage}]
+        return self.post('line-chart.figure', inputs, changed, state=charted)
+
+    def deal_table(self, page, sort_by=(), filter_query='', stage='Geral', changed=('deal-table.page_current',)):
+        inputs = [{'id': 'deal-table', 'property': 'page_current', 'value': page},
+                  {'id': 'deal-table', 'property': 'page_size', 'value': 20},
+                  {'id': 'deal-table', 'property': 'sort_by', 'value': list(sort_by)},
+                  {'id': 'deal-table', 'property': 'filter_query', 'value': filter_query},
+                  {'id': 'stage-detail-filter', 'property': 'value', 'value': stage}]
+        return self.post('deal-table.data', inputs, changed)
+
+    def leads(self, start, end, granularity):
+        inputs = [{'id': 'leads-date-range', 'property': 'start_date', 'value': start},
+                  {'id': 'leads-date-range', 'property': 'end_date', 'value': end},
+                  {'id': 'leads-granularity', 'property': 'value', 'value': granularity}]
+        return self.post('leads-chart.figure', inputs, ['leads-granularity.value'])
+
+    def export(self, file_format, windows, stage):
+        query = [('format', file_format), ('stage', stage)]
+        for start, end in windows:
+            query += [('start', start), ('end', end)]
+        response = self.client.get('/export/deals', query_string=query)
+        if response.status_code != 200:
+            raise RuntimeError(f"export: HTTP {response.status_code} {response.get_data()[:200]!r}")
+        return response.get_data()
+
+    def add_filter(self, n_clicks):
+        inputs = [{'id': 'add-filter-btn', 'property': 'n_clicks', 'value': n_clicks}, []]
+        return self.post('date-filters-container.children', inputs, ['add-filter-btn.n_clicks'])
+
+
+def callback_scenarios(client):
+    """Cenários de interação: carga inicial, troca de funil, um filtro alterado e novo filtro.
+
+    Mudar o primeiro filtro também refaz os gráficos de ganhos/perdidos; mudar o segundo
+    só gera o Patch das linhas e barras desse filtro. Na tabela de deals a consulta (filtro +
+    ordem) fica em cache depois da primeira chamada, então o cenário mede a troca de página.
+    A evolução de leads pede o histórico inteiro por semana (somas acumuladas por dia); a
+    exportação baixa em CSV os deals do funil nas janelas dos filtros (arquivo inteiro lido).
+    """
+    # Estado que o navegador guarda após a carga inicial (filtros desenhados + snapshot)
+    charted = client.dashboard(WINDOWS, 'Geral').get_json()['response']['charted-filters']['data']
+    first_moved = [(WINDOWS[0][0], '2023-07-31')] + WINDOWS[1:]
+    second_moved = WINDOWS[:1] + [(WINDOWS[1][0], '2024-04-30')]
+    return {
+        'callback:dashboard_inicial': lambda: client.dashboard(WINDOWS, 'Geral'),
+        'callback:dashboard_funil': lambda: client.dashboard(WINDOWS, FUNNEL, ['stage-detail-filter.value'], charted),
+        'callback:dashboard_primeiro_filtro': lambda: client.dashboard(
+            first_moved, 'Geral', ['{"index":0,"type":"date-filter"}.end_date'], charted),
+        'callback:dashboard_segundo_filtro': lambda: client.dashboard(
+            second_moved, 'Geral', ['{"index":1,"type":"date-filter"}.end_date'], charted),
+        'callback:adicionar_filtro': lambda: client.add_filter(1),
+        'callback:tabela_deals_pagina': lambda: client.deal_table(
+            5, [{'column_id': 'date_created', 'direction': 'desc'}], '{stage_name} icontains varejo'),
+        'callback:evolucao_leads_semanal': lambda: client.leads('2023-01-01', '2024-12-31', 'W'),
+        'export:csv_funil': lambda: client.export('csv', WINDOWS, FUNNEL),
+        'layout': lambda: client.client.get('/_dash-layout'),
+    }
+
+
+def run(sizes, repeat=3, fetch_repeat=1, skip=()):
+    # O app lê a URL da API e o cache na importação: o stub sobe antes e o cache de figuras
+    # fica desligado para que cada chamada seja recalculada
+    port = _free_port()
+    os.environ.update({
+        'AGENDOR_URL': f'http://127.0.0.1:{port}/v3/deals',
+        'REFRESH_INTERVAL': '0',
+        'FIGURE_CACHE_SIZE': '0',
+    })
+    for name in ('DEAL_STORE_PATH', 'SHARED_SNAPSHOT_DIR', 'FIGURE_CACHE_DIR', 'EXPORT_PATH'):
+        os.environ.pop(name, None)
+
+    from agendor import fetch_columns, fetch_data
+    from benchmarks.stub_api import StubAgendorAPI
+    from benchmarks.synthetic import make_deals
+    from processing import process_bar_data, process_data, process_line_data
+    from snapshot import build_snapshot
+
+    results = []
+
+    def record(scenario, size, func, times):
+        if any(scenario.startswith(prefix) for prefix in skip):
+            return None
+        result, seconds = _measure(func, times)
+        row = {
+            'scenario': scenario,
+            'deals': size,
+            'runs': len(seconds),
+            'best_seconds': round(min(seconds), 6),
+            'median_seconds': round(statistics.median(seconds), 6),
+        }
+        row['deals_per_second'] = round(size / row['best_seconds']) if row['best_seconds'] else None
+        results.append(row)
+        print(f"{scenario:<36} {size:>9} deals  melhor {row['best_seconds'] * 1000:10.2f}ms  "
+              f"mediana {row['median_seconds'] * 1000:10.2f}ms", flush=True)
+        return result
+
+    stub = StubAgendorAPI([]).start(port=port)
+    dash_app = None
+    try:
+        for size in sizes:
+            deals = make_deals(size)
+            stub.deals = deals
+
+            record('fetch_data', size, lambda: fetch_data(url=stub.url), fetch_repeat)
+            record('fetch_columns', size, lambda: fetch_columns(url=stub.url), fetch_repeat)
+
+            df_all = record('process_data', size, lambda: process_data(deals, filter_by_status=False), repeat)
+            if df_all is None:
+                df_all = process_data(deals, filter_by_status=False)
+            df = df_all[df_all['stage_status'] == 'Em andamento']
+            record('process_line_data', size, lambda: process_line_data(df), repeat)
+            record('process_bar_data', size, lambda: process_bar_data(df), repeat)
+            record('build_snapshot', size, lambda: build_snapshot(deals, version=1), repeat)
+            del df_all, df
+
+            # Callbacks contra o snapshot deste tamanho, carregado pelo caminho normal do app
+            if dash_app is None:
+                import app as dash_app
+                while dash_app.snapshots.current is None:
+                    if dash_app.snapshots.last_error:
+                        raise RuntimeError(dash_app.snapshots.last_error)
+                    time.sleep(0.05)
+            else:
+                dash_app.snapshots.refresh()
+            client = DashClient(dash_app.app)
+            for scenario, func in callback_scenarios(client).items():
+                record(scenario, size, func, repeat)
+
+            del deals
+            stub.deals = []
+    finally:
+        stub.stop()
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import dash
+    import numpy as np
+    import pandas as pd
+    return {
+        'commit': _git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'dash': dash.__version__,
+    }
+
+
+def compare(base_path, new_path, threshold):
+    """Compara dois resultados pelo melhor tempo; retorna as linhas que pioraram além de `threshold`."""
+    with open(base_path, encoding='utf-8') as f:
+        base = {(row['scenario'], row['deals']): row for row in json.load(f)['results']}
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)['results']
+
+    regressions = []
+    for row in new:
+        old = base.get((row['scenario'], row['deals']))
+        if old is None or not old['best_seconds']:
+            continue
+        ratio = row['best_seconds'] / old['best_seconds']
+        flag = ''
+        if ratio > threshold:
+            regressions.append(row)
+            flag = '  <- regressão'
+        print(f"{row['scenario']:<36} {row['deals']:>9} deals  {old['best_seconds'] * 1000:10.2f}ms -> "
+              f"{row['best_seconds'] * 1000:10.2f}ms  ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--fetch-repeat', type=int, default=1, help='repetições dos cenários de busca (HTTP)')
+    parser.add_argument('--skip', nargs='*', default=[], help="prefixos de cenários a pular (ex.: fetch callback:)")
+    parser.add_argument('--output', help='arquivo JSON com os resultados')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NOVO'), help='compara dois arquivos de resultados')
+    parser.add_argument('--threshold', type=float, default=1.2, help='razão de tempo considerada regressão')
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    results = run(args.sizes, args.repeat, args.fetch_repeat, tuple(args.skip))
+    report = {'environment': environment(), 'args': vars(args), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultados gravados em {args.output}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Gerador de deals sintéticos no mesmo formato da API /v3/deals do Agendor."""
+import random
+from datetime import datetime, timedelta, timezone
+
+# Funis e estágios no formato usado pelo dashboard ('X.Y NOME')
+FUNNELS = {
+    '1 AMBULANTE ESSENCIAL': ['CONTATO', '1.1 LEADS', '1.2 QUALIFICAÇÃO', '2.1 VALIDAÇÃO', '3.1 ATIVOS'],
+    '2 VAREJO': ['CONTATO', '1.1 LEADS', 'TYPEFORM', '2.1 VALIDAÇÃO', '2.2 PROPOSTA', 'CONTRATO', '5.1 PAUSADO'],
+    '3 ATACADO': ['1.1 LEADS', '2.1 VALIDAÇÃO', '2.2 PROPOSTA', '3.1 ATIVOS', '3.2 RECORRENTES', '6.1 ARQUIVO'],
+    '4 FRANQUIAS': ['1.1 LEADS', '1.2 QUALIFICAÇÃO', '2.1 VALIDAÇÃO', '3.1 ATIVOS'],
+}
+STATUSES = ['Em andamento'] * 6 + ['Ganho'] * 2 + ['Perdido'] * 2
+LOSS_REASONS = ['Preço', 'Sem resposta', 'Concorrente', 'Sem interesse', None]
+DESCRIPTIONS = ['', 'Cliente CA', 'Indicação', None, 'Retorno CA pendente', 'Feira']
+
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+
+def _iso(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def _stage(funnel, sequence, _cache={}):
+    # Sub-objetos imutáveis são compartilhados entre deals para caber 1M deals em memória
+    key = (funnel, sequence)
+    if key not in _cache:
+        funnel_id = list(FUNNELS).index(funnel) + 1
+        _cache[key] = {
+            'id': funnel_id * 100 + sequence + 1,
+            'name': FUNNELS[funnel][sequence],
+            'sequence': sequence + 1,
+            'funnel': {'id': funnel_id, 'name': funnel},
+        }
+    return _cache[key]
+
+
+def make_deal(deal_id, rng, clients, span_days=730):
+    funnel = rng.choice(list(FUNNELS))
+    sequence = rng.randrange(len(FUNNELS[funnel]))
+    status = rng.choice(STATUSES)
+    created = EPOCH + timedelta(days=rng.randrange(span_days), seconds=rng.randrange(86400))
+    closed = created + timedelta(days=rng.randrange(1, 90))
+    updated = max(created, closed if status != 'Em andamento' else created + timedelta(hours=rng.randrange(1, 500)))
+
+    client = rng.randrange(clients)
+    is_person = client % 3 != 0
+    reason = rng.choice(LOSS_REASONS) if status == 'Perdido' else None
+
+    return {
+        'id': deal_id,
+        'title': f'Negócio {deal_id}',
+        'description': rng.choice(DESCRIPTIONS),
+        'dealStage': _stage(funnel, sequence),
+        'dealStatus': {'id': STATUSES.index(status) + 1, 'name': status},
+        'lossReason': {'id': LOSS_REASONS.index(reason) + 1, 'name': reason} if reason else None,
+        'person': {'id': client, 'name': f'Pessoa {client}'} if is_person else None,
+        'organization': None if is_person else {'id': client, 'name': f'Empresa {client}'},
+        'createdAt': _iso(created),
+        'updatedAt': _iso(updated),
+        'wonAt': _iso(closed) if status == 'Ganho' else None,
+        'lostAt': _iso(closed) if status == 'Perdido' else None,
+    }
+
+
+def make_deals(n, seed=42, clients=None):
+    """Gera `n` deals determinísticos; por padrão ~1.5 deals por cliente."""
+    rng = random.Random(seed)
+    clients = clients or max(1, int(n / 1.5))
+    return [make_deal(deal_id, rng, clients) for deal_id in range(1, n + 1)]
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+from cube import ALIVE_FOREVER
+
+DAY_NS = 86_400 * 10**9
+# alive_until = ALIVE_FOREVER (o deal continua sendo o último do cliente) vai como -1:
+# o int64 não cabe num número do JavaScript e -1 ocupa menos no JSON
+FOREVER_DAY = -1
+
+
+def _days(values):
+    # datetime64 / ns -> dias desde 1970-01-01 (inteiros pequenos no JSON)
+    ns = np.asarray(values).astype('datetime64[ns]').view(np.int64)
+    return (ns // DAY_NS).tolist()
+
+
+def _alive_days(values):
+    values = np.asarray(values, dtype=np.int64)
+    return np.where(values == ALIVE_FOREVER, FOREVER_DAY, values // DAY_NS).tolist()
+
+
+def _table(frame, dims, value_columns=()):
+    """Tabela colunar: dimensões categóricas viram códigos + lista de categorias."""
+    table = {'day': _days(frame['day']), 'count': frame['count'].tolist()}
+    for dim in dims:
+        table[dim] = frame[dim].cat.codes.tolist()
+        table[dim + '_categories'] = frame[dim].cat.categories.tolist()
+    for column in value_columns:
+        table[column] = _alive_days(frame[column])
+    return table
+
+
+def _regroup(frame, keys):
+    # Soma as contagens do cubo numa chave menor (menos linhas para o navegador)
+    return frame.groupby(keys, observed=True, sort=True)['count'].sum().reset_index()
+
+
+def client_dataset(snap, line_axes, stage_outputs):
+    """Dados pré-agregados do snapshot para filtrar datas e funil no navegador.
+
+    - 'line' / 'line_in_stage': cubo de criação com o dia até quando cada deal é o último
+      do cliente (no geral e dentro do funil), só com as linhas que algum filtro pode contar;
+    - 'won' / 'lost': ganhos e perdidos por dia e funil (perdidos também por motivo);
+    - 'line_axes': eixo X do gráfico de linha por funil;
+    - 'stage_outputs': barras, tabela e estilo dos leads por funil (não dependem das datas);
+    - 'template': template do Plotly usado nas figuras montadas no servidor.
+    """
+    created = snap.cubes['created'].table
+    day_ns = created['day'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    # Uma linha só entra numa janela que a contém se alive > fim >= dia
+    line = _regroup(created[created['alive'].to_numpy() > day_ns], ['day', 'stage_detail', 'alive'])
+    line_in_stage = _regroup(created[created['alive_in_stage'].to_numpy() > day_ns],
+                             ['day', 'stage_name', 'stage_detail', 'alive_in_stage'])
+
+    won = snap.cubes['won'].table
+    won = _regroup(won[won['stage_status'] == 'Ganho'], ['day', 'stage_name'])
+    lost = snap.cubes['lost'].table
+    lost = _regroup(lost[lost['stage_status'] == 'Perdido'], ['day', 'stage_name', 'loss_reason'])
+
+    return {
+        'version': snap.fingerprint,
+        'line': _table(line, ['stage_detail'], ['alive']),
+        'line_in_stage': _table(line_in_stage, ['stage_name', 'stage_detail'], ['alive_in_stage']),
+        'won': _table(won, ['stage_name']),
+        'lost': _table(lost, ['stage_name', 'loss_reason']),
+        'line_axes': {stage: pd.Series(axis).tolist() for stage, axis in line_axes.items()},
+        'stage_outputs': stage_outputs,
+        'template': pio.templates[pio.templates.default].to_plotly_json(),
+    }
@@ -0,0 +1,239 @@
+import numpy as np
+import pandas as pd
+
+from processing import recode, union_categories
+
+# Data "infinita" para deals que continuam sendo o último do cliente
+ALIVE_FOREVER = np.iinfo(np.int64).max
+
+# Acima disso o groupby do pandas agrega mais rápido que o lexsort de _aggregate
+LEXSORT_MAX_ROWS = 50_000
+
+
+def _to_ns(value):
+    return np.datetime64(pd.Timestamp(value), 'ns').astype(np.int64)
+
+
+def alive_until(frame, by=None):
+    """Até quando (exclusive) cada linha é o último deal do seu cliente.
+
+    Uma linha r é o resultado de `latest_rows` numa janela [start, end] que a contém
+    se e somente se `end < alive_until[r]`: o valor é a data do próximo deal do mesmo
+    cliente (ou ALIVE_FOREVER). Empates no mesmo dia ficam com a primeira linha; as
+    demais, e as linhas sem id, recebem a própria data e nunca são contadas.
+    Com `by` (ex.: 'stage_name') o cliente é considerado dentro de cada grupo.
+    """
+    ids = frame['id'].to_numpy(dtype=np.float64)
+    dates = frame['date_created'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    positions = np.arange(len(frame))
+    keys = [positions, dates, ids]
+    if by is not None:
+        keys.append(frame[by].cat.codes.to_numpy())
+    order = np.lexsort(keys)
+
+    sorted_ids = ids[order]
+    sorted_dates = dates[order]
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    if by is not None:
+        groups = keys[-1][order]
+        new_group[1:] |= groups[1:] != groups[:-1]
+    new_run = new_group.copy()
+    new_run[1:] |= sorted_dates[1:] != sorted_dates[:-1]
+
+    # Cada sequência de mesmo dia vive até o dia da próxima sequência do mesmo cliente
+    run_starts = np.flatnonzero(new_run)
+    run_dates = sorted_dates[run_starts]
+    next_in_group = np.append(~new_group[run_starts[1:]], False)
+    run_until = np.where(next_in_group, np.append(run_dates[1:], ALIVE_FOREVER), ALIVE_FOREVER)
+
+    until = np.where(new_run, run_until[np.cumsum(new_run) - 1], sorted_dates)
+    until[np.isnan(sorted_ids)] = sorted_dates[np.isnan(sorted_ids)]
+
+    result = np.empty(len(order), dtype=np.int64)
+    result[order] = until
+    return result
+
+
+def _aggregate(columns, weights):
+    """Soma `weights` por combinação de valores de `columns` (nome -> Categorical ou array).
+
+    Resultado de `groupby(..., observed=True, sort=True, dropna=False)[...].sum()` só com
+    as somas positivas. Até LEXSORT_MAX_ROWS linhas usa uma ordenação (lexsort) sobre os
+    códigos: o groupby do pandas tem um custo fixo alto com várias chaves categóricas,
+    que domina nos cubos pequenos das atualizações incrementais.
+    """
+    if len(weights) > LEXSORT_MAX_ROWS:
+        frame = pd.DataFrame(dict(columns, count=weights))
+        table = frame.groupby(list(columns), observed=True, sort=True, dropna=False)['count'].sum()
+        return table[table > 0].reset_index()
+
+    # Chaves inteiras que ordenam como o groupby: categoria vazia por último
+    keys = []
+    for values in columns.values():
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.codes.astype(np.int64)
+            keys.append(np.where(codes < 0, len(values.categories), codes))
+        else:
+            keys.append(values.view(np.int64) if values.dtype.kind == 'M' else values)
+    order = np.lexsort(keys[::-1])
+    first = np.zeros(len(order), dtype=bool)
+    first[:1] = True
+    for key in keys:
+        key = key[order]
+        first[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(first)
+    counts = np.add.reduceat(np.asarray(weights, dtype=np.int64)[order], starts) if len(order) else np.empty(0, np.int64)
+    rows = order[starts[counts > 0]]
+    table = {name: values.take(rows) for name, values in columns.items()}
+    table['count'] = counts[counts > 0]
+    return pd.DataFrame(table)
+
+
+def _values(series):
+    return series.array if isinstance(series.dtype, pd.CategoricalDtype) else series.to_numpy()
+
+
+class DealCube:
+    """Contagens de deals pré-agregadas por dia e por um conjunto de dimensões.
+
+    A tabela fica ordenada pelo dia; um roll-up recorta o intervalo por busca binária
+    e agrega só as linhas do cubo (alguns milhares), não os deals.
+    """
+
+    def __init__(self, table, day_column='day'):
+        self.table = table
+        self.day_column = day_column
+        days = table[day_column] if day_column else None
+        self.days = days.to_numpy(dtype='datetime64[ns]').view(np.int64) if days is not None else None
+
+    @classmethod
+    def from_frame(cls, frame, dims, day=None, extra=None):
+        """Agrupa `frame` por [dia, *dims, *extra] contando linhas.
+
+        `day` é a coluna de data (linhas com data nula ficam de fora) e `extra` recebe
+        colunas calculadas (ex.: alive_until) que entram na chave do agrupamento.
+        """
+        columns = {dim: frame[dim] for dim in dims}
+        if day is not None:
+            columns['day'] = frame[day]
+        for name, values in (extra or {}).items():
+            columns[name] = values
+        keys = pd.DataFrame(columns, index=frame.index)
+        if day is not None:
+            keys = keys[keys['day'].notna()]
+
+        group_cols = (['day'] if day is not None else []) + list(dims) + list(extra or {})
+        table = _aggregate({column: _values(keys[column]) for column in group_cols}, np.ones(len(keys), dtype=np.int64))
+        return cls(table, day_column='day' if day is not None else None)
+
+    def __len__(self):
+        return len(self.table)
+
+    def with_delta(self, added, removed):
+        """Novo cubo com as contagens de `added` somadas e as de `removed` subtraídas.
+
+        `added` e `removed` são cubos das linhas que mudaram (mesmas colunas, via
+        `from_frame`). Só as linhas dos dias presentes nessa diferença são reagrupadas
+        e voltam para o seu lugar na ordem por dia; o restante da tabela é copiado.
+        """
+        group_cols = [column for column in self.table.columns if column != 'count']
+        parts = [self.table, added.table, removed.table]
+        if self.days is not None:
+            touched = np.isin(self.days, np.concatenate([added.days, removed.days]))
+        else:
+            touched = np.ones(len(self.table), dtype=bool)
+
+        # Cada coluna das três partes como array (categóricas: códigos num tipo comum)
+        columns, dtypes = {}, {}
+        for column in group_cols + ['count']:
+            values = [part[column] for part in parts]
+            if isinstance(values[0].dtype, pd.CategoricalDtype):
+                dtypes[column] = union_categories(column, *(value.dtype for value in values))
+                values = [recode(value, dtypes[column]).codes for value in values]
+            else:
+                values = [value.to_numpy() for value in values]
+            columns[column] = values
+        columns['count'][2] = -columns['count'][2]
+
+        def restore(column, values):
+            return pd.Categorical.from_codes(values, dtype=dtypes[column]) if column in dtypes else values
+
+        merged = _aggregate(
+            {column: restore(column, np.concatenate([current[touched], *delta]))
+             for column, (current, *delta) in columns.items() if column != 'count'},
+            np.concatenate([columns['count'][0][touched], *columns['count'][1:]]),
+        )
+        if self.days is None:
+            return DealCube(merged, None)
+
+        # As linhas reagrupadas voltam para o lugar delas na ordem por dia
+        kept = np.flatnonzero(~touched)
+        at = np.searchsorted(self.days[kept], merged['day'].to_numpy(dtype='datetime64[ns]').view(np.int64))
+        table = {}
+        for column, (current, *_) in columns.items():
+            values = merged[column].cat.codes.to_numpy() if column in dtypes else merged[column].to_numpy()
+            table[column] = restore(column, np.insert(current[kept], at, values))
+        return DealCube(pd.DataFrame(table), self.day_column)
+
+    def slice(self, start=None, end=None):
+        """Linhas do cubo com dia entre start e end (inclusive)."""
+        if self.days is None:
+            return self.table
+        lo = 0 if start is None else np.searchsorted(self.days, _to_ns(start), 'left')
+        hi = len(self.days) if end is None else np.searchsorted(self.days, _to_ns(end), 'right')
+        return self.table.iloc[lo:max(lo, hi)]
+
+    def filter(self, start=None, end=None, where=None):
+        """Sub-cubo com as linhas do intervalo que satisfazem `where` (igualdade de dimensões).
+
+        Permite fazer o recorte uma vez e vários roll-ups sobre ele.
+        """
+        rows = self.slice(start, end)
+        for column, value in (where or {}).items():
+            rows = rows[rows[column] == value]
+        return DealCube(rows, self.day_column)
+
+    def rollup(self, by, start=None, end=None, where=None, alive=None):
+        """Soma as contagens agrupando por `by`, como um groupby(...).size() nos deals.
+
+        `where` filtra por igualdade de dimensões e `alive` é o nome de uma coluna
+        alive_until que precisa ser maior que `end` (último deal do cliente na janela).
+        """
+        rows = self.filter(start, end, where).table
+        if alive is not None and end is not None:
+            rows = rows[rows[alive].to_numpy() > _to_ns(end)]
+        counts = rows.groupby(by, observed=True, sort=True)['count'].sum()
+        return counts[counts > 0]
+
+    def rollup_windows(self, by, windows, where=None, alive=None):
+        """Vários roll-ups por `by`, um por janela [(start, end), ...], com um único recorte do cubo.
+
+        O filtro `where` e a conversão para arrays são feitos uma vez para o intervalo que
+        cobre todas as janelas; como o cubo está ordenado pelo dia, cada janela vira um
+        trecho contíguo (uma busca binária vetorizada para todas) somado com bincount.
+        Retorna uma Series por janela, igual à de `rollup(by, start, end, where, alive)`.
+        """
+        if not windows:
+            return []
+        starts = np.array([_to_ns(start) for start, _ in windows], dtype=np.int64)
+        ends = np.array([_to_ns(end) for _, end in windows], dtype=np.int64)
+        cube = self.filter(pd.Timestamp(starts.min()), pd.Timestamp(ends.max()), where)
+
+        dtype = cube.table[by].dtype
+        codes = cube.table[by].cat.codes.to_numpy()
+        weights = cube.table['count'].to_numpy()
+        alive_until = cube.table[alive].to_numpy() if alive is not None else None
+        lows = np.searchsorted(cube.days, starts, 'left')
+        highs = np.searchsorted(cube.days, ends, 'right')
+
+        counts = []
+        for lo, hi, end in zip(lows, highs, ends):
+            keep = codes[lo:hi] >= 0
+            if alive_until is not None:
+                keep &= alive_until[lo:hi] > end
+            totals = np.bincount(codes[lo:hi][keep], weights=weights[lo:hi][keep], minlength=len(dtype.categories))
+            present = np.flatnonzero(totals)
+            index = pd.CategoricalIndex(pd.Categorical.from_codes(present, dtype=dtype), name=by)
+            counts.append(pd.Series(totals[present].astype(np.int64), index=index, name='count'))
+        return counts
@@ -0,0 +1,246 @@
+import numpy as np
+import pandas as pd
+
+from processing import recode, union_categories
+
+# Linhas por bloco: uma atualização copia só os blocos das linhas que toca
+CHUNK_ROWS = 16_384
+
+# Chaves alteradas que um KeyIndex acumula antes de a base ordenada ser remontada
+COMPACT_MIN_KEYS = 4_096
+
+EMPTY_SLOTS = np.empty(0, dtype=np.int64)
+
+
+class KeyIndex:
+    """Slots de cada chave (ex.: deal_id ou id do cliente) de um DealRows.
+
+    A base é um par de arrays ordenados pela chave (busca binária) e as chaves alteradas
+    depois dela ficam num dicionário: uma atualização copia só o dicionário, que é
+    desfeito quando o DealRows remonta a base.
+    """
+
+    def __init__(self, keys, slots, changed=None):
+        self.keys = keys
+        self.slots = slots
+        self.changed = changed or {}
+
+    @classmethod
+    def from_values(cls, values, slots):
+        # Chaves nulas (deal sem cliente) ficam de fora
+        if values.dtype.kind == 'f':
+            keep = ~np.isnan(values)
+            values, slots = values[keep], slots[keep]
+        order = np.lexsort((slots, values))
+        return cls(values[order], slots[order].astype(np.int64))
+
+    def get(self, key):
+        """Slots da chave em ordem crescente (vazio se não existe)."""
+        slots = self.changed.get(key)
+        if slots is None:
+            lo, hi = np.searchsorted(self.keys, key, 'left'), np.searchsorted(self.keys, key, 'right')
+            slots = self.slots[lo:hi]
+        return slots
+
+    def with_changes(self, changed):
+        """Novo índice com as chaves de `changed` (chave -> slots ordenados; vazio = removida)."""
+        return KeyIndex(self.keys, self.slots, {**self.changed, **changed})
+
+
+def split_chunks(values):
+    """`values` em blocos de CHUNK_ROWS linhas (views, sem cópia)."""
+    return [values[start:start + CHUNK_ROWS] for start in range(0, len(values), CHUNK_ROWS)]
+
+
+def _chunk(chunks, k):
+    # Bloco ainda codificado (ex.: texto de um snapshot compartilhado): decodificado no primeiro uso
+    chunk = chunks[k]
+    if not isinstance(chunk, np.ndarray):
+        chunk = chunks[k] = chunk.decode()
+    return chunk
+
+
+def _written(chunks, slots, values, dtype):
+    # Cópia da lista de blocos com `values` escritos nos `slots`; só os blocos tocados são copiados
+    chunks = list(chunks)
+    chunk_of = slots // CHUNK_ROWS
+    for k in np.unique(chunk_of).tolist():
+        at = chunk_of == k
+        offsets = slots[at] % CHUNK_ROWS
+        current = _chunk(chunks, k) if k < len(chunks) else np.empty(0, dtype=dtype)
+        chunk = np.empty(max(len(current), offsets.max() + 1), dtype=dtype)
+        chunk[:len(current)] = current
+        chunk[offsets] = values[at]
+        if k < len(chunks):
+            chunks[k] = chunk
+        else:
+            chunks.append(chunk)  # slots novos são contíguos a partir do fim
+    return chunks
+
+
+def _recoded(chunks, old, new):
+    # Códigos de todos os blocos nas categorias de `new`; o -1 do fim da tabela mantém vazio como vazio
+    lookup = np.append(new.categories.get_indexer(old.categories), -1).astype(np.int32)
+    return [lookup[chunk] for chunk in chunks]
+
+
+class DealRows:
+    """Frame processado dos deals (sem filtro de status) em colunas divididas em blocos.
+
+    Cada deal ocupa uma posição fixa (slot): uma atualização sobrescreve o slot do deal,
+    um deal novo vai para o fim e um removido só é desmarcado em `live`. Só os blocos
+    tocados são copiados, os demais arrays são compartilhados com a versão anterior
+    (nunca são alterados in-place), e a ordem dos slots é a ordem do frame montado por
+    `frame()`. Colunas categóricas guardam os códigos; uma categoria nova (raro)
+    recodifica todos os blocos. Um bloco pode ainda estar codificado (objeto com
+    `decode()`, ex.: texto de um snapshot compartilhado) e só é decodificado quando lido.
+    """
+
+    def __init__(self, columns, dtypes, storage, live, size, count, deals, clients):
+        self.columns = columns  # nome -> lista de arrays (códigos nas categóricas)
+        self.dtypes = dtypes  # nome -> dtype da coluna no frame
+        self.storage = storage  # nome -> dtype dos arrays dos blocos
+        self.live = live
+        self.size = size  # slots usados, inclusive os removidos
+        self.count = count
+        self.deals = deals
+        self.clients = clients
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Blocos com as linhas de `frame`, na ordem dele (slot = posição)."""
+        columns, dtypes, storage = {}, {}, {}
+        for name in frame.columns:
+            values = frame[name]
+            dtypes[name] = values.dtype
+            values = values.cat.codes.to_numpy() if isinstance(values.dtype, pd.CategoricalDtype) else values.to_numpy()
+            storage[name] = values.dtype
+            columns[name] = split_chunks(values)
+        return cls.from_chunks(columns, dtypes, storage, len(frame))
+
+    @classmethod
+    def from_chunks(cls, columns, dtypes, storage, size, deals=None, clients=None):
+        """Versão sem remoções a partir dos blocos de cada coluna (como em `split_chunks`).
+
+        Sem `deals` / `clients` os índices por deal_id e por cliente são montados das colunas.
+        """
+        slots = np.arange(size, dtype=np.int64)
+        if deals is None:
+            deals = KeyIndex.from_values(np.concatenate(columns['deal_id'] or [slots]).astype(np.int64), slots)
+        if clients is None:
+            clients = KeyIndex.from_values(np.concatenate(columns['id'] or [slots]).astype(np.float64), slots)
+        return cls(columns, dtypes, storage, split_chunks(np.ones(size, dtype=bool)), size, size, deals, clients)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def chunk_count(self):
+        return len(self.live)
+
+    def _column(self, name, values):
+        dtype = self.dtypes[name]
+        if isinstance(dtype, pd.CategoricalDtype):
+            return pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+        return values
+
+    def _gather(self, name, slots):
+        # Valores (brutos) de uma coluna nos `slots`, em ordem crescente
+        chunks = self.columns[name]
+        if not len(slots):
+            return np.empty(0, dtype=self.storage[name])
+        chunk_of = slots // CHUNK_ROWS
+        starts = np.flatnonzero(np.r_[True, chunk_of[1:] != chunk_of[:-1]])
+        offsets = np.split(slots % CHUNK_ROWS, starts[1:])
+        return np.concatenate([_chunk(chunks, k)[at] for k, at in zip(chunk_of[starts].tolist(), offsets)])
+
+    def take(self, slots):
+        """Frame só com as linhas dos `slots` (em ordem crescente), indexado pelo slot."""
+        slots = np.asarray(slots, dtype=np.int64)
+        data = {name: self._column(name, self._gather(name, slots)) for name in self.columns}
+        return pd.DataFrame(data, index=pd.Index(slots), columns=list(self.columns))
+
+    def block(self, k):
+        """Linhas (não removidas) do k-ésimo bloco, como em `take`."""
+        return self.take(k * CHUNK_ROWS + np.flatnonzero(self.live[k]))
+
+    def frame(self):
+        """Frame com todas as linhas não removidas, em ordem de slot e indexado por ele."""
+        whole = self.count == self.size
+        data = {}
+        for name, chunks in self.columns.items():
+            parts = [_chunk(chunks, k) for k in range(len(chunks))]
+            if not whole:
+                parts = [chunk[live] for chunk, live in zip(parts, self.live)]
+            values = np.concatenate(parts) if parts else np.empty(0, dtype=self.storage[name])
+            data[name] = self._column(name, values)
+        index = pd.RangeIndex(self.size) if whole else pd.Index(np.flatnonzero(np.concatenate(self.live)))
+        return pd.DataFrame(data, index=index, columns=list(self.columns), copy=False)
+
+    def client_slots(self, clients):
+        """Slots de todos os deals dos `clients`, em ordem crescente."""
+        return np.unique(np.concatenate([self.clients.get(client) for client in clients] + [EMPTY_SLOTS]))
+
+    def with_changes(self, rows, deleted_ids=()):
+        """Nova versão com os deals de `rows` sobrescritos (ou no fim) e os de `deleted_ids` removidos.
+
+        `rows` é o frame processado dos deals alterados. Retorna (DealRows, slots antigos
+        sobrescritos ou removidos, slots das `rows`, ids dos clientes afetados). Um deal
+        em `rows` e em `deleted_ids` é removido.
+        """
+        deleted_ids = set(map(int, deleted_ids))
+        if deleted_ids:
+            rows = rows[~rows['deal_id'].isin(deleted_ids)]
+        deal_ids = rows['deal_id'].to_numpy(dtype=np.int64).tolist()
+        slots = np.array([found[0] if len(found := self.deals.get(deal_id)) else -1 for deal_id in deal_ids],
+                         dtype=np.int64)
+        new = slots < 0
+        slots[new] = np.arange(self.size, self.size + new.sum())
+        deleted = {deal_id: found[0] for deal_id in deleted_ids if len(found := self.deals.get(deal_id))}
+        dropped = np.fromiter(deleted.values(), dtype=np.int64, count=len(deleted))
+        touched = np.sort(np.concatenate([slots[~new], dropped]))
+
+        columns, dtypes, storage = dict(self.columns), dict(self.dtypes), dict(self.storage)
+        for name in self.columns:
+            values = rows[name]
+            if isinstance(self.dtypes[name], pd.CategoricalDtype):
+                dtype = union_categories(name, self.dtypes[name], values.dtype)
+                if dtype != self.dtypes[name]:
+                    columns[name] = _recoded(columns[name], self.dtypes[name], dtype)
+                    dtypes[name], storage[name] = dtype, np.dtype(np.int32)
+                values = recode(values, dtype).codes
+            else:
+                values = values.to_numpy()
+            columns[name] = _written(columns[name], slots, values, storage[name])
+        live = _written(self.live, np.concatenate([slots, dropped]),
+                        np.concatenate([np.ones(len(slots), dtype=bool), np.zeros(len(dropped), dtype=bool)]),
+                        np.dtype(bool))
+
+        # Clientes de antes e depois da mudança recebem a lista de slots atualizada
+        client_ids = rows['id'].to_numpy(dtype=np.float64)
+        clients = np.unique(np.concatenate([self._gather('id', touched), client_ids]))
+        clients = clients[~np.isnan(clients)]
+        gone = set(touched.tolist())
+        changed_clients = {}
+        for client in clients.tolist():
+            kept = [slot for slot in self.clients.get(client).tolist() if slot not in gone]
+            changed_clients[client] = np.array(sorted(kept + slots[client_ids == client].tolist()), dtype=np.int64)
+        changed_deals = {deal_id: np.array([slot], dtype=np.int64)
+                         for deal_id, slot in zip(np.asarray(deal_ids)[new].tolist(), slots[new].tolist())}
+        changed_deals.update({deal_id: EMPTY_SLOTS for deal_id in deleted})
+
+        result = DealRows(columns, dtypes, storage, live, self.size + int(new.sum()),
+                          self.count + int(new.sum()) - len(dropped),
+                          self.deals.with_changes(changed_deals), self.clients.with_changes(changed_clients))
+        if len(result.deals.changed) + len(result.clients.changed) > max(COMPACT_MIN_KEYS, result.count // 8):
+            result._compact()
+        return result, touched, slots, clients
+
+    def _compact(self):
+        # Remonta as bases dos índices (custo O(n), diluído entre as atualizações que o antecederam)
+        live = np.concatenate(self.live) if self.live else np.zeros(0, dtype=bool)
+        slots = np.flatnonzero(live)
+        values = {name: np.concatenate(self.columns[name])[live] if self.live else np.empty(0, dtype=self.storage[name])
+                  for name in ('deal_id', 'id')}
+        self.deals = KeyIndex.from_values(values['deal_id'].astype(np.int64), slots)
+        self.clients = KeyIndex.from_values(values['id'].astype(np.float64), slots)
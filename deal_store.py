@@ -0,0 +1,133 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+from agendor import UPDATED_SINCE_PARAM, iter_pages
+from processing import ColumnBuilder
+
+# Margem de segurança ao pedir mudanças desde a última marca (o upsert é idempotente)
+SYNC_OVERLAP = timedelta(seconds=int(os.environ.get('DEAL_SYNC_OVERLAP', 300)))
+
+# Deals decodificados por vez ao ler o store
+LOAD_PAGE_SIZE = int(os.environ.get('DEAL_STORE_PAGE_SIZE', 5000))
+
+
+def parse_timestamp(value):
+    """Data ISO 8601 do Agendor (com 'Z' ou offset) em datetime com fuso.
+
+    Sem fuso a data é tomada como UTC, para que datas com e sem fuso possam ser
+    comparadas; um valor que não é texto gera TypeError.
+    """
+    if not isinstance(value, str):
+        raise TypeError(f'data não é texto: {value!r}')
+    when = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return when if when.tzinfo is not None else when.replace(tzinfo=timezone.utc)
+
+
+class DealStore:
+    """Armazena os deals brutos em SQLite, com upsert por id e marca d'água de atualização."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS deals (
+                id INTEGER PRIMARY KEY,
+                position INTEGER NOT NULL,
+                updated_at TEXT,
+                payload TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS deals_position ON deals (position);
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM deals').fetchone()[0]
+
+    def upsert(self, deals):
+        """Insere ou atualiza deals; novos deals entram no fim da ordem atual."""
+        with self._lock, self._conn:
+            last_position = self._conn.execute('SELECT COALESCE(MAX(position), 0) FROM deals').fetchone()[0]
+            self._conn.executemany(
+                """
+                INSERT INTO deals (id, position, updated_at, payload) VALUES (?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at, payload = excluded.payload
+                WHERE deals.updated_at IS NULL OR excluded.updated_at >= deals.updated_at
+                """,
+                (
+                    (deal['id'], last_position + i, deal.get('updatedAt'), json.dumps(deal))
+                    for i, deal in enumerate(deals, start=1)
+                )
+            )
+
+    def delete(self, deal_ids):
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM deals WHERE id = ?', ((deal_id,) for deal_id in deal_ids))
+
+    def load(self):
+        """Retorna o snapshot local na mesma ordem em que os deals foram recebidos."""
+        return [deal for page in self.iter_pages() for deal in page]
+
+    def iter_pages(self, size=LOAD_PAGE_SIZE):
+        """Gera o snapshot local em páginas de até `size` deals, na ordem de `load`."""
+        rows = self._conn.execute('SELECT payload FROM deals ORDER BY position')
+        while page := rows.fetchmany(size):
+            yield [json.loads(payload) for (payload,) in page]
+
+    def load_columns(self):
+        """O mesmo que `load`, já nas colunas tipadas e sem manter os dicts em memória."""
+        return ColumnBuilder().extend(self.iter_pages()).build()
+
+    def high_water_mark(self):
+        row = self._conn.execute("SELECT value FROM sync_state WHERE key = 'high_water_mark'").fetchone()
+        return row[0] if row else None
+
+    def set_high_water_mark(self, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sync_state (key, value) VALUES ('high_water_mark', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (value,)
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+def _max_updated_at(deals, current=None):
+    marks = [deal['updatedAt'] for deal in deals if deal.get('updatedAt')]
+    if current:
+        marks.append(current)
+    return max(marks, key=parse_timestamp) if marks else None
+
+
+def sync_deals(store, **fetch_kwargs):
+    """Sincroniza o store com o Agendor e retorna o snapshot completo em colunas (ColumnBuilder).
+
+    Na primeira execução faz o crawl completo; nas seguintes pede apenas os deals
+    alterados desde a marca d'água (menos SYNC_OVERLAP) e aplica o upsert. Cada página
+    é gravada assim que chega, e o snapshot é relido do store página a página.
+    """
+    mark = store.high_water_mark()
+    if mark is not None:
+        since = (parse_timestamp(mark) - SYNC_OVERLAP).isoformat()
+        fetch_kwargs['params'] = dict(fetch_kwargs.get('params') or {}, **{UPDATED_SINCE_PARAM: since})
+
+    received = 0
+    new_mark = mark
+    for page in iter_pages(**fetch_kwargs):
+        store.upsert(page)
+        new_mark = _max_updated_at(page, new_mark)
+        received += len(page)
+    if new_mark:
+        store.set_high_water_mark(new_mark)
+
+    print(f"Sincronização: {received} deals recebidos, {len(store)} no store local", flush=True)
+    return store.load_columns()
@@ -0,0 +1,190 @@
+import functools
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+# Colunas da tabela de deals: (id da coluna, nome na tela, tipo no DataTable)
+COLUMNS = [
+    ('id', 'Cliente', 'numeric'),
+    ('title', 'Negócio', 'text'),
+    ('stage_name', 'Funil', 'text'),
+    ('stage_detail', 'Estágio', 'text'),
+    ('stage_status', 'Status', 'text'),
+    ('loss_reason', 'Motivo de Perda', 'text'),
+    ('date_created', 'Criado em', 'datetime'),
+    ('date_won', 'Ganho em', 'datetime'),
+    ('date_lost', 'Perdido em', 'datetime'),
+]
+
+# Operadores do filter_query do DataTable (forma por extenso -> símbolo)
+OPERATORS = {'eq': '=', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>='}
+_FILTER_PART = re.compile(r'^\{(?P<column>[^}]+)\}\s+(?P<operator>[si]?(?:[a-z]+|[<>!]?=|[<>]))\s*(?P<value>.*)$')
+
+
+def parse_filter_query(query):
+    """`{coluna} operador valor && ...` do DataTable -> tuplas (coluna, operador, valor, ignora_caixa).
+
+    Partes que não seguem a sintaxe (ou usam um operador não suportado) são ignoradas.
+    """
+    parts = []
+    for part in (query or '').split(' && '):
+        match = _FILTER_PART.match(part.strip())
+        if match is None:
+            continue
+        operator = match['operator']
+        case_insensitive = False
+        if operator[0] in 'si' and operator[1:] in (*OPERATORS, *OPERATORS.values(), 'contains'):
+            case_insensitive = operator[0] == 'i'
+            operator = operator[1:]
+        operator = OPERATORS.get(operator, operator)
+        if operator not in ('=', '!=', '<', '<=', '>', '>=', 'contains', 'datestartswith'):
+            continue
+        value = match['value'].strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'`':
+            value = value[1:-1].replace('\\' + value[0], value[0])
+        parts.append((match['column'], operator, value, case_insensitive))
+    return tuple(parts)
+
+
+def _compare(values, operator, value):
+    if operator == '=':
+        return values == value
+    if operator == '!=':
+        return values != value
+    if operator == '<':
+        return values < value
+    if operator == '<=':
+        return values <= value
+    if operator == '>':
+        return values > value
+    return values >= value
+
+
+class DealTable:
+    """Paginação, ordenação e filtro da tabela de deals no servidor, montado uma vez por snapshot.
+
+    Cada coluna vira um código de ordenação (`pd.factorize(sort=True)`) calculado na
+    primeira vez que é usada; uma consulta (funil, filtro, ordem) vira um array de
+    posições guardado num LRU, então trocar de página só lê e formata as linhas
+    devolvidas.
+    """
+
+    def __init__(self, frame, cache_size=32):
+        self.frame = frame
+        self.columns = [column for column, _, _ in COLUMNS if column in frame.columns]
+        self._ranks = {}
+        self._positions = functools.lru_cache(maxsize=cache_size)(self._query)
+
+    def _rank(self, column):
+        # Posição de cada valor na ordem crescente (-1 = vazio); valores iguais têm o mesmo código
+        rank = self._ranks.get(column)
+        if rank is None:
+            rank = self._ranks[column] = pd.factorize(self.frame[column], sort=True)[0]
+        return rank
+
+    def _mask(self, column, operator, value, case_insensitive):
+        values = self.frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Testa as categorias (poucas) e seleciona pelos códigos
+            categories = values.cat.categories.astype(str)
+            matched = self._text_mask(pd.Series(categories), operator, value, case_insensitive).to_numpy()
+            codes = values.cat.codes.to_numpy()
+            return np.where(codes >= 0, matched[codes], operator == '!=')
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            return self._date_mask(values, operator, value)
+        if pd.api.types.is_numeric_dtype(values.dtype):
+            try:
+                number = float(value)
+            except ValueError:
+                return np.zeros(len(values), dtype=bool)
+            if operator in ('contains', 'datestartswith'):
+                operator = '='
+            return _compare(values.to_numpy(dtype=np.float64), operator, number)
+        return self._text_mask(values, operator, value, case_insensitive).to_numpy()
+
+    @staticmethod
+    def _text_mask(values, operator, value, case_insensitive):
+        missing = values.isna()
+        values = values.astype(str)
+        if case_insensitive:
+            values, value = values.str.lower(), value.lower()
+        if operator == 'contains':
+            mask = values.str.contains(value, regex=False)
+        elif operator == 'datestartswith':
+            mask = values.str.startswith(value)
+        else:
+            mask = _compare(values, operator, value)
+        return mask & ~missing if operator != '!=' else mask | missing
+
+    @staticmethod
+    def _date_mask(values, operator, value):
+        days = values.to_numpy(dtype='datetime64[ns]')
+        try:
+            # '2024', '2024-03' ou '2024-03-05': o período inteiro
+            period = pd.Period(value)
+        except ValueError:
+            return np.zeros(len(days), dtype=bool)
+        start = np.datetime64(period.start_time, 'ns')
+        end = np.datetime64(period.end_time, 'ns')
+        if operator in ('=', 'contains', 'datestartswith'):
+            return (days >= start) & (days <= end)
+        if operator == '!=':
+            return ~((days >= start) & (days <= end))
+        if operator == '<':
+            return days < start
+        if operator == '<=':
+            return days <= end
+        if operator == '>':
+            return days > end
+        return days >= start
+
+    def _query(self, stage_name, filters, sort_by):
+        mask = np.ones(len(self.frame), dtype=bool)
+        if stage_name is not None:
+            mask &= (self.frame['stage_name'] == stage_name).to_numpy()
+        for column, operator, value, case_insensitive in filters:
+            if column in self.columns:
+                mask &= self._mask(column, operator, value, case_insensitive)
+        positions = np.flatnonzero(mask)
+
+        # Vazios por último nos dois sentidos; empates mantêm a ordem do frame
+        keys = []
+        for column, direction in reversed(sort_by):
+            if column not in self.columns:
+                continue
+            rank = self._rank(column)[positions]
+            missing = rank < 0
+            if direction == 'desc':
+                rank = rank.max(initial=0) - rank
+            keys += [rank, missing]
+        if keys:
+            positions = positions[np.lexsort(keys)]
+        return positions
+
+    def positions(self, stage_name=None, filter_query=None, sort_by=None):
+        """Posições do frame que atendem à consulta, na ordem pedida (compartilhadas, não alterar)."""
+        sort_by = tuple((item['column_id'], item['direction']) for item in sort_by or ())
+        return self._positions(stage_name, parse_filter_query(filter_query), sort_by)
+
+    def records(self, positions):
+        """Linhas nas `positions` no formato do DataTable (datas AAAA-MM-DD, vazios como None)."""
+        rows = self.frame.iloc[positions][self.columns]
+        page = {}
+        for column in self.columns:
+            values = rows[column]
+            if pd.api.types.is_datetime64_any_dtype(values.dtype):
+                values = values.dt.strftime('%Y-%m-%d')
+            elif column == 'id':
+                values = values.astype('Int64')
+            page[column] = values.astype(object).where(values.notna(), None)
+        return pd.DataFrame(page).to_dict('records')
+
+    def page(self, page_current, page_size, stage_name=None, filter_query=None, sort_by=None):
+        """(linhas da página, número de páginas); a página pedida é limitada à última existente."""
+        positions = self.positions(stage_name, filter_query, sort_by)
+        page_count = max(1, math.ceil(len(positions) / page_size))
+        page_current = min(max(page_current or 0, 0), page_count - 1)
+        start = page_current * page_size
+        return self.records(positions[start:start + page_size]), page_count, page_current
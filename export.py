@@ -0,0 +1,125 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# Colunas exportadas, na ordem do arquivo
+EXPORT_COLUMNS = ['deal_id', 'id', 'type', 'title', 'description', 'stage_name', 'stage_number', 'stage_detail',
+                  'stage_status', 'loss_reason', 'date_created', 'date_won', 'date_lost']
+
+# Formato -> (content type, extensão)
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+EXPORTED_ROWS = metrics.counter('export_rows_total', 'Linhas exportadas por formato.', ['format'])
+
+
+def export_chunks(frame, stage_name=None, windows=(), chunk_rows=50_000):
+    """Gera os deals de `frame` que passam nos filtros, em pedaços de no máximo `chunk_rows` linhas.
+
+    `stage_name` (None = todos os funis) e `windows` [(início, fim), ...] seguem os filtros
+    do dashboard: um deal entra se foi criado dentro de alguma das janelas (sem janelas,
+    todos). O frame é percorrido em fatias, então só uma fatia filtrada existe por vez;
+    sem nenhum deal, gera um pedaço vazio (o arquivo sai só com o cabeçalho / esquema).
+    """
+    bounds = [(np.datetime64(pd.Timestamp(start), 'ns'), np.datetime64(pd.Timestamp(end), 'ns'))
+              for start, end in windows]
+    columns = [column for column in EXPORT_COLUMNS if column in frame.columns]
+    empty = True
+    for lo in range(0, len(frame), chunk_rows):
+        part = frame.iloc[lo:lo + chunk_rows]
+        keep = np.ones(len(part), dtype=bool)
+        if stage_name is not None:
+            keep &= (part['stage_name'] == stage_name).to_numpy()
+        if bounds:
+            created = part['date_created'].to_numpy(dtype='datetime64[ns]')
+            in_window = np.zeros(len(part), dtype=bool)
+            for start, end in bounds:
+                in_window |= (created >= start) & (created <= end)
+            keep &= in_window
+        if keep.any():
+            yield _export_rows(part.loc[keep, columns])
+            empty = False
+    if empty:
+        yield _export_rows(frame.iloc[:0][columns])
+
+
+def _export_rows(rows):
+    # id do cliente sem ".0" (a coluna é float por causa dos nulos)
+    return rows.assign(id=rows['id'].astype('Int64'))
+
+
+def stream_csv(chunks):
+    """CSV em bytes, um pedaço por fatia (cabeçalho só no primeiro; datas AAAA-MM-DD)."""
+    header = True
+    for chunk in chunks:
+        EXPORTED_ROWS.inc(len(chunk), format='csv')
+        yield chunk.to_csv(index=False, header=header, date_format='%Y-%m-%d').encode('utf-8')
+        header = False
+
+
+class _Drain(io.RawIOBase):
+    # Destino do ParquetWriter: guarda o que foi escrito até o gerador repassar
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def _arrow_schema(pa, chunk):
+    # Tipos pelo dtype do frame, não pelos valores: uma fatia só com nulos não muda o esquema
+    fields = []
+    for column in chunk.columns:
+        dtype = chunk[column].dtype
+        if isinstance(dtype, pd.CategoricalDtype) or dtype == object:
+            kind = pa.string()
+        else:
+            kind = pa.from_numpy_dtype(getattr(dtype, 'numpy_dtype', dtype))
+        fields.append(pa.field(column, kind))
+    return pa.schema(fields)
+
+
+def stream_parquet(chunks):
+    """Parquet em bytes, um row group por fatia; pyarrow só é importado aqui (dependência opcional)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _Drain()
+    writer = None
+    for chunk in chunks:
+        if writer is None:
+            writer = pq.ParquetWriter(sink, _arrow_schema(pa, chunk))
+        # Categóricas viram texto: o esquema é o mesmo em todos os row groups
+        chunk = chunk.astype({column: object for column in chunk.columns
+                              if isinstance(chunk[column].dtype, pd.CategoricalDtype)})
+        writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+        EXPORTED_ROWS.inc(len(chunk), format='parquet')
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
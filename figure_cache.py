@@ -0,0 +1,172 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from plotly.io.json import to_json_plotly
+
+
+def normalize(value):
+    """Forma canônica dos inputs de um callback para compor a chave do cache.
+
+    Listas viram tuplas e datas ISO viram só o dia ('2024-01-31T00:00:00' e
+    '2024-01-31' são o mesmo filtro, como em `parse_date`).
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, normalize(v)) for k, v in value.items()))
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).date().isoformat()
+        except ValueError:
+            return value
+    return value
+
+
+def evict_oldest(directory, suffix, keep):
+    """Remove os arquivos `*suffix` mais antigos (por mtime) de `directory` além dos `keep` mais recentes."""
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith(suffix):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+    if len(entries) <= keep:
+        return
+    entries.sort()
+    for _, path in entries[:len(entries) - keep]:
+        try:
+            os.remove(path)
+        except OSError:
+            # Outro worker já removeu
+            pass
+
+
+class DiskBackend:
+    """Diretório compartilhado entre processos (ex.: workers do gunicorn).
+
+    Cada entrada é o JSON já serializado do resultado (o mesmo que o Dash envia ao
+    navegador), com o hash da chave como nome: a leitura devolve dicts simples, sem
+    reconstruir e validar objetos Figure. A escrita é atômica (arquivo temporário +
+    rename) e a leitura atualiza o mtime, que serve de relógio do LRU quando o número
+    de arquivos passa de `max_entries`.
+    """
+
+    suffix = '.json'
+
+    def __init__(self, path, max_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, digest):
+        return os.path.join(self.path, digest + self.suffix)
+
+    def get(self, digest):
+        """Retorna (encontrado, valor); o valor pode ser None (ex.: container oculto)."""
+        path = self._file(digest)
+        try:
+            with open(path, 'rb') as f:
+                value = json.loads(f.read())
+            os.utime(path)
+            return True, value
+        except (OSError, ValueError):
+            return False, None
+
+    def set(self, digest, value):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(to_json_plotly(value))
+            os.replace(tmp, self._file(digest))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        evict_oldest(self.path, self.suffix, self.max_entries)
+
+
+class FigureCache:
+    """Cache LRU de resultados de callbacks, chaveado por (callback, inputs, versão dos dados).
+
+    A versão é a impressão digital do snapshot, então um snapshot novo invalida as
+    entradas antigas sem limpeza explícita: elas só deixam de ser pedidas e saem pelo
+    LRU. Com `disk` as entradas também são gravadas num diretório compartilhado e um
+    worker aproveita o resultado calculado por outro.
+    """
+
+    def __init__(self, max_entries=256, disk=None):
+        self.max_entries = max_entries
+        self.disk = disk
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(name, args, version):
+        raw = repr((name, normalize(args), version)).encode()
+        return hashlib.sha256(raw).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+        if self.disk is not None:
+            found, value = self.disk.get(key)
+            if found:
+                self._store(key, value)
+                with self._lock:
+                    self.hits += 1
+                return True, value
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, key, value):
+        self._store(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def memoize(self, name, version):
+        """Decorador para callbacks; `version()` devolve a versão dos dados no momento da chamada.
+
+        Os resultados são compartilhados entre requisições e não devem ser alterados.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                if self.max_entries <= 0:
+                    return func(*args)
+                key = self.key(name, args, version())
+                found, value = self.get(key)
+                if found:
+                    return value
+                value = func(*args)
+                self.set(key, value)
+                return value
+            return wrapper
+        return decorator
@@ -0,0 +1,96 @@
+import numpy as np
+
+
+def latest_positions(frame, positions=None, by=None):
+    """Posições do deal mais recente (maior date_created) de cada cliente.
+
+    Mesmo resultado de `frame.groupby('id')['date_created'].idxmax()` (empate fica com
+    a primeira linha, ids nulos são ignorados), em ordem de id, mas calculado com uma
+    ordenação das `positions` pedidas em vez de um groupby sobre o frame inteiro.
+    Com `by` (ex.: 'stage_name') o último deal é calculado por grupo + cliente.
+    """
+    ids = frame['id'].to_numpy(dtype=np.float64)
+    if positions is None:
+        positions = np.arange(len(frame))
+    positions = positions[~np.isnan(ids[positions])]
+    dates = frame['date_created'].to_numpy(dtype='datetime64[ns]').view(np.int64)[positions]
+
+    keys = [positions, -dates, ids[positions]]
+    if by is not None:
+        keys.append(frame[by].cat.codes.to_numpy()[positions])
+    ordered = positions[np.lexsort(keys)]
+
+    # Primeira linha de cada (grupo, cliente) após ordenar por data decrescente
+    first = np.ones(len(ordered), dtype=bool)
+    first[1:] = ids[ordered[1:]] != ids[ordered[:-1]]
+    if by is not None:
+        groups = frame[by].cat.codes.to_numpy()
+        first[1:] |= groups[ordered[1:]] != groups[ordered[:-1]]
+    return ordered[first]
+
+
+def latest_rows(frame, positions=None):
+    """Equivalente a `frame.loc[frame.groupby('id')['date_created'].idxmax()]`."""
+    return frame.iloc[latest_positions(frame, positions)]
+
+
+class LatestDealIndex:
+    """Último deal de cada cliente, no geral e por stage_name, construído uma vez por snapshot.
+
+    Guarda os rótulos do índice do frame (o slot de cada deal, que não muda entre
+    atualizações) em ordem de cliente, junto com os ids dos clientes: `with_changes`
+    troca só os clientes afetados por busca binária, sem reler o frame.
+    """
+
+    def __init__(self, frame=None, overall=None, by_stage=None):
+        # overall e by_stage[stage]: (rótulos, ids dos clientes), em ordem de id
+        if frame is not None:
+            labels = frame.index.to_numpy()
+            ids = frame['id'].to_numpy(dtype=np.float64)
+            positions = latest_positions(frame)
+            overall = (labels[positions], ids[positions])
+            per_stage = latest_positions(frame, by='stage_name')
+            codes = frame['stage_name'].cat.codes.to_numpy()[per_stage]
+            by_stage = {}
+            for code, stage in enumerate(frame['stage_name'].cat.categories):
+                positions = per_stage[codes == code]
+                by_stage[stage] = (labels[positions], ids[positions])
+        self.overall = overall
+        self.by_stage = by_stage
+
+    def __len__(self):
+        return len(self.overall[0])
+
+    def labels(self, stage_name=None):
+        """Rótulos do último deal por cliente (opcionalmente só dentro de um stage_name)."""
+        if stage_name is None:
+            return self.overall[0]
+        return self.by_stage[stage_name][0] if stage_name in self.by_stage else np.empty(0, dtype=np.int64)
+
+    def rows(self, frame, stage_name=None):
+        """Linhas de `frame` (índice crescente, com os mesmos rótulos) do último deal por cliente."""
+        return frame.iloc[frame.index.searchsorted(self.labels(stage_name))]
+
+    def with_changes(self, changed, client_ids):
+        """Novo índice com as entradas dos clientes em `client_ids` trocadas pelas de `changed`.
+
+        `changed` é o índice montado só com as linhas atuais desses clientes (ids
+        ordenados e únicos); as entradas dos demais clientes são mantidas.
+        """
+        client_ids = np.asarray(client_ids, dtype=np.float64)
+
+        def merge(kept, fresh):
+            labels, ids = kept
+            at = np.searchsorted(ids, client_ids)
+            found = at[at < len(ids)]
+            found = found[ids[found] == client_ids[at < len(ids)]]
+            if not len(found) and not len(fresh[0]):
+                return kept
+            labels, ids = np.delete(labels, found), np.delete(ids, found)
+            at = np.searchsorted(ids, fresh[1])
+            return np.insert(labels, at, fresh[0]), np.insert(ids, at, fresh[1])
+
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        by_stage = {stage: merge(self.by_stage.get(stage, empty), changed.by_stage.get(stage, empty))
+                    for stage in {**self.by_stage, **changed.by_stage}}
+        return LatestDealIndex(overall=merge(self.overall, changed.overall), by_stage=by_stage)
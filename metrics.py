@@ -0,0 +1,235 @@
+import contextvars
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Limites (segundos) dos histogramas de latência e (bytes) dos de tamanho de resposta
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000, 10_000_000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Métrica com rótulos, guardada em memória no processo e exposta no formato texto do Prometheus.
+
+    Com `func` o valor é lido na hora da coleta: um número ou um dict (valores dos
+    rótulos) -> número; None omite a métrica.
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), func=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: rótulos esperados {self.labelnames}, recebidos {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Linhas (sufixo, valores dos rótulos, rótulos extras, valor) para a exposição."""
+        if self.func is not None:
+            values = self.func()
+            if values is None:
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+            return [('', tuple(str(v) for v in key), (), value) for key, value in values.items() if value is not None]
+        with self._lock:
+            return [('', key, (), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for suffix, key, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_labels(self.labelnames, key, extra)} {_number(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        rows = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    rows.append(('_bucket', key, (('le', _number(bound)),), count))
+                rows.append(('_sum', key, (), total))
+                rows.append(('_count', key, (), counts[-1]))
+        return rows
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica duplicada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labelnames=(), func=None):
+    return REGISTRY.register(Counter(name, help, labelnames, func))
+
+
+def gauge(name, help, labelnames=(), func=None):
+    return REGISTRY.register(Gauge(name, help, labelnames, func))
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+# Etapas internas (busca, processamento, grupos de figuras...) medidas com `phase`
+PHASE_SECONDS = histogram('dashboard_phase_seconds', 'Duração de cada etapa do pipeline e dos callbacks.', ['phase'])
+
+# Etapas medidas durante a requisição atual, para o cabeçalho Server-Timing (None fora de requisições)
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+@contextmanager
+def phase(name):
+    """Mede uma etapa no histograma de etapas e, dentro de uma requisição, no Server-Timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        PHASE_SECONDS.observe(elapsed, phase=name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def timed(name):
+    """Decorador equivalente a `with phase(name)` em volta da função."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(timings, total):
+    """Valor do cabeçalho Server-Timing: cada etapa (ms) e o total do callback."""
+    entries = [f'{name.replace(" ", "_")};dur={seconds * 1000:.1f}' for name, seconds in timings]
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+CALLBACK_SECONDS = histogram('dash_callback_seconds', 'Latência dos callbacks do Dash (requisição completa).',
+                             ['callback', 'status'])
+CALLBACK_RESPONSE_BYTES = histogram('dash_callback_response_bytes', 'Tamanho da resposta dos callbacks do Dash.',
+                                    ['callback'], buckets=SIZE_BUCKETS)
+
+
+def callback_name(request):
+    # Primeira saída do callback ('line-chart.figure'), igual em todas as chamadas dele
+    body = request.get_json(silent=True) or {}
+    output = body.get('output') or 'desconhecido'
+    return output.strip('.').split('...')[0]
+
+
+def instrument_dash(server, send_server_timing=True, path='/_dash-update-component'):
+    """Mede cada chamada de callback do Dash no `server` Flask (latência, tamanho e Server-Timing)."""
+    from flask import g, request
+
+    @server.before_request
+    def _start_callback_timer():
+        if request.path == path:
+            g.metrics_started = time.perf_counter()
+            g.metrics_timings = []
+            g.metrics_token = _request_timings.set(g.metrics_timings)
+
+    @server.after_request
+    def _record_callback(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        _request_timings.reset(g.pop('metrics_token'))
+        name = callback_name(request)
+        CALLBACK_SECONDS.observe(elapsed, callback=name, status=response.status_code)
+        if not response.direct_passthrough:
+            CALLBACK_RESPONSE_BYTES.observe(response.calculate_content_length() or 0, callback=name)
+        if send_server_timing:
+            response.headers['Server-Timing'] = server_timing(g.pop('metrics_timings'), elapsed)
+        return response
+
+    return server
@@ -0,0 +1,280 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from indexes import latest_rows
+
+
+# Campos lidos de cada deal, na ordem das colunas do DataFrame
+DEAL_COLUMNS = [
+    'stage_detail', 'stage_name', 'stage_number', 'stage_status', 'person', 'title',
+    'date_created', 'date_lost', 'date_won', 'organization', 'description', 'loss_reason', 'deal_id'
+]
+
+
+def _object_column(values):
+    return np.array(values, dtype=object)
+
+
+def deals_to_columns(deals):
+    """Achata dealStage/funnel/dealStatus/lossReason/person/organization em colunas tipadas.
+
+    Cada coluna é montada numa única compreensão sobre a lista e já sai como array
+    NumPy, evitando os appends por deal e a inferência de tipos do pandas.
+    """
+    stages = [deal['dealStage'] for deal in deals]
+    return {
+        'stage_detail': _object_column([stage['name'] for stage in stages]),
+        'stage_name': _object_column([stage['funnel']['name'] for stage in stages]),
+        'stage_number': np.fromiter((int(stage['sequence']) for stage in stages), dtype=np.int16, count=len(stages)),
+        'stage_status': _object_column([deal['dealStatus']['name'] for deal in deals]),
+        'person': np.array([person.get('id') if (person := deal['person']) else np.nan for deal in deals],
+                           dtype=np.float64),
+        'title': _object_column([deal['title'] for deal in deals]),
+        'date_created': _object_column([deal['createdAt'] for deal in deals]),
+        'date_lost': _object_column([deal['lostAt'] for deal in deals]),
+        'date_won': _object_column([deal['wonAt'] for deal in deals]),
+        'organization': np.array([org.get('id') if (org := deal['organization']) else np.nan for deal in deals],
+                                 dtype=np.float64),
+        'description': _object_column([deal['description'] for deal in deals]),
+        'loss_reason': _object_column([reason['name'] if (reason := deal['lossReason']) else None for deal in deals]),
+        'deal_id': np.fromiter((deal['id'] for deal in deals), dtype=np.int64, count=len(deals)),
+    }
+
+
+# Colunas com poucos valores distintos (estágios, status, motivos e dias), internadas no
+# ColumnBuilder para que todas as linhas apontem para o mesmo objeto str
+INTERNED_COLUMNS = ['stage_detail', 'stage_name', 'stage_status', 'loss_reason']
+DAY_COLUMNS = ['date_created', 'date_lost', 'date_won']
+
+
+class ColumnBuilder:
+    """Acumula páginas de deals direto nas colunas tipadas de `deals_to_columns`.
+
+    Cada página é achatada assim que chega e os dicts brutos podem ser descartados:
+    o que fica em memória são arrays NumPy, strings repetidas compartilhadas e, das
+    datas, só o dia 'AAAA-MM-DD' (o único trecho que `frame_from_columns` usa).
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._interned = {}
+        self.rows = 0
+
+    def _intern(self, values):
+        interned = self._interned
+        return _object_column([interned.setdefault(value, value) if value is not None else None
+                               for value in values])
+
+    def append(self, deals):
+        if not deals:
+            return self
+        chunk = deals_to_columns(deals)
+        for name in INTERNED_COLUMNS:
+            chunk[name] = self._intern(chunk[name])
+        for name in DAY_COLUMNS:
+            chunk[name] = self._intern([value[:10] if isinstance(value, str) else None for value in chunk[name]])
+        self._chunks.append(chunk)
+        self.rows += len(deals)
+        return self
+
+    def extend(self, pages):
+        for page in pages:
+            self.append(page)
+        return self
+
+    def build(self):
+        """Dict coluna -> array com todas as páginas, na ordem em que foram recebidas."""
+        if not self._chunks:
+            return deals_to_columns([])
+        columns = {name: np.concatenate([chunk[name] for chunk in self._chunks]) for name in DEAL_COLUMNS}
+        self._chunks = [columns]
+        return columns
+
+
+def _categorical(values, transform=None, sort_key=None):
+    """Converte valores repetidos num Categorical ordenado.
+
+    `transform` é aplicado só aos valores distintos (podendo fundi-los) e `sort_key`
+    define a ordem das categorias, que passa a ser a ordem natural de ordenação.
+    """
+    codes, uniques = pd.factorize(values)
+    if transform is not None and len(uniques):
+        merged_codes, uniques = pd.factorize(_object_column([transform(value) for value in uniques]))
+        codes = np.where(codes >= 0, merged_codes[codes], -1)
+
+    order = sorted(range(len(uniques)), key=lambda i: sort_key(uniques[i]) if sort_key else uniques[i])
+    remap = np.empty(len(uniques), dtype=codes.dtype)
+    remap[order] = np.arange(len(uniques))
+    if len(uniques):
+        codes = np.where(codes >= 0, remap[codes], -1)
+    return pd.Categorical.from_codes(codes, categories=pd.Index(uniques, dtype=object).take(order), ordered=True)
+
+
+def stage_detail_key(stage_detail):
+    # Ordem numérica 'X.Y' de sort_stage_detail, com o nome como desempate
+    return sort_stage_detail(stage_detail), stage_detail
+
+
+def _to_datetime64(values):
+    """Converte timestamps ISO 8601 no dia local (datetime64, sem fuso).
+
+    O dia local de um timestamp ISO é o seu prefixo 'AAAA-MM-DD', então basta
+    converter os prefixos distintos (algumas centenas) em vez de cada linha.
+    """
+    prefixes = _object_column([value[:10] if isinstance(value, str) else None for value in values])
+    codes, uniques = pd.factorize(prefixes)
+    try:
+        days = pd.to_datetime(uniques, format='%Y-%m-%d')
+    except ValueError:
+        # Formato inesperado: usa a conversão completa do pandas
+        parsed = pd.to_datetime(pd.Series(values))
+        if parsed.dt.tz is not None:
+            parsed = parsed.dt.tz_localize(None)
+        return parsed.dt.normalize().to_numpy()
+    dates = np.append(days.to_numpy(dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))  # código -1 = ausente
+    return dates[codes]
+
+
+def frame_from_columns(columns, filter_by_status='Em andamento'):
+    """Monta o DataFrame processado a partir das colunas achatadas.
+
+    Datas ficam em datetime64 e os campos de estágio/status/motivo em Categorical
+    ordenado; 'stage_detail' já vem na ordem de sort_stage_detail.
+    """
+    df = pd.DataFrame(columns, columns=DEAL_COLUMNS, copy=False)
+
+    # Criar as colunas 'id' e 'type'
+    df['id'] = df['person'].fillna(df['organization'])
+    df['type'] = pd.Categorical.from_codes(df['person'].notna().to_numpy(dtype=np.int8),
+                                           categories=['organization', 'person'])
+
+    # Remover as colunas 'person' e 'organization'
+    df = df.drop(columns=['person', 'organization'])
+
+    df['stage_detail'] = _categorical(df['stage_detail'], sort_key=stage_detail_key)
+    df['stage_name'] = _categorical(df['stage_name'], transform=lambda name: re.sub(r'^\d+\s*', '', name))
+    df['stage_status'] = _categorical(df['stage_status'])
+    df['loss_reason'] = _categorical(df['loss_reason'])
+
+    # Filtragem por data
+    df['date_created'] = _to_datetime64(df['date_created'])
+    df['date_won'] = _to_datetime64(df['date_won'])
+    df['date_lost'] = _to_datetime64(df['date_lost'])
+
+    if filter_by_status:
+        df = df[df['stage_status'] == 'Em andamento']
+
+    return df
+
+
+def recode_stage_detail(stage_detail, mapping):
+    """Renomeia categorias de 'stage_detail' (podendo fundi-las) mantendo a ordem por estágio."""
+    categories = stage_detail.cat.categories
+    renamed = _categorical(_object_column(categories), transform=lambda value: mapping.get(value, value),
+                           sort_key=stage_detail_key)
+    codes = stage_detail.cat.codes.to_numpy()
+    new_codes = np.where(codes >= 0, renamed.codes[codes], -1) if len(categories) else codes
+    return pd.Series(pd.Categorical.from_codes(new_codes, dtype=renamed.dtype), index=stage_detail.index)
+
+
+# Ordem das categorias de cada coluna, a mesma usada em frame_from_columns
+CATEGORY_SORT_KEYS = {'stage_detail': stage_detail_key}
+
+
+def union_categories(column, *dtypes):
+    """CategoricalDtype com as categorias de todos os `dtypes`, na ordem de frame_from_columns."""
+    categories = dtypes[0].categories
+    for dtype in dtypes[1:]:
+        if not dtype.categories.isin(categories).all():
+            categories = categories.append(dtype.categories).unique()
+    if len(categories) > len(dtypes[0].categories):
+        categories = pd.Index(sorted(categories, key=CATEGORY_SORT_KEYS.get(column)), dtype=object)
+    return pd.CategoricalDtype(categories, ordered=dtypes[0].ordered)
+
+
+def recode(values, dtype):
+    """Categorical `values` com as categorias de `dtype` (que precisa conter as atuais)."""
+    values = pd.Categorical(values)
+    if values.dtype == dtype:
+        return values
+    mapping = dtype.categories.get_indexer(values.categories)
+    codes = np.where(values.codes >= 0, mapping[values.codes], -1) if len(mapping) else values.codes
+    return pd.Categorical.from_codes(codes, dtype=dtype)
+
+
+# Função para processar os dados; `deals` pode ser a lista de deals brutos ou as colunas
+# já montadas por um ColumnBuilder
+def process_data(deals, filter_by_status='Em andamento'):
+    columns = deals if isinstance(deals, dict) else deals_to_columns(deals)
+    return frame_from_columns(columns, filter_by_status)
+
+
+# Estágios que o gráfico de linha (e a evolução de leads) contam junto com outro
+LINE_STAGE_DETAIL_MAPPING = {
+    'CONTATO': '1.1 LEADS',
+    'TYPEFORM': '2.1 VALIDAÇÃO',
+    'CONTRATO': '3.1 ATIVOS'
+}
+
+
+def process_line_data(df):
+    # Transformação da coluna 'stage_detail'
+    stage_detail = recode_stage_detail(df['stage_detail'], LINE_STAGE_DETAIL_MAPPING)
+    
+    # Remover as linhas onde 'stage_detail' começa com "5 " ou "6 " (uma cópia só do frame)
+    keep = ~stage_detail.str.startswith(('5', '6')).to_numpy(dtype=bool)
+    df = df[keep]
+    df.isetitem(df.columns.get_loc('stage_detail'), stage_detail[keep].cat.remove_unused_categories())
+    
+    return df
+    
+
+def bar_counts(df):
+    """Contagem por 'stage_detail' do gráfico de barras inicial, em todas as categorias (sem ordenar).
+
+    Cada cliente contribui só com o seu último deal entre os filtrados, então a contagem
+    de um conjunto de clientes pode ser trocada sem recalcular os demais.
+    """
+    df_filtered = df[(df['stage_name'] == 'AMBULANTE ESSENCIAL') | df['description'].str.contains("CA", na=False)]
+
+    dt_filtered = latest_rows(df_filtered)
+    dt_filtered = dt_filtered[~dt_filtered['stage_detail'].str.contains('1', na=False)]
+    return dt_filtered['stage_detail'].value_counts(sort=False)
+
+
+def bar_frame(counts):
+    d = counts.sort_values(ascending=False)  # Mesma ordem do value_counts
+    d = d[d > 0]  # value_counts de Categorical inclui categorias sem ocorrências
+
+    df_bar = d.reset_index()
+    df_bar.columns = ['stage_detail', 'count']
+    
+    return df_bar
+
+
+def process_bar_data(df):
+    return bar_frame(bar_counts(df))
+
+
+def sort_stage_detail(stage_detail):
+    """Ordena os valores de 'stage_detail' assumindo o formato numérico 'X.Y'"""
+    try:
+        parts = stage_detail.split(' ')[0].split('.')  # Pega apenas a parte numérica antes do espaço
+        parts = [int(p) if p.isdigit() else 0 for p in parts]  # Converte para inteiro, tratando casos inesperados
+        return tuple(parts)  # Retorna como tupla para ordenação correta
+    except Exception as e:
+        print(f"Erro ao tentar ordenar stage_detail '{stage_detail}': {e}")
+        return (float('inf'),)  # Empurra valores problemáticos para o final da ordenação
+
+
+def stage_detail_order(stages, counts):
+    """Posições que põem `stages` (com as contagens `counts`) na ordem do funil.
+
+    Estágios com o mesmo prefixo numérico ou sem prefixo (ex.: CONTATO, TYPEFORM e
+    CONTRATO) ficam em contagem decrescente, como a ordenação estável do value_counts
+    fazia, e por fim pelo nome.
+    """
+    keys = [(sort_stage_detail(stage), -count, stage) for stage, count in zip(stages, counts)]
+    return sorted(range(len(keys)), key=keys.__getitem__)
@@ -0,0 +1,144 @@
+import functools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+import metrics
+from figure_cache import evict_oldest
+
+PROFILES = metrics.counter('profiles_written_total', 'Perfis de amostragem gravados em disco.', ['source'])
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Amostra a pilha de uma thread a cada `interval` segundos, sem instrumentar o código.
+
+    Uma thread auxiliar lê `sys._current_frames()` e conta as pilhas vistas; o custo
+    fica na thread auxiliar e não depende de quantas funções a thread medida chama.
+    O resultado está no formato "folded" (uma pilha por linha + número de amostras),
+    aberto por speedscope.app ou flamegraph.pl.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfileCapture:
+    """Perfis das invocações lentas (callbacks e pipeline de carga) gravados em `directory`.
+
+    Com `always` toda invocação é amostrada e a que passar de `threshold` segundos é
+    gravada; sem ele só as requisições que pedirem (cabeçalho X-Profile ou cookie
+    profile=1) são amostradas, e essas são sempre gravadas. Ficam os `keep` perfis
+    mais recentes.
+    """
+
+    suffix = '.folded'
+
+    def __init__(self, directory, threshold=0.5, interval=0.005, keep=50, always=False):
+        self.directory = directory
+        self.threshold = threshold
+        self.interval = interval
+        self.keep = keep
+        self.always = always
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        return SamplingProfiler(interval=self.interval).start()
+
+    def finish(self, profiler, name, elapsed, forced=False):
+        """Para o `profiler` e grava o perfil se a invocação foi lenta (ou pedida); retorna o caminho."""
+        profiler.stop()
+        if not profiler.samples or (elapsed < self.threshold and not forced):
+            return None
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', name)[:80]
+        path = os.path.join(self.directory, f"{datetime.now():%Y%m%dT%H%M%S%f}-{slug}-{elapsed * 1000:.0f}ms{self.suffix}")
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.folded())
+        except OSError as e:
+            print(f"Erro ao gravar perfil de {name}: {e}", flush=True)
+            return None
+        PROFILES.inc(source=name.split(':')[0])
+        print(f"Perfil de {name} ({elapsed * 1000:.0f}ms, {profiler.samples} amostras) gravado em {path}", flush=True)
+        evict_oldest(self.directory, self.suffix, self.keep)
+        return path
+
+    def wrap(self, name, func):
+        """`func` amostrado a cada chamada (ex.: carga e montagem do snapshot), só com `always`."""
+        if not self.always:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = self.start()
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.finish(profiler, f'pipeline:{name}', time.perf_counter() - started)
+        return wrapper
+
+    def install(self, server, path='/_dash-update-component'):
+        """Amostra as chamadas de callback do Dash no `server` Flask."""
+        from flask import g, request
+
+        @server.before_request
+        def _start_profiler():
+            if request.path != path:
+                return
+            forced = request.headers.get('X-Profile') == '1' or request.cookies.get('profile') == '1'
+            if forced or self.always:
+                g.profiler = self.start()
+                g.profiler_forced = forced
+                g.profiler_started = time.perf_counter()
+
+        @server.after_request
+        def _finish_profiler(response):
+            profiler = g.pop('profiler', None)
+            if profiler is not None:
+                elapsed = time.perf_counter() - g.pop('profiler_started')
+                self.finish(profiler, f'callback:{metrics.callback_name(request)}', elapsed,
+                            forced=g.pop('profiler_forced'))
+            return response
+
+        return server
+
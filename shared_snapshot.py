@@ -0,0 +1,349 @@
+"""Snapshot compartilhado por vários processos em arquivos mapeados em memória.
+
+Cada versão guarda o snapshot inteiro, não só os deals: colunas dos deals (categorias
+como códigos, texto em UTF-8 por bloco do DealRows), índices por deal e por cliente,
+último deal por cliente, cubos, séries diárias e frames de resumo. Um worker que abre a
+versão só mapeia esses arrays: nada é reagrupado e o texto de um bloco só é decodificado
+quando alguém lê as linhas dele (tabela de deals, exportação, eventos de webhook).
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from cube import DealCube
+from deal_rows import CHUNK_ROWS, DealRows, KeyIndex, split_chunks
+from indexes import LatestDealIndex
+from snapshot import Snapshot, build_snapshot
+from timeseries import DailyCounts
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos (uso local com um processo só)
+    fcntl = None
+
+MANIFEST = 'manifest.json'
+CURRENT = 'CURRENT'
+LOCK = '.lock'
+
+
+def _save(directory, name, values):
+    np.save(os.path.join(directory, name + '.npy'), np.ascontiguousarray(values), allow_pickle=False)
+
+
+def _load(directory, name):
+    # view(np.ndarray): mesmo buffer mapeado, mas sem a subclasse np.memmap nos resultados
+    return np.load(os.path.join(directory, name + '.npy'), mmap_mode='r', allow_pickle=False).view(np.ndarray)
+
+
+class EncodedText:
+    """Bloco de uma coluna de texto ainda em UTF-8 (separado por NUL), decodificado em `decode()`."""
+
+    def __init__(self, blob, missing):
+        self.blob = blob
+        self.missing = missing
+
+    def __len__(self):
+        return len(self.missing)
+
+    def decode(self):
+        values = np.empty(len(self.missing), dtype=object)
+        if len(values):
+            values[:] = self.blob.tobytes().decode('utf-8').split('\x00')
+        values[self.missing] = None
+        return values
+
+
+def write_frame(frame, directory, meta=None):
+    """Grava `frame` coluna a coluna em `directory` (um .npy por array + manifest.json).
+
+    Categorias viram códigos + lista de categorias no manifest, datas e números são
+    gravados como estão e textos como blocos UTF-8 separados por NUL (um por bloco de
+    CHUNK_ROWS linhas, com os offsets em bytes), tudo em arrays que podem ser abertos
+    com mmap. Um índice que não seja 0..n-1 também é gravado.
+    """
+    os.makedirs(directory, exist_ok=True)
+    columns = []
+    for name in frame.columns:
+        values = frame[name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            _save(directory, name, values.cat.codes.to_numpy())
+            columns.append({'name': name, 'kind': 'category', 'categories': values.cat.categories.tolist(),
+                            'ordered': bool(values.cat.ordered)})
+        elif values.dtype == object:
+            missing = values.isna().to_numpy()
+            blobs = [
+                '\x00'.join('' if null else str(value).replace('\x00', '') for value, null in zip(chunk, nulls)).encode('utf-8')
+                for chunk, nulls in zip(split_chunks(values.to_numpy()), split_chunks(missing))
+            ]
+            _save(directory, name + '.text', np.frombuffer(b''.join(blobs), dtype=np.uint8))
+            _save(directory, name + '.offsets', np.cumsum([0] + [len(blob) for blob in blobs], dtype=np.int64))
+            _save(directory, name + '.missing', missing)
+            columns.append({'name': name, 'kind': 'text'})
+        else:
+            _save(directory, name, values.to_numpy())
+            columns.append({'name': name, 'kind': 'array'})
+
+    manifest = {'rows': len(frame), 'chunk_rows': CHUNK_ROWS, 'columns': columns, 'meta': meta or {}}
+    if not frame.index.equals(pd.RangeIndex(len(frame))):
+        _save(directory, 'index', frame.index.to_numpy())
+        manifest['index'] = True
+    with open(os.path.join(directory, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def _read_columns(directory):
+    # (manifest, nome -> (dtype do frame, blocos)): arrays mapeados, texto em blocos EncodedText
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    columns = {}
+    for column in manifest['columns']:
+        name = column['name']
+        if column['kind'] == 'category':
+            values = _load(directory, name)
+            dtype = pd.CategoricalDtype(column['categories'], ordered=column['ordered'])
+        elif column['kind'] == 'text':
+            text, offsets = _load(directory, name + '.text'), _load(directory, name + '.offsets')
+            missing = split_chunks(_load(directory, name + '.missing'))
+            values = [EncodedText(text[offsets[k]:offsets[k + 1]], missing[k]) for k in range(len(missing))]
+            if manifest.get('chunk_rows') != CHUNK_ROWS:
+                # Gravado com outro tamanho de bloco: decodifica e divide de novo
+                values = np.concatenate([chunk.decode() for chunk in values] or [np.empty(0, dtype=object)])
+            dtype = np.dtype(object)
+        else:
+            values = _load(directory, name)
+            dtype = values.dtype
+        columns[name] = (dtype, values)
+    return manifest, columns
+
+
+def read_frame(directory):
+    """Abre um frame gravado por `write_frame`; retorna (frame, manifest).
+
+    Colunas numéricas, de data e os códigos das categorias ficam mapeados em memória
+    (somente leitura): vários processos lendo o mesmo diretório compartilham as mesmas
+    páginas. Só as colunas de texto são decodificadas para objetos Python.
+    """
+    manifest, columns = _read_columns(directory)
+    data = {}
+    for name, (dtype, values) in columns.items():
+        if isinstance(values, list):
+            values = np.concatenate([chunk.decode() for chunk in values] or [np.empty(0, dtype=object)])
+        if isinstance(dtype, pd.CategoricalDtype):
+            values = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+        data[name] = values
+    index = _load(directory, 'index') if manifest.get('index') else None
+    return pd.DataFrame(data, index=index, columns=list(columns), copy=False), manifest
+
+
+def _read_rows(directory, deals, clients):
+    # DealRows sobre as colunas mapeadas, sem decodificar o texto
+    manifest, columns = _read_columns(directory)
+    chunks, dtypes, storage = {}, {}, {}
+    for name, (dtype, values) in columns.items():
+        dtypes[name] = dtype
+        if isinstance(values, list):
+            storage[name], chunks[name] = np.dtype(object), values
+        else:
+            storage[name], chunks[name] = values.dtype, split_chunks(values)
+    return DealRows.from_chunks(chunks, dtypes, storage, manifest['rows'], deals=deals, clients=clients)
+
+
+def write_snapshot(snap, directory, meta=None):
+    """Grava `snap` inteiro em `directory`, para ser aberto com mmap por `read_snapshot`.
+
+    Só vale para um snapshot recém-montado (sem mudanças de webhook): os índices
+    por deal e por cliente são gravados já ordenados.
+    """
+    os.makedirs(directory, exist_ok=True)
+    write_frame(snap.processed(None), os.path.join(directory, 'deals'))
+    for name, index in (('deals', snap.rows.deals), ('clients', snap.rows.clients)):
+        _save(directory, f'{name}.keys', index.keys)
+        _save(directory, f'{name}.slots', index.slots)
+
+    stages = list(snap.latest.by_stage)
+    groups = [snap.latest.overall] + [snap.latest.by_stage[stage] for stage in stages]
+    _save(directory, 'latest.labels', np.concatenate([labels for labels, _ in groups]))
+    _save(directory, 'latest.ids', np.concatenate([ids for _, ids in groups]))
+    _save(directory, 'latest.offsets', np.cumsum([0] + [len(labels) for labels, _ in groups], dtype=np.int64))
+
+    for name, cube in snap.cubes.items():
+        write_frame(cube.table, os.path.join(directory, 'cubes', name))
+    for name in ('df_bar', 'stage_counts', 'df_stage_mapping'):
+        write_frame(getattr(snap, name), os.path.join(directory, name))
+    write_frame(snap.daily_counts.keys, os.path.join(directory, 'daily_counts'))
+    _save(directory, 'daily_counts.cumulative', snap.daily_counts.cumulative)
+
+    manifest = {
+        'fingerprint': snap.fingerprint,
+        'sizes': snap.sizes,
+        'latest_stages': stages,
+        'cubes': {name: cube.day_column for name, cube in snap.cubes.items()},
+        'daily_start': str(snap.daily_counts.start),
+        'meta': meta or {},
+    }
+    with open(os.path.join(directory, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def read_snapshot(directory, version=1, data_at=None):
+    """Snapshot gravado por `write_snapshot`, com os arrays mapeados em memória (somente leitura)."""
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    indexes = {name: KeyIndex(_load(directory, f'{name}.keys'), _load(directory, f'{name}.slots'))
+               for name in ('deals', 'clients')}
+    labels, ids, offsets = (_load(directory, f'latest.{name}') for name in ('labels', 'ids', 'offsets'))
+    groups = [(labels[start:end], ids[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
+    frames = {name: read_frame(os.path.join(directory, name))[0] for name in ('df_bar', 'stage_counts', 'df_stage_mapping')}
+
+    built_at = datetime.now()
+    return Snapshot(
+        version=version,
+        fingerprint=manifest['fingerprint'],
+        built_at=built_at,
+        data_at=data_at or built_at,
+        rows=_read_rows(os.path.join(directory, 'deals'), indexes['deals'], indexes['clients']),
+        df_bar=frames['df_bar'],
+        stage_counts=frames['stage_counts'],
+        df_stage_mapping=frames['df_stage_mapping'],
+        latest=LatestDealIndex(overall=groups[0], by_stage=dict(zip(manifest['latest_stages'], groups[1:]))),
+        cubes={name: DealCube(read_frame(os.path.join(directory, 'cubes', name))[0], day_column)
+               for name, day_column in manifest['cubes'].items()},
+        daily_counts=DailyCounts(read_frame(os.path.join(directory, 'daily_counts'))[0],
+                                 np.datetime64(manifest['daily_start'], 'D'),
+                                 _load(directory, 'daily_counts.cumulative')),
+        sizes=manifest['sizes'],
+    )
+
+
+class SharedSnapshotStore:
+    """Snapshot compartilhado por todos os processos (ex.: workers do gunicorn).
+
+    Um único processo por vez (trava de arquivo) busca os deals, monta o snapshot e
+    grava uma nova versão em `path/<versão>/`; o arquivo CURRENT aponta para a versão
+    pronta. Os demais só abrem essa versão com mmap, sem chamar a API, sem remontar os
+    agregados e sem cópia própria dos dados. Uma versão vale por `max_age` segundos
+    (0 = até ser apagada).
+    """
+
+    def __init__(self, path, loader, max_age=0):
+        self.path = path
+        self.loader = loader
+        self.max_age = max_age
+        self._loaded = None
+        self.loaded_at = None  # quando a versão carregada foi gravada
+        os.makedirs(path, exist_ok=True)
+
+    def current(self):
+        """(nome da versão atual, manifest) ou (None, None) se ainda não existe."""
+        try:
+            with open(os.path.join(self.path, CURRENT), encoding='utf-8') as f:
+                name = f.read().strip()
+            with open(os.path.join(self.path, name, MANIFEST), encoding='utf-8') as f:
+                return name, json.load(f)
+        except (OSError, ValueError):
+            return None, None
+
+    def is_stale(self, manifest):
+        if manifest is None:
+            return True
+        return self.max_age > 0 and time.time() - manifest['meta']['written_at'] >= self.max_age
+
+    @contextmanager
+    def _lock(self, blocking):
+        with open(os.path.join(self.path, LOCK), 'a') as f:
+            if fcntl is None:
+                yield True
+                return
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def publish(self, snapshot):
+        """Grava `snapshot` como nova versão e aponta CURRENT para ela (troca atômica)."""
+        written_at = time.time()
+        directory = tempfile.mkdtemp(dir=self.path, prefix='.tmp-')
+        write_snapshot(snapshot, directory, meta={'written_at': written_at})
+        name = datetime.fromtimestamp(written_at).strftime('%Y%m%dT%H%M%S%f')
+        os.rename(directory, os.path.join(self.path, name))
+
+        pointer = os.path.join(self.path, CURRENT + '.tmp')
+        with open(pointer, 'w', encoding='utf-8') as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(self.path, CURRENT))
+        self._cleanup(keep={name})
+        return name
+
+    def _cleanup(self, keep):
+        # Mantém a versão nova e a anterior; quem ainda tem uma versão apagada mapeada
+        # continua lendo normalmente até abrir a próxima
+        versions = sorted(entry for entry in os.listdir(self.path)
+                          if entry[0].isdigit() and os.path.isdir(os.path.join(self.path, entry)))
+        for entry in versions[:-2]:
+            if entry not in keep:
+                shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+
+    def refresh_if_stale(self):
+        """Se a versão atual está vencida, tenta ser o processo que a atualiza.
+
+        Sem nenhuma versão, espera a trava (outro processo pode estar gravando a
+        primeira); com uma versão vencida, quem não conseguir a trava segue com ela.
+        """
+        _, manifest = self.current()
+        if not self.is_stale(manifest):
+            return False
+        with self._lock(blocking=manifest is None) as acquired:
+            if not acquired:
+                return False
+            # Outro processo pode ter atualizado enquanto esperávamos a trava
+            _, manifest = self.current()
+            if not self.is_stale(manifest):
+                return False
+            started = time.perf_counter()
+            with metrics.phase('fetch_deals'):
+                loaded = self.loader()
+            snapshot = build_snapshot(loaded, 1)
+            del loaded
+            with metrics.phase('shared_snapshot_write'):
+                self.publish(snapshot)
+            print(f"Snapshot compartilhado gravado em {time.perf_counter() - started:.1f}s", flush=True)
+            return True
+
+    def load(self, refresh=True):
+        """Snapshot da versão atual (mapeado em memória), ou None se é a mesma já carregada.
+
+        Com `refresh=False` não busca dados novos: só abre a versão que já está no disco
+        (None se ainda não existe nenhuma).
+        """
+        if refresh:
+            self.refresh_if_stale()
+        name, manifest = self.current()
+        if name is None:
+            if not refresh:
+                return None
+            raise RuntimeError(f"Nenhum snapshot compartilhado em {self.path}")
+        if name == self._loaded:
+            return None
+        written_at = datetime.fromtimestamp(manifest['meta']['written_at'])
+        with metrics.phase('shared_snapshot_read'):
+            snapshot = read_snapshot(os.path.join(self.path, name), data_at=written_at)
+        self._loaded = name
+        self.loaded_at = written_at
+        return snapshot
@@ -0,0 +1,456 @@
+import dataclasses
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from cube import DealCube, alive_until
+from deal_rows import DealRows
+from deal_table import DealTable
+from indexes import LatestDealIndex
+from processing import (LINE_STAGE_DETAIL_MAPPING, bar_counts, bar_frame, process_bar_data, process_data,
+                        process_line_data, recode_stage_detail, stage_detail_key)
+from timeseries import DailyCounts
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Conjunto imutável de todos os frames derivados de uma mesma leva de deals.
+
+    Os deals ficam em `rows` (colunas em blocos); df, df_line, df_stage_counts, os
+    frames de `processed` e a tabela de deals são montados a partir deles na primeira
+    leitura e guardados, então um snapshot atualizado por eventos só paga por eles se
+    alguém os usar. Os agregados (cubos, contagens, `sizes`) já vêm prontos.
+    """
+    version: int
+    fingerprint: str
+    built_at: datetime
+    data_at: datetime  # quando os deals foram buscados (igual a built_at, exceto em snapshots vindos do disco)
+    rows: DealRows
+    df_bar: pd.DataFrame
+    stage_counts: pd.DataFrame
+    df_stage_mapping: pd.DataFrame
+    latest: LatestDealIndex
+    cubes: dict
+    daily_counts: DailyCounts
+    sizes: dict  # linhas de cada frame: 'all', 'open' (df), 'line' (df_line) e 'latest' (df_stage_counts)
+    _frames: dict = field(default_factory=dict, repr=False, compare=False)
+
+    def _frame(self, key, build):
+        # Duas threads podem montar o mesmo frame ao mesmo tempo; fica o primeiro guardado
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = self._frames.setdefault(key, build())
+        return frame
+
+    @property
+    def df(self):
+        return self._frame('Em andamento', lambda: open_rows(self.processed(None)))
+
+    @property
+    def df_line(self):
+        return self._frame('line', lambda: process_line_data(self.df))
+
+    @property
+    def df_stage_counts(self):
+        return self._frame('latest', lambda: self.latest.rows(self.df))
+
+    @property
+    def deal_table(self):
+        return self._frame('deal_table', lambda: DealTable(self.processed(None)))
+
+    def processed(self, filter_by_status='Em andamento'):
+        """Retorna o mesmo que `process_data(deals, filter_by_status)` sem reprocessar os deals.
+
+        Qualquer status não vazio filtra 'Em andamento' (como em process_data); o snapshot
+        não guarda os deals brutos. Os frames retornados são compartilhados: não devem ser
+        alterados in-place.
+        """
+        if filter_by_status:
+            return self.df
+        return self._frame(None, self.rows.frame)
+
+    def line_stages(self):
+        """Funis presentes no df_line (como `df_line['stage_name'].unique()`), lidos do cubo 'created'."""
+        return self.cubes['created'].table['stage_name'].unique().tolist()
+
+    def line_date_range(self):
+        """Primeiro e último dia de criação do df_line (NaT sem linhas), lidos do cubo 'created'."""
+        days = self.cubes['created'].days
+        if not len(days):
+            return pd.NaT, pd.NaT
+        return pd.Timestamp(days[0]), pd.Timestamp(days[-1])
+
+
+# Colunas que os gráficos leem; título e descrição não entram na impressão digital
+FINGERPRINT_COLUMNS = ['id', 'stage_name', 'stage_detail', 'stage_status', 'loss_reason',
+                       'date_created', 'date_won', 'date_lost']
+
+
+def fingerprint(df_all):
+    """Hash do conteúdo dos deals, igual em todos os processos que carregaram os mesmos dados.
+
+    Diferente de `version` (um contador local), serve de chave para caches compartilhados
+    entre workers.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for column in FINGERPRINT_COLUMNS:
+        values = df_all[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            digest.update(repr(list(values.cat.categories)).encode())
+            values = values.cat.codes
+        digest.update(column.encode())
+        digest.update(values.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def fingerprint_with_changes(previous, rows, deleted_ids=()):
+    """Impressão digital de um snapshot atualizado por eventos, sem reler o frame inteiro.
+
+    Encadeia a anterior com as linhas alteradas e os ids removidos: processos que
+    partiram do mesmo snapshot e aplicaram as mesmas mudanças chegam ao mesmo valor.
+    """
+    digest = hashlib.blake2b(previous.encode(), digest_size=16)
+    digest.update(rows['deal_id'].to_numpy(dtype=np.int64).tobytes())
+    digest.update(fingerprint(rows).encode())
+    digest.update(np.asarray(deleted_ids, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def open_rows(df_all):
+    return df_all[df_all['stage_status'] == 'Em andamento']
+
+
+def build_cubes(df_all, df, df_line, latest):
+    """Cubos diários que respondem a todos os gráficos por roll-up.
+
+    - 'created': linhas do gráfico de linha por dia de criação, com até quando cada deal
+      é o último do cliente (no geral e dentro do funil);
+    - 'won' / 'lost': todos os deals por dia de ganho / perda ('loss_reason' vazio = "Outro");
+    - 'latest' / 'latest_in_stage': último deal por cliente, sem dimensão de dia;
+    - 'created_by_status': todos os deals por dia de criação, funil, estágio (agrupado
+      como no gráfico de linha) e status, base das séries de `DailyCounts`.
+    """
+    loss_reason = df_all['loss_reason'].cat.add_categories(['Outro']).fillna('Outro')
+    closed_dims = ['stage_name', 'stage_detail', 'stage_status']
+    latest_in_stage = np.sort(np.concatenate([latest.labels(stage) for stage in latest.by_stage] or [[]]))
+
+    return {
+        'created': DealCube.from_frame(
+            df_line, ['stage_name', 'stage_detail'], day='date_created',
+            extra={'alive': alive_until(df_line), 'alive_in_stage': alive_until(df_line, by='stage_name')}
+        ),
+        'won': DealCube.from_frame(df_all, closed_dims, day='date_won', extra={'loss_reason': loss_reason}),
+        'lost': DealCube.from_frame(df_all, closed_dims, day='date_lost', extra={'loss_reason': loss_reason}),
+        'latest': DealCube.from_frame(latest.rows(df), ['stage_name', 'stage_detail']),
+        'latest_in_stage': DealCube.from_frame(df.iloc[df.index.searchsorted(latest_in_stage)],
+                                               ['stage_name', 'stage_detail']),
+        'created_by_status': DealCube.from_frame(
+            df_all, ['stage_name', 'stage_status'], day='date_created',
+            extra={'stage_detail': recode_stage_detail(df_all['stage_detail'], LINE_STAGE_DETAIL_MAPPING)}
+        ),
+    }
+
+
+def stage_counts_frame(cubes):
+    """Contagem de clientes por funil (último deal de cada um)."""
+    stage_counts = cubes['latest'].rollup('stage_name').sort_values(ascending=False).reset_index()
+    stage_counts.columns = ['Stage Name', 'Client Count']
+    return stage_counts
+
+
+def stage_mapping(df_line):
+    """Mapeamento funil -> estágio: a primeira linha de df_line de cada estágio, na ordem dos estágios.
+
+    O índice é o rótulo (slot) dessa linha, o que permite atualizá-lo com `_stage_mapping_with`.
+    """
+    # As categorias já seguem a ordem do estágio
+    df_stage_mapping = df_line[['stage_name', 'stage_detail']].drop_duplicates(subset=['stage_detail'])
+    return df_stage_mapping.sort_values(by='stage_detail', kind='stable')
+
+
+def build_snapshot(deals, version, data_at=None):
+    """Constrói todos os frames derivados fora do caminho das requisições.
+
+    `deals` é a lista de deals brutos ou as colunas de um ColumnBuilder; nenhum dos
+    dois fica referenciado no snapshot.
+    """
+    # Processa os deals uma única vez; o frame 'Em andamento' é um recorte do completo
+    with metrics.phase('process_data'):
+        df_all = process_data(deals, filter_by_status=False)
+    return snapshot_from_frame(df_all, version, data_at=data_at)
+
+
+@metrics.timed('derived_frames')
+def snapshot_from_frame(df_all, version, data_at=None):
+    """Snapshot a partir do frame já processado (sem filtro de status), ex.: um snapshot compartilhado."""
+    built_at = datetime.now()
+    if not df_all.index.equals(pd.RangeIndex(len(df_all))):
+        # Os rótulos são os slots do DealRows
+        df_all = df_all.reset_index(drop=True)
+    df = open_rows(df_all)
+    df_line = process_line_data(df)
+    df_bar = process_bar_data(df)
+
+    # Último deal de cada cliente (geral e por funil), reaproveitado pela tabela e pelo gráfico de barras
+    latest = LatestDealIndex(df)
+
+    cubes = build_cubes(df_all, df, df_line, latest)
+
+    return Snapshot(
+        version=version,
+        fingerprint=fingerprint(df_all),
+        built_at=built_at,
+        data_at=data_at or built_at,
+        rows=DealRows.from_frame(df_all),
+        df_bar=df_bar,
+        stage_counts=stage_counts_frame(cubes),
+        df_stage_mapping=stage_mapping(df_line),
+        latest=latest,
+        cubes=cubes,
+        daily_counts=DailyCounts.from_cube(cubes['created_by_status']),
+        sizes={'all': len(df_all), 'open': len(df), 'line': len(df_line), 'latest': len(latest)},
+        _frames={None: df_all, 'Em andamento': df, 'line': df_line},
+    )
+
+
+def _client_frames(deal_rows, slots):
+    # Recortes (todos, 'Em andamento' e df_line) com as linhas dos `slots`
+    rows = deal_rows.take(slots)
+    df = open_rows(rows)
+    return rows, df, process_line_data(df)
+
+
+def _bar_counts_with(df_bar, categories, removed, added):
+    # Contagem do gráfico de barras trocando a contribuição dos clientes afetados
+    def aligned(counts):
+        return counts.set_axis(counts.index.astype(object)).reindex(categories.categories, fill_value=0).to_numpy()
+    current = df_bar.set_index(df_bar['stage_detail'].astype(object))['count']
+    totals = aligned(current) - aligned(removed) + aligned(added)
+    index = pd.CategoricalIndex(pd.Categorical(categories.categories, dtype=categories), name='stage_detail')
+    return pd.Series(totals, index=index, name='count')
+
+
+def _first_line_rows(deal_rows, details):
+    # Primeira linha de df_line (slot, funil) de cada estágio em `details`, lendo os blocos em
+    # ordem até achar todos; a primeira ocorrência costuma estar nos blocos iniciais
+    found = {}
+    for k in range(deal_rows.chunk_count):
+        line = process_line_data(open_rows(deal_rows.block(k)))
+        line = line[line['stage_detail'].isin(details - found.keys())].drop_duplicates(subset=['stage_detail'])
+        found.update(zip(line['stage_detail'].astype(object), zip(line.index.tolist(), line['stage_name'].astype(object))))
+        if len(found) == len(details):
+            break
+    return found
+
+
+def _stage_mapping_with(mapping, removed, added, deal_rows):
+    # Mapeamento funil -> estágio trocando as linhas de df_line dos clientes afetados.
+    # Só quando a primeira linha de um estágio sai dele é preciso procurar a próxima
+    first = dict(zip(mapping['stage_detail'].astype(object),
+                     zip(mapping.index.tolist(), mapping['stage_name'].astype(object))))
+    now = dict(zip(added.index.tolist(), added['stage_detail'].astype(object)))
+    lost = {detail for slot, detail in zip(removed.index.tolist(), removed['stage_detail'].astype(object))
+            if first.get(detail, (None,))[0] == slot and now.get(slot) != detail}
+    for detail in lost:
+        del first[detail]
+    for slot, detail, stage in zip(added.index.tolist(), added['stage_detail'].astype(object),
+                                   added['stage_name'].astype(object)):
+        if detail not in lost and (detail not in first or slot <= first[detail][0]):
+            first[detail] = (slot, stage)
+    if lost:
+        first.update(_first_line_rows(deal_rows, lost))
+
+    details = sorted(first, key=stage_detail_key)
+    return pd.DataFrame({
+        'stage_name': pd.Categorical([first[detail][1] for detail in details], dtype=deal_rows.dtypes['stage_name']),
+        'stage_detail': pd.Categorical(details, categories=details, ordered=True),
+    }, index=pd.Index([first[detail][0] for detail in details], dtype=np.int64))
+
+
+@metrics.timed('apply_deal_changes')
+def apply_deal_changes(snap, rows, deleted_ids=(), version=None, data_at=None):
+    """Snapshot com os deals de `rows` inseridos ou substituídos e os de `deleted_ids` removidos.
+
+    `rows` é o frame processado (sem filtro de status) só dos deals alterados. Só as
+    linhas alteradas são tocadas: `DealRows` sobrescreve o slot de cada deal (os novos
+    vão para o fim) copiando apenas os blocos envolvidos, e cubos, último deal por
+    cliente, gráfico de barras, mapeamento de estágios e tamanhos trocam apenas a
+    contribuição dos clientes afetados (as linhas deles antes e depois da mudança).
+    df, df_line e a tabela de deals só são montados se forem lidos. `data_at`
+    continua o da última carga completa, a menos que seja informado.
+    """
+    deal_rows, touched, slots, clients = snap.rows.with_changes(rows, deleted_ids)
+    if not len(slots) and not len(touched):
+        return snap
+
+    before = _client_frames(snap.rows, np.union1d(snap.rows.client_slots(clients), touched))
+    after = _client_frames(deal_rows, np.union1d(deal_rows.client_slots(clients), slots))
+    latest_after = LatestDealIndex(after[1])
+    removed = build_cubes(*before, LatestDealIndex(before[1]))
+    added = build_cubes(*after, latest_after)
+    cubes = {name: cube.with_delta(added[name], removed[name]) for name, cube in snap.cubes.items()}
+
+    latest = snap.latest.with_changes(latest_after, clients)
+    df_bar = bar_frame(_bar_counts_with(snap.df_bar, deal_rows.dtypes['stage_detail'],
+                                        bar_counts(before[1]), bar_counts(after[1])))
+    sizes = {name: snap.sizes[name] + len(new) - len(old) for name, old, new in zip(('all', 'open', 'line'), before, after)}
+    sizes['latest'] = len(latest)
+
+    built_at = datetime.now()
+    return Snapshot(
+        version=version if version is not None else snap.version + 1,
+        fingerprint=fingerprint_with_changes(snap.fingerprint, rows, deleted_ids),
+        built_at=built_at,
+        data_at=data_at or snap.data_at,
+        rows=deal_rows,
+        df_bar=df_bar,
+        stage_counts=stage_counts_frame(cubes),
+        df_stage_mapping=_stage_mapping_with(snap.df_stage_mapping, before[2], after[2], deal_rows),
+        latest=latest,
+        cubes=cubes,
+        daily_counts=DailyCounts.from_cube(cubes['created_by_status']),
+        sizes=sizes,
+    )
+
+
+REFRESHES = metrics.counter('snapshot_refreshes_total', 'Atualizações do snapshot por resultado.', ['result'])
+
+
+class SnapshotRefresher:
+    """Mantém o snapshot atual e o reconstrói periodicamente numa thread em segundo plano.
+
+    A troca é uma única atribuição de referência: quem leu `current` continua com um
+    snapshot completo e consistente, e nenhuma leitura espera pela reconstrução.
+    Até a primeira carga terminar `current` é None (estado "loading").
+    Mudanças pontuais (ex.: eventos de webhook) entram por `apply` entre as reconstruções.
+    """
+
+    def __init__(self, loader, interval, build=build_snapshot, retry_interval=30):
+        # `build(dados, versão)` monta o snapshot a partir do que o loader retornou; o loader
+        # pode retornar None quando não há dados novos e o snapshot atual é mantido
+        self.loader = loader
+        self.build = build
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        # Serializa as trocas de snapshot entre `refresh` e `apply`
+        self._swap_lock = threading.Lock()
+        # Mudanças aplicadas durante a carga em andamento, reaplicadas sobre o snapshot que ela montar
+        self._pending = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshing = False
+        self.last_attempt_at = None
+        self.last_error = None
+
+    @property
+    def current(self):
+        return self._snapshot
+
+    @property
+    def state(self):
+        return 'ready' if self._snapshot is not None else 'loading'
+
+    def warm_start(self, factory):
+        """Usa o snapshot de `factory()` (ex.: lido do disco) enquanto a primeira atualização não termina."""
+        try:
+            snapshot = factory()
+        except Exception as e:
+            print(f"Erro ao carregar snapshot do disco: {e}", flush=True)
+            return None
+        if snapshot is not None and self._snapshot is None:
+            self._snapshot = snapshot
+            print(f"Snapshot v{snapshot.version} carregado do disco (dados de {snapshot.data_at:%d/%m/%Y %H:%M})", flush=True)
+        return snapshot
+
+    def apply(self, change):
+        """Troca o snapshot atual por `change(snapshot, versão)`, sem esperar uma reconstrução.
+
+        Sem snapshot carregado a mudança só fica guardada. Durante uma reconstrução ela
+        também é guardada e reaplicada sobre o snapshot novo antes da troca, já que os
+        dados carregados podem não incluí-la; `change` precisa ser idempotente.
+        """
+        with self._swap_lock:
+            if self.refreshing or self._snapshot is None:
+                self._pending.append(change)
+            if self._snapshot is None:
+                return None
+            self._snapshot = change(self._snapshot, self._snapshot.version + 1)
+            return self._snapshot
+
+    def _swap(self, snapshot):
+        # Reaplica as mudanças recebidas durante a carga e numera depois do snapshot atual
+        with self._swap_lock:
+            version = self._snapshot.version + 1 if self._snapshot else 1
+            if snapshot.version != version:
+                snapshot = dataclasses.replace(snapshot, version=version)
+            for change in self._pending:
+                snapshot = change(snapshot, snapshot.version)
+            self._pending = []
+            self._snapshot = snapshot
+            return snapshot
+
+    def refresh(self):
+        # Evita duas reconstruções simultâneas; a leitura do snapshot não usa o lock
+        with self._refresh_lock:
+            with self._swap_lock:
+                self.refreshing = True
+                # O que chegou antes desta carga já deve estar nos dados (exceto sem snapshot algum)
+                if self._snapshot is not None:
+                    self._pending = []
+            try:
+                started = time.perf_counter()
+                version = self._snapshot.version + 1 if self._snapshot else 1
+                with metrics.phase('snapshot_load'):
+                    loaded = self.loader()
+                if loaded is None and self._snapshot is not None:
+                    self.last_error = None
+                    REFRESHES.inc(result='unchanged')
+                    return self._snapshot
+                with metrics.phase('snapshot_build'):
+                    snapshot = self._swap(self.build(loaded, version))
+                self.last_error = None
+                REFRESHES.inc(result='ok')
+                print(f"Snapshot v{snapshot.version} pronto em {time.perf_counter() - started:.1f}s", flush=True)
+                return snapshot
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                REFRESHES.inc(result='error')
+                raise
+            finally:
+                with self._swap_lock:
+                    self.refreshing = False
+                self.last_attempt_at = datetime.now()
+
+    def _run(self):
+        # A primeira atualização roda logo ao iniciar; sem snapshot, uma falha é repetida
+        # após `retry_interval` em vez de esperar o intervalo inteiro
+        delay = 0
+        while not self._stop.wait(delay):
+            try:
+                self.refresh()
+            except Exception as e:
+                # Mantém o snapshot anterior se a atualização falhar
+                print(f"Erro ao atualizar snapshot: {e}", flush=True)
+            if self._snapshot is None:
+                delay = self.retry_interval
+            elif self.interval > 0:
+                delay = self.interval
+            else:
+                break
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='snapshot-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
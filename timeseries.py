@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+# Granularidades das séries: valor usado nos controles -> (frequência do pandas, rótulo)
+GRANULARITIES = {
+    'D': ('D', 'Diário'),
+    'W': ('W-SUN', 'Semanal'),
+    'M': ('M', 'Mensal'),
+}
+
+
+class DailyCounts:
+    """Contagens acumuladas por dia para cada combinação de dimensões (ex.: funil, estágio e status).
+
+    `cumulative[k, d]` é o número de deals da combinação k com data anterior ao dia
+    `start + d`: qualquer intervalo [início, fim] vira uma subtração, então uma série em
+    dias, semanas ou meses custa O(baldes) por combinação, sem olhar os deals.
+    """
+
+    def __init__(self, keys, start, cumulative):
+        self.keys = keys
+        self.start = start
+        self.cumulative = cumulative
+
+    @classmethod
+    def from_cube(cls, cube):
+        """Monta as somas a partir de um DealCube diário (colunas 'day', dimensões e 'count')."""
+        table = cube.table
+        dims = [column for column in table.columns if column not in ('day', 'count')]
+        days = table['day'].to_numpy(dtype='datetime64[D]')
+        if not len(table):
+            return cls(table[dims].iloc[:0], np.datetime64('today', 'D'), np.zeros((0, 1), dtype=np.int64))
+
+        groups = table.groupby(dims, observed=True, sort=True, dropna=False).ngroup().to_numpy()
+        keys = table[dims].iloc[np.unique(groups, return_index=True)[1]].reset_index(drop=True)
+        start = days.min()
+        offsets = (days - start).astype(np.int64)
+        daily = np.zeros((len(keys), offsets.max() + 1), dtype=np.int64)
+        np.add.at(daily, (groups, offsets), table['count'].to_numpy())
+        cumulative = np.zeros((len(keys), daily.shape[1] + 1), dtype=np.int64)
+        np.cumsum(daily, axis=1, out=cumulative[:, 1:])
+        return cls(keys, start, cumulative)
+
+    @property
+    def end(self):
+        """Último dia coberto."""
+        return self.start + (self.cumulative.shape[1] - 2)
+
+    def _offset(self, day):
+        # Posição em `cumulative` do início do dia (limitada ao intervalo coberto)
+        return np.clip((day.astype('datetime64[D]') - self.start).astype(np.int64), 0, self.cumulative.shape[1] - 1)
+
+    def series(self, start=None, end=None, granularity='D', where=None):
+        """Contagem por balde (dia, semana de segunda a domingo ou mês) dentro de [start, end].
+
+        `where` filtra por igualdade de dimensões. O índice é o primeiro dia de cada balde;
+        o primeiro e o último podem estar cortados pelo intervalo. Sem start/end vale o
+        período inteiro coberto pelos dados.
+        """
+        start = pd.Timestamp(start if start is not None else self.start).normalize()
+        end = pd.Timestamp(end if end is not None else self.end).normalize()
+        if end < start:
+            return pd.Series([], index=pd.DatetimeIndex([]), dtype=np.int64, name='count')
+
+        periods = pd.period_range(start, end, freq=GRANULARITIES[granularity][0])
+        labels = periods.start_time
+        lows = np.maximum(labels.to_numpy(dtype='datetime64[D]'), np.datetime64(start.date(), 'D'))
+        highs = np.minimum(periods.end_time.to_numpy(dtype='datetime64[D]'), np.datetime64(end.date(), 'D')) + 1
+
+        rows = np.ones(len(self.keys), dtype=bool)
+        for column, value in (where or {}).items():
+            rows &= (self.keys[column] == value).to_numpy()
+        rows = np.flatnonzero(rows)
+
+        def before(days):
+            # Acumulado até o início de cada dia, somado nas combinações escolhidas: lê só as bordas
+            return self.cumulative[np.ix_(rows, self._offset(days))].sum(axis=0)
+
+        return pd.Series(before(highs) - before(lows), index=labels, name='count')
@@ -0,0 +1,164 @@
+import json
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+import metrics
+from deal_store import parse_timestamp
+from processing import process_data
+from snapshot import apply_deal_changes
+
+EVENTS = metrics.counter('webhook_events_total', 'Eventos de webhook recebidos por ação e resultado.',
+                         ['action', 'result'])
+
+
+def parse_events(payload):
+    """Eventos do corpo do webhook: `{'event': 'deal_updated', 'data': {...}}` ou uma lista deles.
+
+    Retorna tuplas (ação, deal) com ação 'upsert', 'delete' ou 'ignore' (eventos que
+    não são de deals ou sem id).
+    """
+    items = payload if isinstance(payload, list) else [payload]
+    events = []
+    for item in items:
+        if not isinstance(item, dict):
+            events.append(('ignore', None))
+            continue
+        name = str(item.get('event') or '')
+        deal = item.get('data')
+        if not name.startswith('deal') or not isinstance(deal, dict) or deal.get('id') is None:
+            events.append(('ignore', deal))
+        elif name.endswith('_deleted'):
+            events.append(('delete', deal))
+        else:
+            events.append(('upsert', deal))
+    return events
+
+
+# Erros de `process_data` com um deal fora do formato da API (campo faltando ou de outro tipo)
+ROW_ERRORS = (KeyError, TypeError, ValueError, AttributeError, OverflowError)
+
+
+def _processed_rows(upserts):
+    """Linhas processadas dos deals e ids dos que não puderam ser processados.
+
+    O lote é processado de uma vez; só se falhar cada deal é testado sozinho, para
+    separar os inválidos e processar o restante.
+    """
+    try:
+        return process_data(upserts, filter_by_status=False), set()
+    except ROW_ERRORS:
+        pass
+    invalid = set()
+    for deal in upserts:
+        try:
+            process_data([deal], filter_by_status=False)
+        except ROW_ERRORS:
+            invalid.add(deal['id'])
+    valid = [deal for deal in upserts if deal['id'] not in invalid]
+    return process_data(valid, filter_by_status=False), invalid
+
+
+class WebhookIngest:
+    """Aplica eventos de deals criados, alterados e removidos ao snapshot, sem reconstruí-lo.
+
+    Os eventos são processados um lote por vez e em ordem de `updatedAt`; cada deal guarda
+    a última marca vista, então reenvios (mesma marca) e eventos atrasados (marca menor)
+    são descartados. O lote é reduzido ao estado final de cada deal, convertido nas linhas
+    processadas e aplicado com `apply_deal_changes`. Com `store` os deals também vão para
+    o DealStore, para que a próxima sincronização parta deles. Um deal que não pode ser
+    processado conta como 'invalid' e não é gravado, aplicado nem marcado como visto.
+    """
+
+    def __init__(self, refresher, store=None, record_path=None):
+        self.refresher = refresher
+        self.store = store
+        self.record_path = record_path
+        self._lock = threading.Lock()
+        # id do deal -> (updatedAt, removido)
+        self._versions = {}
+
+    def _record(self, payload):
+        # Grava o corpo recebido (um por linha) para reproduzir os eventos localmente
+        with open(self.record_path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(payload, ensure_ascii=False) + '\n')
+
+    def _accept(self, action, deal, received_at, staged):
+        # Resultado do evento frente à última marca vista do deal (no lote ou antes dele);
+        # updatedAt presente mas que não é uma data ISO (ex.: número) torna o evento inválido
+        stamp = deal.get('updatedAt')
+        if stamp is None:
+            if action != 'delete':
+                return 'applied', None
+            stamp = received_at
+        try:
+            when = parse_timestamp(stamp)
+        except (TypeError, ValueError):
+            return 'invalid', None
+        seen = staged.get(deal['id'], self._versions.get(deal['id']))
+        if seen is not None:
+            if when < seen[0]:
+                return 'stale', None
+            if when == seen[0] and seen[1] == (action == 'delete'):
+                return 'duplicate', None
+        return 'applied', (when, action == 'delete')
+
+    def handle(self, payload):
+        """Aplica o corpo de um webhook e retorna o resumo {resultado: quantidade}."""
+        events = parse_events(payload)
+        received_at = datetime.now(timezone.utc).isoformat()
+        summary = Counter()
+        with self._lock:
+            if self.record_path:
+                self._record(payload)
+
+            def order(event):
+                # Sem data válida o evento vai para o fim (e `_accept` decide o resultado)
+                stamp = event[1].get('updatedAt') if event[0] != 'ignore' else None
+                try:
+                    return parse_timestamp(stamp)
+                except (TypeError, ValueError):
+                    return datetime.max.replace(tzinfo=timezone.utc)
+
+            # Estado final de cada deal no lote (o último evento aceito vence); as marcas só
+            # são guardadas depois que o lote vira linhas, para um deal inválido não passar
+            # a contar como visto
+            final, staged, results = {}, {}, []
+            for action, deal in sorted(events, key=order):
+                if action == 'ignore':
+                    results.append((action, 'ignored', None))
+                    continue
+                result, version = self._accept(action, deal, received_at, staged)
+                if result == 'applied':
+                    final[deal['id']] = (action, deal)
+                    if version is not None:
+                        staged[deal['id']] = version
+                results.append((action, result, deal['id']))
+
+            invalid = set()
+            if final:
+                upserts = [deal for action, deal in final.values() if action == 'upsert']
+                rows, invalid = _processed_rows(upserts)
+                for deal_id in invalid:
+                    del final[deal_id]
+                    staged.pop(deal_id, None)
+
+            for action, result, deal_id in results:
+                if result == 'applied' and deal_id in invalid:
+                    result = 'invalid'
+                summary[result] += 1
+                EVENTS.inc(action=action, result=result)
+
+            if final:
+                upserts = [deal for action, deal in final.values() if action == 'upsert']
+                deleted = [deal_id for deal_id, (action, _) in final.items() if action == 'delete']
+                if self.store is not None:
+                    self.store.upsert(upserts)
+                    self.store.delete(deleted)
+                self._versions.update(staged)
+                snap = self.refresher.apply(
+                    lambda snap, version: apply_deal_changes(snap, rows, deleted, version=version)
+                )
+                if snap is not None:
+                    summary['version'] = snap.version
+        return dict(summary)